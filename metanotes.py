@@ -9,9 +9,51 @@ from datetime import datetime
 import ctypes
 import re
 import sys
+import hashlib
+import base64
+import zlib
+import difflib
+import sqlite3
+import threading
+import queue
+import fnmatch
+import itertools
+import bisect
+import heapq
+import stat
+import concurrent.futures
+import multiprocessing
+import socket
+import socketserver
+import argparse
+import html
+from xml.etree import ElementTree
+import time
+import secrets
+import hmac
+from collections import namedtuple, deque, OrderedDict
 
 META_FILENAME = ".metanotes.json"
 CONFIG_FILE = "metadata.json"
+DEFAULT_AUTO_SAVE_INTERVAL = 30  # seconds
+MAX_UNDO = 500  # Undo steps kept per tab; older ones live in the version history
+
+# Large notes are inserted into the editor in chunks across idle callbacks
+PROGRESSIVE_LOAD_SIZE = 256 * 1024  # characters
+LOAD_CHUNK_SIZE = 128 * 1024
+LOAD_FIRST_LINES = 300
+DEFAULT_PREVIEW_THRESHOLD_KB = 2048
+WORD_COUNT_DELAY_MS = 300
+
+# Storage formats of the notes file
+FORMAT_PLAIN = "plain"
+FORMAT_DEDUP = "dedup"
+BODIES_KEY = "_bodies"
+
+# Notes larger than the threshold are stored as separate blob files. Off by default
+# (0): notes files with blob entries show as raw dicts in versions without blobs
+BLOBS_DIRNAME = ".metanotes.blobs"
+DEFAULT_BLOB_THRESHOLD_KB = 0
 
 # --- Auto Scrollbar ---
 class AutoScrollbar(ttk.Scrollbar):
@@ -30,138 +72,3059 @@ class TextLineNumbers(tk.Canvas):
         self.text_widget = None
         self.font = "TkDefaultFont"
 
-    def attach(self, text_widget):
-        self.text_widget = text_widget
-        
-    def redraw(self, *args):
-        self.delete("all")
-        
-        if not self.text_widget:
-            return
-            
-        i = self.text_widget.index("@0,0")
-        while True:
-            dline = self.text_widget.dlineinfo(i)
-            if dline is None:
+    def attach(self, text_widget):
+        self.text_widget = text_widget
+        
+    def redraw(self, *args):
+        self.delete("all")
+        
+        if not self.text_widget:
+            return
+            
+        i = self.text_widget.index("@0,0")
+        while True:
+            dline = self.text_widget.dlineinfo(i)
+            if dline is None:
+                break
+            y = dline[1]
+            line_num = str(i).split(".")[0]
+            self.create_text(2, y, anchor="nw", text=line_num, fill="grey", font=self.font)
+            i = self.text_widget.index("%s+1line" % i)
+
+class CustomText(ttk.Frame):
+    def __init__(self, *args, **kwargs):
+        ttk.Frame.__init__(self, *args, **kwargs)
+        
+        # Text widget - wrap mode will be set by the application
+        self.text = tk.Text(
+            self, 
+            wrap='none',  # Default to no wrap, will be configured by app
+            undo=True, 
+            maxundo=MAX_UNDO,
+            font=("Consolas", 11),
+            selectbackground="#3d7aab",
+            inactiveselectbackground="#3d7aab"
+        )
+        
+        # Line numbers
+        self.line_numbers = TextLineNumbers(self, width=40)
+        self.line_numbers.attach(self.text)
+        
+        # Scrollbar
+        self.v_scrollbar = AutoScrollbar(self, orient="vertical", command=self.text.yview)
+        self.text.configure(yscrollcommand=self.on_yscroll)
+        self.scroll_callbacks = []
+        
+        # Horizontal scrollbar for when wrap is disabled
+        self.h_scrollbar = AutoScrollbar(self, orient="horizontal", command=self.text.xview)
+        self.text.configure(xscrollcommand=self.h_scrollbar.set)
+        
+        # Layout
+        self.line_numbers.grid(row=0, column=0, sticky="ns")
+        self.text.grid(row=0, column=1, sticky="nsew")
+        self.v_scrollbar.grid(row=0, column=2, sticky="ns")
+        self.h_scrollbar.grid(row=1, column=1, sticky="ew")
+        
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(1, weight=1)
+        
+        # Bind events
+        self.text.bind("<KeyRelease>", self.on_key_release)
+        self.text.bind("<Button-1>", self.on_key_release)
+        self.text.bind("<MouseWheel>", self.on_key_release)
+        
+    def on_key_release(self, event=None):
+        self.line_numbers.redraw()
+
+    def on_yscroll(self, lo, hi):
+        self.v_scrollbar.set(lo, hi)
+        for callback in self.scroll_callbacks:
+            callback()
+        
+    def get(self, *args, **kwargs):
+        return self.text.get(*args, **kwargs)
+        
+    def insert(self, *args, **kwargs):
+        result = self.text.insert(*args, **kwargs)
+        self.on_key_release()
+        return result
+        
+    def delete(self, *args, **kwargs):
+        result = self.text.delete(*args, **kwargs)
+        self.on_key_release()
+        return result
+        
+    def index(self, *args, **kwargs):
+        return self.text.index(*args, **kwargs)
+        
+    def bind(self, *args, **kwargs):
+        return self.text.bind(*args, **kwargs)
+        
+    def edit_undo(self, *args, **kwargs):
+        result = self.text.edit_undo(*args, **kwargs)
+        self.on_key_release()
+        return result
+        
+    def edit_redo(self, *args, **kwargs):
+        result = self.text.edit_redo(*args, **kwargs)
+        self.on_key_release()
+        return result
+        
+    def edit_modified(self, *args, **kwargs):
+        return self.text.edit_modified(*args, **kwargs)
+        
+    def edit_reset(self, *args, **kwargs):
+        return self.text.edit_reset(*args, **kwargs)
+        
+    def config(self, *args, **kwargs):
+        return self.text.config(*args, **kwargs)
+
+# --- Multi-column list ---
+class ColumnListbox(ttk.Frame):
+    """Listboxes side by side sharing rows, selection and scrolling, with clickable headings.
+
+    Plain listboxes are used rather than a Treeview because they accept a whole
+    listing in a single insert call, which keeps very large folders fast.
+    """
+    def __init__(self, master, columns, on_heading=None, on_scroll=None, **listbox_options):
+        ttk.Frame.__init__(self, master)
+        self.on_scroll = on_scroll
+        self.keys = [key for key, _, _, _ in columns]
+        self.titles = {key: title for key, title, _, _ in columns}
+        self.headings = {}
+        self.listboxes = {}
+
+        for col, (key, title, width, stretch) in enumerate(columns):
+            heading = ttk.Button(
+                self, text=title, bootstyle="secondary",
+                command=(lambda k=key: on_heading(k)) if on_heading else None
+            )
+            heading.grid(row=0, column=col, sticky="ew")
+            listbox = tk.Listbox(
+                self, width=width, exportselection=0, activestyle="none",
+                justify="left" if stretch or col == 0 else "right", **listbox_options
+            )
+            listbox.grid(row=1, column=col, sticky="nsew")
+            listbox.bind("<<ListboxSelect>>", lambda e, lb=listbox: self._sync_selection(lb))
+            listbox.bind("<MouseWheel>", self._on_mousewheel)
+            listbox.bind("<Button-4>", self._on_mousewheel)
+            listbox.bind("<Button-5>", self._on_mousewheel)
+            listbox.config(yscrollcommand=self._on_yscroll)
+            if stretch:
+                self.grid_columnconfigure(col, weight=1)
+            self.headings[key] = heading
+            self.listboxes[key] = listbox
+
+        self.main = self.listboxes[self.keys[0]]
+
+        self.v_scrollbar = AutoScrollbar(self, orient="vertical", command=self.yview)
+        self.v_scrollbar.grid(row=1, column=len(columns), sticky="ns")
+        self.h_scrollbar = AutoScrollbar(self, orient="horizontal", command=self.main.xview)
+        self.h_scrollbar.grid(row=2, column=0, sticky="ew")
+        self.main.config(xscrollcommand=self.h_scrollbar.set)
+        self.grid_rowconfigure(1, weight=1)
+
+    def yview(self, *args):
+        for listbox in self.listboxes.values():
+            listbox.yview(*args)
+
+    def _on_yscroll(self, lo, hi):
+        self.v_scrollbar.set(lo, hi)
+        for listbox in self.listboxes.values():
+            if listbox.yview()[0] != float(lo):
+                listbox.yview_moveto(lo)
+        if self.on_scroll:
+            self.on_scroll()
+
+    def _on_mousewheel(self, event):
+        if event.num == 4:
+            step = -1
+        elif event.num == 5:
+            step = 1
+        else:
+            step = -1 if event.delta > 0 else 1
+        self.yview("scroll", step * 3, "units")
+        return "break"
+
+    def _sync_selection(self, source):
+        selection = source.curselection()
+        for listbox in self.listboxes.values():
+            if listbox is not source:
+                listbox.selection_clear(0, 'end')
+                for index in selection:
+                    listbox.selection_set(index)
+
+    def set_rows(self, rows):
+        for col, listbox in enumerate(self.listboxes.values()):
+            listbox.delete(0, 'end')
+            if rows:
+                listbox.insert('end', *[row[col] for row in rows])
+
+    def append_rows(self, rows):
+        for col, listbox in enumerate(self.listboxes.values()):
+            listbox.insert('end', *[row[col] for row in rows])
+
+    def visible_range(self):
+        """Indices of the first and last rows currently on screen."""
+        return self.main.nearest(0), self.main.nearest(self.main.winfo_height())
+
+    def set_row(self, index, row):
+        selected = index in self.main.curselection()
+        for col, listbox in enumerate(self.listboxes.values()):
+            listbox.delete(index)
+            listbox.insert(index, row[col])
+            if selected:
+                listbox.selection_set(index)
+
+    def set_heading(self, key, text):
+        self.headings[key].config(text=text)
+
+    def curselection(self):
+        return self.main.curselection()
+
+    def bind(self, *args, **kwargs):
+        kwargs.setdefault("add", "+")
+        for listbox in self.listboxes.values():
+            listbox.bind(*args, **kwargs)
+
+# --- Utility functions ---
+def atomic_write(path, write):
+    """Call write(file) on a temporary file next to path, sync it, then move it over path.
+
+    The temporary file is removed if anything fails, so path is either left as
+    it was or fully replaced.
+    """
+    with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path), delete=False, encoding="utf-8") as tmp:
+        temp_name = tmp.name
+        try:
+            write(tmp)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except BaseException:
+            tmp.close()
+            os.remove(temp_name)
+            raise
+    try:
+        os.replace(temp_name, path)
+    except OSError:
+        os.remove(temp_name)
+        raise
+
+def atomic_write_json(path, data):
+    atomic_write(path, lambda f: json.dump(data, f, ensure_ascii=False, indent=2))
+
+def atomic_write_text(path, text):
+    atomic_write(path, lambda f: f.write(text))
+
+# --- Note storage ---
+def note_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def is_sidecar(name):
+    """Return True for the files and folders MetaNotes keeps next to the user's data."""
+    return name == META_FILENAME or name.startswith(".metanotes.")
+
+class BlobNote:
+    """Note body stored in its own file under BLOBS_DIRNAME, read on first access."""
+    __slots__ = ("folder", "digest", "size", "words", "_text")
+
+    def __init__(self, folder, digest, size=0, words=0, text=None):
+        self.folder = folder
+        self.digest = digest
+        self.size = size
+        self.words = words
+        self._text = text
+
+    @property
+    def path(self):
+        return os.path.join(self.folder, BLOBS_DIRNAME, self.digest + ".txt")
+
+    @property
+    def loaded(self):
+        return self._text is not None
+
+    def load(self):
+        if self._text is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._text = f.read()
+            except OSError:
+                self._text = ""
+        return self._text
+
+    def unload(self):
+        self._text = None
+
+    def to_json(self):
+        return {"blob": self.digest, "size": self.size, "words": self.words}
+
+def note_text(value):
+    """Return the text of a note value, loading it from its blob file if needed."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, BlobNote):
+        return value.load()
+    return ""
+
+def note_word_count(value):
+    """Count words of a note without loading externalized blobs."""
+    if isinstance(value, BlobNote):
+        return value.words
+    return len(note_text(value).split())
+
+def has_note(value):
+    """Return True if a note value holds some text, without loading blobs."""
+    if isinstance(value, BlobNote):
+        return value.size > 0
+    return isinstance(value, str) and bool(value)
+
+def store_blob(folder, text):
+    """Write text to the blob directory of folder unless an identical blob exists."""
+    digest = note_hash(text)
+    blob = BlobNote(folder, digest, len(text), len(text.split()), text)
+    if not os.path.exists(blob.path):
+        blobs_dir = os.path.join(folder, BLOBS_DIRNAME)
+        if not os.path.isdir(blobs_dir):
+            os.makedirs(blobs_dir, exist_ok=True)
+            set_hidden(blobs_dir, True)
+        with tempfile.NamedTemporaryFile("w", dir=blobs_dir, delete=False, encoding="utf-8") as tmp:
+            tmp.write(text)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+            temp_name = tmp.name
+        os.replace(temp_name, blob.path)
+    return blob
+
+def prune_blobs(folder, notes):
+    """Delete blob files of folder that are no longer referenced by any note."""
+    blobs_dir = os.path.join(folder, BLOBS_DIRNAME)
+    if not os.path.isdir(blobs_dir):
+        return
+    used = {value.digest + ".txt" for value in notes.values() if isinstance(value, BlobNote)}
+    for entry in os.listdir(blobs_dir):
+        if entry not in used:
+            try:
+                os.remove(os.path.join(blobs_dir, entry))
+            except OSError:
+                pass
+
+def decode_notes(data, folder=None):
+    """Convert the JSON content of a notes file into a name -> text dictionary.
+
+    Both the plain format and the deduplicated format (bodies stored once in
+    BODIES_KEY and referenced by hash) are accepted. Note bodies are interned
+    so identical texts share a single string in memory. Externalized notes
+    become BlobNote objects whose text is only read when needed.
+    """
+    bodies = data.get(BODIES_KEY)
+    if not isinstance(bodies, dict):
+        bodies = {}
+    notes = {}
+    for name, value in data.items():
+        if name == BODIES_KEY and value is bodies:
+            continue
+        if name == "_meta":
+            notes[name] = value
+            continue
+        if isinstance(value, dict) and "ref" in value:
+            value = bodies.get(value["ref"], "")
+        elif isinstance(value, dict) and "blob" in value:
+            value = BlobNote(folder, value["blob"], value.get("size", 0), value.get("words", 0))
+        if isinstance(value, str):
+            value = sys.intern(value)
+        notes[sys.intern(name)] = value
+    return notes
+
+def encode_notes(notes, fmt=FORMAT_PLAIN):
+    """Build the JSON content of a notes file from a name -> text dictionary."""
+    meta = dict(notes.get("_meta", {}))
+    if fmt == FORMAT_DEDUP:
+        meta["format"] = FORMAT_DEDUP
+    else:
+        meta.pop("format", None)
+
+    data = {"_meta": meta}
+    if fmt != FORMAT_DEDUP:
+        for name, content in notes.items():
+            if name != "_meta":
+                data[name] = content.to_json() if isinstance(content, BlobNote) else content
+        return data
+
+    # Only bodies shared by several notes are moved to the bodies table
+    counts = {}
+    for name, content in notes.items():
+        if name != "_meta" and isinstance(content, str) and content:
+            counts[content] = counts.get(content, 0) + 1
+    bodies = {}
+    hashes = {}
+    for name, content in notes.items():
+        if name == "_meta":
+            continue
+        if isinstance(content, str) and counts.get(content, 0) > 1:
+            digest = hashes.get(content)
+            if digest is None:
+                digest = hashes[content] = note_hash(content)
+                bodies[digest] = content
+            data[name] = {"ref": digest}
+        elif isinstance(content, BlobNote):
+            data[name] = content.to_json()
+        else:
+            data[name] = content
+    if bodies:
+        data[BODIES_KEY] = bodies
+    return data
+
+def read_notes_file(folder):
+    """Read and decode the notes file of a folder, or return None if it does not exist."""
+    meta_path = os.path.join(folder, META_FILENAME)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return decode_notes(json.load(f), folder)
+
+def utf8_size_at_least(text, size):
+    """True if text takes at least size bytes in UTF-8, encoding it only when the length leaves a doubt."""
+    if len(text) >= size:
+        return True
+    if len(text) * 4 < size:
+        return False
+    return len(text.encode("utf-8", "surrogatepass")) >= size
+
+def write_notes_file(folder, notes, fmt=FORMAT_PLAIN, blob_threshold=None):
+    """Write the notes of a folder, externalizing bodies of blob_threshold bytes (UTF-8) or more.
+
+    Large string bodies are replaced in notes by their BlobNote, so later saves
+    of an unchanged note neither hash nor rewrite it.
+    """
+    if blob_threshold:
+        for name, content in list(notes.items()):
+            if name != "_meta" and isinstance(content, str) and utf8_size_at_least(content, blob_threshold):
+                notes[name] = store_blob(folder, content)
+    meta_path = os.path.join(folder, META_FILENAME)
+    atomic_write_json(meta_path, encode_notes(notes, fmt))
+    set_hidden(meta_path, True)
+    prune_blobs(folder, notes)
+
+def set_hidden(filepath, hidden=True):
+    if os.name != 'nt':
+        base = os.path.basename(filepath)
+        dir_name = os.path.dirname(filepath)
+        if hidden and not base.startswith('.'):
+            os.rename(filepath, os.path.join(dir_name, '.' + base))
+        elif not hidden and base.startswith('.'):
+            os.rename(filepath, os.path.join(dir_name, base[1:]))
+    else:
+        FILE_ATTRIBUTE_HIDDEN = 0x02
+        attrs = ctypes.windll.kernel32.GetFileAttributesW(str(filepath))
+        if hidden:
+            ctypes.windll.kernel32.SetFileAttributesW(str(filepath), attrs | FILE_ATTRIBUTE_HIDDEN)
+        else:
+            ctypes.windll.kernel32.SetFileAttributesW(str(filepath), attrs & ~FILE_ATTRIBUTE_HIDDEN)
+
+def get_app_folder():
+    # If we're in a PyInstaller bundle
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    else:
+        return os.path.dirname(os.path.abspath(__file__))
+
+# --- Search matching ---
+MAX_MATCH_SPANS = 5000  # Match offsets kept per note
+MATCH_TAG = "search_match"
+HIGHLIGHT_MARGIN = 2000  # Characters tagged around the visible region
+
+SearchHit = namedtuple("SearchHit", "label folder name spans")
+
+def compile_search(query, match_case=False, whole_word=False, use_regex=False):
+    """Compile the search options into a regular expression."""
+    flags = 0 if match_case else re.IGNORECASE
+    if use_regex:
+        try:
+            return re.compile(query, flags)
+        except re.error:
+            # Invalid regex: fallback on a simple substring search
+            pass
+    elif whole_word:
+        return re.compile(r'\b{}\b'.format(re.escape(query)), flags)
+    return re.compile(re.escape(query), flags)
+
+def make_matcher(query, match_case=False, whole_word=False, use_regex=False):
+    """Return a function telling whether a note text matches the search options."""
+    pattern = compile_search(query, match_case, whole_word, use_regex)
+    return lambda text: pattern.search(text) is not None
+
+def find_spans(pattern, text, limit=MAX_MATCH_SPANS):
+    """Return the (start, end) character offsets of the non-empty matches of pattern in text."""
+    spans = []
+    for match in pattern.finditer(text):
+        if match.end() > match.start():
+            spans.append(match.span())
+            if len(spans) >= limit:
+                break
+    return spans
+
+def make_snippet(text, spans, before=30, width=90):
+    """One-line excerpt of text around the first match."""
+    start = spans[0][0] if spans else 0
+    lo = max(0, start - before)
+    snippet = " ".join(text[lo:lo + width].split())
+    return ("…" if lo > 0 else "") + snippet + ("…" if lo + width < len(text) else "")
+
+# --- Fields and tags ---
+# Kept in _meta so notes stay plain strings for older versions of MetaNotes
+FIELDS_KEY = "fields"
+TAGS_KEY = "tags"
+TAG_FACET = "tag"
+FIELD_LINE_RE = re.compile(r"\s*([\w.-]+)\s*[:=]\s*(.*?)\s*$")
+
+def parse_field_value(text):
+    """Typed value of a field typed by the user: bool, int, float or string."""
+    lowered = text.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+def format_field_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+def parse_fields_text(text):
+    """Parse `key: value` lines into a fields dictionary. Raises ValueError on a malformed line."""
+    fields = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        match = FIELD_LINE_RE.fullmatch(line)
+        if not match:
+            raise ValueError(f"Expected 'key: value', got '{line.strip()}'")
+        fields[match.group(1)] = parse_field_value(match.group(2))
+    return fields
+
+def parse_tags(text):
+    tags = []
+    for tag in re.split(r"[,\s]+", text):
+        tag = tag.strip().lstrip("#")
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+def note_fields(notes, name):
+    return notes.get("_meta", {}).get(FIELDS_KEY, {}).get(name, {})
+
+def note_tags(notes, name):
+    return notes.get("_meta", {}).get(TAGS_KEY, {}).get(name, [])
+
+def set_note_fields(notes, name, fields, tags):
+    """Store the fields and tags of a note in _meta, dropping empty entries."""
+    meta = notes.setdefault("_meta", {})
+    for key, value in ((FIELDS_KEY, fields), (TAGS_KEY, tags)):
+        table = meta.setdefault(key, {})
+        if value:
+            table[name] = value
+        else:
+            table.pop(name, None)
+        if not table:
+            del meta[key]
+
+class FacetIndex:
+    """Secondary index of (field, value) pairs and tags to note names.
+
+    Lookups ignore case; the spelling seen first is the one displayed.
+    """
+    def __init__(self):
+        self.postings = {}  # (field, value) lowercased -> set of names
+        self.labels = {}  # (field, value) lowercased -> (field, value) as displayed
+        self.keys_by_name = {}
+        self.entries = 0  # (key, name) pairs, kept for the memory estimate
+
+    @classmethod
+    def build(cls, notes):
+        index = cls()
+        meta = notes.get("_meta", {})
+        for name in set(meta.get(FIELDS_KEY, {})) | set(meta.get(TAGS_KEY, {})):
+            index.update(name, note_fields(notes, name), note_tags(notes, name))
+        return index
+
+    @staticmethod
+    def key(field, value):
+        return field.lower(), format_field_value(value).lower()
+
+    def update(self, name, fields, tags):
+        self.remove(name)
+        pairs = list(fields.items()) + [(TAG_FACET, tag) for tag in tags]
+        keys = []
+        for field, value in pairs:
+            key = self.key(field, value)
+            self.labels.setdefault(key, (field, format_field_value(value)))
+            self.postings.setdefault(key, set()).add(name)
+            keys.append(key)
+        if keys:
+            self.keys_by_name[name] = keys
+            self.entries += len(keys)
+
+    def remove(self, name):
+        keys = self.keys_by_name.pop(name, ())
+        self.entries -= len(keys)
+        for key in keys:
+            names = self.postings.get(key)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self.postings[key]
+                    del self.labels[key]
+
+    def names(self, field, value=None):
+        """Names having field set to value, or set to anything when value is None."""
+        if value is not None:
+            return set(self.postings.get(self.key(field, value), ()))
+        field = field.lower()
+        result = set()
+        for (key_field, _), names in self.postings.items():
+            if key_field == field:
+                result |= names
+        return result
+
+    def facets(self):
+        """(field, value, count) of every indexed value, most used first within a field."""
+        counts = [(*self.labels[key], len(names)) for key, names in self.postings.items()]
+        return sorted(counts, key=lambda facet: (facet[0].lower(), -facet[2], facet[1].lower()))
+
+# --- Query language ---
+EntryInfo = namedtuple("EntryInfo", "name is_dir size mtime")
+
+def scan_entries(folder):
+    """List folder with a single scandir pass, returning name -> EntryInfo."""
+    entries = {}
+    with os.scandir(folder) as it:
+        for entry in it:
+            if is_sidecar(entry.name):
+                continue
+            name = sys.intern(entry.name)  # Shared with the notes keys and the tabs
+            try:
+                is_dir = entry.is_dir()
+                st = entry.stat()
+                entries[name] = EntryInfo(name, is_dir, 0 if is_dir else st.st_size, st.st_mtime)
+            except OSError:
+                entries[name] = EntryInfo(name, False, 0, 0)
+    return entries
+
+SEARCH_PAGE_SIZE = 200
+
+QueryTerm = namedtuple("QueryTerm", "field op value negate")
+
+QUERY_FIELDS = ("name", "has", "text", "size", "modified", "tag", "field")
+FIELD_TERM_RE = re.compile(r"([\w.-]+)(?:(>=|<=|>|<|=)(.*))?")
+QUERY_TOKEN_RE = re.compile(r'(-?)(?:(\w+):)?(?:"([^"]*)"|(\S+))')
+QUERY_FIELD_RE = re.compile(r'(?:^|\s)-?(?:%s):' % "|".join(QUERY_FIELDS))
+SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "kb": 1024, "m": 1024 ** 2, "mb": 1024 ** 2,
+              "g": 1024 ** 3, "gb": 1024 ** 3, "t": 1024 ** 4, "tb": 1024 ** 4}
+
+def is_structured_query(text):
+    return QUERY_FIELD_RE.search(text) is not None
+
+def _split_comparison(value):
+    for op in (">=", "<=", ">", "<", "="):
+        if value.startswith(op):
+            return op, value[len(op):]
+    return "=", value
+
+def parse_query(text):
+    """Parse a query such as `name:*.fbx has:note text:"license" size:>10MB modified:<2025-01-01`.
+
+    `tag:hero` matches a tag, `field:license=CC-BY` a field value, `field:year>=2020`
+    compares a field and `field:author` matches notes having the field. Bare words and quoted strings search the note text. A leading '-' negates a term.
+    Raises ValueError for malformed values.
+    """
+    terms = []
+    for negate, field, quoted, bare in QUERY_TOKEN_RE.findall(text):
+        value = quoted if quoted or not bare else bare
+        field = (field or "text").lower()
+        if field not in QUERY_FIELDS:
+            # Not a field (e.g. a URL): search the token as text
+            value = f"{field}:{value}"
+            field = "text"
+        op = "="
+        if field == "size":
+            op, raw = _split_comparison(value.lower())
+            match = re.fullmatch(r"([\d.]+)\s*([a-z]*)", raw)
+            if not match or match.group(2) not in SIZE_UNITS:
+                raise ValueError(f"Invalid size '{value}'")
+            value = float(match.group(1)) * SIZE_UNITS[match.group(2)]
+        elif field == "modified":
+            op, raw = _split_comparison(value)
+            try:
+                value = datetime.fromisoformat(raw).timestamp()
+            except ValueError:
+                raise ValueError(f"Invalid date '{raw}'")
+        elif field == "has" and value.lower() not in ("note", "notes"):
+            raise ValueError(f"Unknown has:{value} (expected has:note)")
+        elif field == "field":
+            match = FIELD_TERM_RE.fullmatch(value)
+            if not match:
+                raise ValueError(f"Invalid field:{value} (expected field:key=value)")
+            op = match.group(2) or "has"
+            value = (match.group(1), match.group(3) if op == "=" else parse_field_value(match.group(3) or ""))
+        terms.append(QueryTerm(field, op, value, bool(negate)))
+    return terms
+
+def _compare(actual, op, expected):
+    if op == ">":
+        return actual > expected
+    if op == ">=":
+        return actual >= expected
+    if op == "<":
+        return actual < expected
+    if op == "<=":
+        return actual <= expected
+    return actual == expected
+
+class TextIndex:
+    """Inverted index of lowercase word tokens to note names, used to narrow text searches.
+
+    A token of the query that is a whole word is looked up directly. A token
+    cut by the start or end of the query may be part of a longer word; those
+    are found with str.find over the vocabulary joined in one string, rebuilt
+    lazily after words are added or removed.
+    """
+    TOKEN_RE = re.compile(r"\w+")
+
+    def __init__(self):
+        self.postings = {}
+        self.tokens_by_name = {}
+        self.vocabulary = None  # ("\nword\nword...\n", words, start offsets), None when stale
+        self.entries = 0  # (token, name) pairs, kept for the memory estimate
+
+    @classmethod
+    def build(cls, notes):
+        index = cls()
+        for name, value in notes.items():
+            if name != "_meta":
+                index.update(name, note_text(value))
+        return index
+
+    def update(self, name, text):
+        self.remove(name)
+        tokens = frozenset(self.TOKEN_RE.findall(text.lower()))
+        self.tokens_by_name[name] = tokens
+        self.entries += len(tokens)
+        for token in tokens:
+            names = self.postings.get(token)
+            if names is None:
+                names = self.postings[token] = set()
+                self.vocabulary = None
+            names.add(name)
+
+    def remove(self, name):
+        tokens = self.tokens_by_name.pop(name, ())
+        self.entries -= len(tokens)
+        for token in tokens:
+            names = self.postings.get(token)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self.postings[token]
+                    self.vocabulary = None
+
+    def words(self, token, start=False, end=False):
+        """Words of the vocabulary containing token; only those starting or ending with it if asked."""
+        if self.vocabulary is None:
+            words = list(self.postings)
+            offsets = list(itertools.accumulate((len(word) + 1 for word in words[:-1]), initial=1))
+            self.vocabulary = ("\n" + "\n".join(words) + "\n", words, offsets)
+        text, words, offsets = self.vocabulary
+        needle = ("\n" if start else "") + token + ("\n" if end else "")
+        found = []
+        pos = text.find(needle)
+        while pos >= 0:
+            i = bisect.bisect_right(offsets, pos + start) - 1
+            found.append(words[i])
+            # Next word: one hit per word is enough
+            pos = text.find(needle, offsets[i] + len(words[i]))
+        return found
+
+    def candidates(self, needle, whole_word=False):
+        """Return a superset of the note names containing needle (case-insensitive).
+
+        Tokens inside the needle must be whole words of the note; the first one
+        may end a longer word and the last one may start one, unless whole_word.
+        """
+        needle = needle.lower()
+        result = None
+        for match in self.TOKEN_RE.finditer(needle):
+            token = match.group()
+            open_start = match.start() == 0 and not whole_word
+            open_end = match.end() == len(needle) and not whole_word
+            if not open_start and not open_end:
+                names = self.postings.get(token, set())
+            else:
+                names = set()
+                for word in self.words(token, start=not open_start, end=not open_end):
+                    names |= self.postings[word]
+            result = set(names) if result is None else result & names
+            if not result:
+                return set()
+        # A needle without word characters cannot be narrowed
+        return result if result is not None else set(self.tokens_by_name)
+
+def _term_cost(term):
+    """Relative cost of checking a term: key set < names < cached stats < note text."""
+    if term.field == "field" and term.op not in ("=", "has"):
+        return 2
+    return {"has": 1, "tag": 1, "field": 1, "name": 2, "size": 3, "modified": 3, "text": 10}[term.field]
+
+def plan_query(terms):
+    """Order terms from the cheapest to the most expensive check."""
+    return sorted(terms, key=_term_cost)
+
+def execute_query(terms, notes, entries, text_index=None, match_case=False, whole_word=False, use_regex=False,
+                  facet_index=None):
+    """Yield the names matching every term, in name order.
+
+    The candidate set comes from the cheapest positive term able to produce one:
+    the non-empty note keys for has:note, the facet index for a tag or field
+    value, or the text index for a text term.
+    Otherwise every listed entry and note is a candidate. Remaining terms are then
+    checked from the cheapest to the most expensive.
+    """
+    plan = plan_query(terms)
+    candidates = None
+    for term in plan:
+        if term.negate:
+            continue
+        if term.field == "has":
+            candidates = {name for name, value in notes.items() if name != "_meta" and has_note(value)}
+            plan.remove(term)
+            break
+        if facet_index is not None and term.field == "tag":
+            candidates = facet_index.names(TAG_FACET, term.value)
+            break
+        if facet_index is not None and term.field == "field" and term.op in ("=", "has"):
+            key, value = term.value
+            candidates = facet_index.names(key, value if term.op == "=" else None)
+            break
+        if term.field == "text" and text_index is not None and not use_regex:
+            candidates = text_index.candidates(term.value, whole_word)
+            break
+    if candidates is None:
+        candidates = set(entries) | {name for name in notes if name != "_meta"}
+
+    matchers = {}
+    for term in plan:
+        if term.field == "text":
+            matchers[term] = make_matcher(term.value, match_case, whole_word, use_regex)
+
+    def check(term, name):
+        if term.field == "has":
+            return name in notes and has_note(notes[name])
+        if term.field == "name":
+            pattern = term.value.lower()
+            if any(ch in pattern for ch in "*?["):
+                return fnmatch.fnmatchcase(name.lower(), pattern)
+            return pattern in name.lower()
+        if term.field == "text":
+            value = notes.get(name)
+            return value is not None and matchers[term](note_text(value))
+        if term.field == "tag":
+            return any(tag.lower() == term.value.lower() for tag in note_tags(notes, name))
+        if term.field == "field":
+            key, expected = term.value
+            actual = next((value for field, value in note_fields(notes, name).items()
+                           if field.lower() == key.lower()), None)
+            if actual is None:
+                return False
+            if term.op == "has":
+                return True
+            if term.op == "=":
+                return format_field_value(actual).lower() == expected.lower()
+            try:
+                return _compare(actual, term.op, expected)
+            except TypeError:
+                return False  # e.g. a text field compared to a number
+        info = entries.get(name)
+        if info is None:
+            return False
+        if term.field == "size":
+            return not info.is_dir and _compare(info.size, term.op, term.value)
+        if term.op == "=":
+            # A bare date matches the whole day
+            return term.value <= info.mtime < term.value + 86400
+        return _compare(info.mtime, term.op, term.value)
+
+    for name in sorted(candidates):
+        if all(check(term, name) != term.negate for term in plan):
+            yield name
+
+# --- Explorer ---
+EXPLORER_GROUPS = ["No grouping", "Folders first", "Unannotated first", "Annotated first"]
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+# --- Fuzzy filter ---
+FUZZY_BOUNDARY_CHARS = " _-./\\()[]"
+FILTER_DISPLAY_LIMIT = 1000
+FILTER_CHUNK_SIZE = 2000  # Names scored between two checks of the frame budget
+FILTER_FRAME_SECONDS = 0.012  # Time the filter may hold the Tk thread at once
+
+def fuzzy_score(pattern, candidate):
+    """Score pattern as a subsequence of candidate (both lowercase), or None if it does not match.
+
+    Like fzf, the shortest window ending at the first full match is scored: matched
+    characters earn points, with bonuses for consecutive runs and for characters at
+    the start of a word, and gaps inside the window cost a point each.
+    """
+    # Forward pass: find where the first full match ends (C-level find per character)
+    pos = -1
+    for ch in pattern:
+        pos = candidate.find(ch, pos + 1)
+        if pos < 0:
+            return None
+    # Backward pass: tighten the window to the latest possible start
+    positions = [pos]
+    for ch in reversed(pattern[:-1]):
+        pos = candidate.rfind(ch, 0, pos)
+        positions.append(pos)
+    positions.reverse()
+
+    start = positions[0]
+    score = 16 * len(pattern) - (positions[-1] - start + 1 - len(pattern))
+    if start == 0:
+        score += 8
+    consecutive = 0
+    prev = -2
+    for pos in positions:
+        if pos == 0 or candidate[pos - 1] in FUZZY_BOUNDARY_CHARS:
+            score += 10
+        if pos == prev + 1:
+            consecutive += 1
+            score += 6 * consecutive
+        else:
+            consecutive = 0
+        prev = pos
+    return score
+
+class FuzzyFilter:
+    """Ranked fuzzy matching over a precomputed array of lowercase names.
+
+    Scoring is done in chunks so the caller can spread a large folder across
+    idle callbacks instead of holding the Tk thread for the whole pass.
+    """
+    def __init__(self, names):
+        self.names = list(names)
+        self.keys = [name.lower() for name in self.names]
+        self.last_query = ""
+        self.last_matches = None
+
+    def ranked(self, query, chunk=FILTER_CHUNK_SIZE):
+        """Generator yielding None after each chunk of chunk names, then the indices best first."""
+        query = query.lower()
+        if not query:
+            self.last_query, self.last_matches = "", None
+            yield list(range(len(self.keys)))
+            return
+        # A longer query can only match a subset of what the shorter one matched
+        if self.last_matches is not None and query.startswith(self.last_query):
+            pool = self.last_matches
+        else:
+            pool = range(len(self.keys))
+        keys = self.keys
+        matches, scored = [], []
+        for start in range(0, len(pool), chunk):
+            if start:
+                yield None
+            for i in pool[start:start + chunk]:
+                score = fuzzy_score(query, keys[i])
+                if score is not None:
+                    matches.append(i)
+                    # One int per match sorts much faster than tuples: (-score, length, index)
+                    scored.append((-score << 64) | (len(keys[i]) << 32) | i)
+        if len(scored) > chunk:
+            yield None
+        scored.sort()
+        self.last_query, self.last_matches = query, matches
+        yield [key & 0xFFFFFFFF for key in scored]
+
+    def filter(self, query):
+        """Return the indices of matching names, best matches first."""
+        for result in self.ranked(query, chunk=max(len(self.keys), 1)):
+            pass
+        return result
+
+# --- Background work ---
+_WALK_DONE = object()
+
+def default_workers():
+    # Directory scans are I/O bound, so use more threads than cores
+    return min(32, (os.cpu_count() or 1) * 4)
+
+def walk_tree_parallel(root, handler, workers=None, cancel=None):
+    """Walk root with a pool of scandir workers and yield handler(folder, entries) per folder.
+
+    Folders are visited depth-first so the frontier of pending folders stays small,
+    and results go through a bounded queue so a slow consumer throttles the workers.
+    Handlers run in the worker threads; None results are dropped. MetaNotes sidecar
+    folders are not descended into.
+    """
+    workers = workers or default_workers()
+    pending = queue.LifoQueue()
+    results = queue.Queue(maxsize=workers * 4)
+    stop = threading.Event()
+    lock = threading.Lock()
+    outstanding = [1]
+
+    def emit(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def worker():
+        while True:
+            folder = pending.get()
+            if folder is None:
+                return
+            try:
+                if not stop.is_set() and not (cancel and cancel.is_set()):
+                    try:
+                        with os.scandir(folder) as it:
+                            entries = list(it)
+                    except OSError:
+                        entries = None
+                    if entries is not None:
+                        for entry in entries:
+                            try:
+                                is_dir = entry.is_dir(follow_symlinks=False)
+                            except OSError:
+                                is_dir = False
+                            if is_dir and not is_sidecar(entry.name):
+                                with lock:
+                                    outstanding[0] += 1
+                                pending.put(entry.path)
+                        try:
+                            result = handler(folder, entries)
+                        except Exception as e:
+                            print(f"Scan error in {folder}: {e}")
+                            result = None
+                        if result is not None:
+                            emit(result)
+            finally:
+                with lock:
+                    outstanding[0] -= 1
+                    done = outstanding[0] == 0
+                if done:
+                    emit(_WALK_DONE)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    pending.put(root)
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = results.get()
+            if item is _WALK_DONE:
+                break
+            yield item
+    finally:
+        stop.set()
+        for _ in threads:
+            pending.put(None)
+
+class BackgroundTask:
+    """Run target(task) in a worker thread and deliver its messages on the Tk thread.
+
+    The worker calls task.post(message) to report progress and checks task.cancelled
+    to stop early; task.call(fn) runs fn on the Tk thread and waits for its result.
+    on_message(message) and on_done(result, error) run on the Tk thread.
+    """
+    def __init__(self, root, target, on_message=None, on_done=None, poll_ms=100):
+        self.root = root
+        self.target = target
+        self.on_message = on_message
+        self.on_done = on_done
+        self.poll_ms = poll_ms
+        self.cancel_event = threading.Event()
+        self.messages = queue.Queue()
+        self.calls = queue.Queue()
+        self.result = None
+        self.error = None
+        self.thread = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.root.after(self.poll_ms, self._poll)
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def post(self, message):
+        self.messages.put(message)
+
+    def call(self, fn):
+        """From the worker: run fn() on the Tk thread at the next poll and return its result."""
+        future = concurrent.futures.Future()
+        self.calls.put((fn, future))
+        return future.result()
+
+    def _run(self):
+        try:
+            self.result = self.target(self)
+        except Exception as e:
+            self.error = e
+
+    def _poll(self):
+        finished = not self.thread.is_alive()
+        while True:
+            try:
+                fn, future = self.calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                future.set_result(fn())
+            except Exception as e:
+                future.set_exception(e)
+        # Bound the work done per poll so the UI stays responsive
+        for _ in range(500):
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if self.on_message:
+                self.on_message(message)
+        else:
+            finished = False
+        if finished and self.messages.empty():
+            if self.on_done:
+                self.on_done(self.result, self.error)
+        else:
+            self.root.after(self.poll_ms, self._poll)
+
+# --- Coverage scan ---
+class CoverageReport:
+    """Running totals of an annotation coverage scan, in bounded memory.
+
+    Only the totals, the least covered folders and the most recent folders are
+    kept, however many folders the scan visits.
+    """
+    def __init__(self, root, limit=15):
+        self.root = root
+        self.limit = limit
+        self.folders = 0
+        self.entries = 0
+        self.annotated = 0
+        self.worst = []  # heap of (-ratio, missing, folder)
+        self.recent = deque(maxlen=limit)
+        self.finished = False
+        self.cancelled = False
+
+    def add(self, folder, entries, annotated):
+        self.folders += 1
+        self.entries += entries
+        self.annotated += annotated
+        self.recent.append((folder, entries, annotated))
+        if entries:
+            heapq.heappush(self.worst, (-(annotated / entries), entries - annotated, folder))
+            if len(self.worst) > self.limit:
+                heapq.heappop(self.worst)
+
+    def render(self):
+        coverage = self.annotated / self.entries * 100 if self.entries else 0
+        if self.cancelled:
+            state = "cancelled"
+        elif self.finished:
+            state = "done"
+        else:
+            state = "scanning..."
+        text = f"""
+🧾 ANNOTATION COVERAGE ({state})
+==========================
+
+Root: {self.root}
+Folders scanned: {self.folders}
+Annotated entries: {self.annotated}/{self.entries} ({coverage:.1f}%)
+Entries without notes: {self.entries - self.annotated}
+
+LEAST COVERED FOLDERS:
+-----------------
+"""
+        for neg_ratio, missing, folder in sorted(self.worst, reverse=True):
+            text += f"{relative_folder(self.root, folder) or '.'}: {-neg_ratio * 100:.0f}% ({missing} missing)\n"
+        text += "\nLATEST FOLDERS:\n-----------------\n"
+        for folder, entries, annotated in reversed(self.recent):
+            text += f"{relative_folder(self.root, folder) or '.'}: {annotated}/{entries}\n"
+        return text
+
+def folder_coverage_counts(folder, entries):
+    """Walk handler comparing directory entries with the keys of the folder's notes file."""
+    names = [entry.name for entry in entries if not is_sidecar(entry.name)]
+    try:
+        notes = read_notes_file(folder) or {}
+    except Exception:
+        notes = {}
+    annotated = sum(1 for name in names if has_note(notes.get(name)))
+    return folder, len(names), annotated
+
+def scan_coverage(root, report, workers=None, cancel=None, on_progress=None, interval=0.5):
+    """Fill report with the coverage of every folder under root.
+
+    on_progress(report) is called at most every interval seconds and once at the end.
+    """
+    last = time.monotonic()
+    for folder, entries, annotated in walk_tree_parallel(root, folder_coverage_counts, workers, cancel):
+        report.add(folder, entries, annotated)
+        if on_progress and time.monotonic() - last >= interval:
+            last = time.monotonic()
+            on_progress(report)
+    report.cancelled = bool(cancel and cancel.is_set())
+    report.finished = True
+    if on_progress:
+        on_progress(report)
+    return report
+
+# --- Checksums ---
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(path):
+    """SHA-256 of a file, read in chunks. Runs in the checksum process pool."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def checksum_record(st, digest, previous=None):
+    """Build the checksum entry stored in _meta, comparing with the previous entry."""
+    record = {"sha256": digest, "inode": st.st_ino, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "status": "ok"}
+    if previous and previous.get("sha256") and previous["sha256"] != digest:
+        unchanged_stat = (previous.get("inode"), previous.get("size"), previous.get("mtime_ns")) == \
+            (st.st_ino, st.st_size, st.st_mtime_ns)
+        # Same inode, size and mtime but different content points to corruption
+        record["status"] = "corrupted" if unchanged_stat else "changed"
+        record["previous"] = previous["sha256"]
+    elif previous and previous.get("status") != "ok" and previous.get("sha256") == digest:
+        record["status"] = previous["status"]
+        record["previous"] = previous.get("previous")
+    return record
+
+def folder_checksums(folder, names, known, pool, verify=False, cancel=None):
+    """Hash the files of folder that are new or whose (inode, size, mtime) changed.
+
+    known holds the current checksum entries of the folder. With verify=True every
+    file is hashed again. Returns (updated entries, names to forget).
+    """
+    jobs = {}
+    for name in names:
+        path = os.path.join(folder, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if not stat.S_ISREG(st.st_mode):
+            continue
+        previous = known.get(name)
+        if not verify and previous and (previous.get("inode"), previous.get("size"), previous.get("mtime_ns")) == \
+                (st.st_ino, st.st_size, st.st_mtime_ns):
+            continue
+        jobs[pool.submit(file_sha256, path)] = (name, st, previous)
+
+    updates = {}
+    for future in concurrent.futures.as_completed(jobs):
+        name, st, previous = jobs[future]
+        if cancel and cancel.is_set():
+            future.cancel()
+            continue
+        try:
+            updates[name] = checksum_record(st, future.result(), previous)
+        except (OSError, concurrent.futures.CancelledError):
+            continue
+    present = set(names)
+    removed = [name for name in known if name not in present]
+    return updates, removed
+
+def apply_checksums(notes, updates, removed):
+    checksums = notes.setdefault("_meta", {}).setdefault("checksums", {})
+    checksums.update(updates)
+    for name in removed:
+        checksums.pop(name, None)
+
+# --- Recovery journal ---
+JOURNAL_DIRNAME = ".metanotes.journal"
+JOURNAL_IDLE_MS = 1500
+JOURNAL_COMPACT_SIZE = 8 * 1024 * 1024
+
+def process_alive(pid):
+    """Best-effort check that another MetaNotes session is still running."""
+    if pid <= 0 or pid == os.getpid():
+        return False
+    if os.name == 'nt':
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        ERROR_ACCESS_DENIED = 5
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            # Another user's process still exists; a pid that is gone cannot be opened at all
+            return kernel32.GetLastError() == ERROR_ACCESS_DENIED
+        try:
+            code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+class RecoveryJournal:
+    """Append-only log of unsaved tab contents, one file per session.
+
+    Each record holds the full text of one tab as it was when the editor went
+    idle. The file is deleted once everything is saved, so a journal left on disk
+    at startup belongs to a session that did not end cleanly.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}-{int(time.time())}.jsonl")
+        self.file = None
+        self.size = 0
+
+    def record(self, folder, name, text):
+        self._append({"folder": folder, "name": name, "text": text, "time": time.time()})
+
+    def discard(self, folder, name):
+        """Mark a note as saved so it is not offered for recovery."""
+        if self.file:
+            self._append({"folder": folder, "name": name, "saved": True})
+
+    def _append(self, record):
+        if self.file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.file = open(self.path, "a", encoding="utf-8")
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self.file.write(line)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.size += len(line)
+
+    def rewrite(self, records):
+        """Replace the journal by the given (folder, name, text) records only."""
+        self.clear()
+        for folder, name, text in records:
+            self.record(folder, name, text)
+
+    def clear(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+        self.size = 0
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def read(path):
+        """Return the latest unsaved text of each (folder, name) in a journal file."""
+        latest = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # Torn write at the crash point
+                    key = (record.get("folder"), record.get("name"))
+                    if record.get("saved"):
+                        latest.pop(key, None)
+                    else:
+                        latest[key] = record.get("text", "")
+        except OSError:
+            pass
+        return latest
+
+    def orphans(self):
+        """Journal files left by sessions that are no longer running."""
+        if not os.path.isdir(self.directory):
+            return []
+        paths = []
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            if path == self.path or not entry.endswith(".jsonl"):
+                continue
+            try:
+                pid = int(entry.split("-", 1)[0])
+            except ValueError:
+                pid = 0
+            if not process_alive(pid):
+                paths.append(path)
+        return paths
+
+# --- Version history ---
+HISTORY_FILENAME = ".metanotes.history"
+HISTORY_SNAPSHOT_EVERY = 20  # Full snapshot every N revisions bounds reconstruction cost
+HISTORY_COMPACT_SIZE = 8 * 1024 * 1024  # Log size past which old revisions are dropped
+HISTORY_KEEP_REVISIONS = 100  # Revisions kept per note, at least, when the log is compacted
+
+def _pack(payload):
+    return base64.b64encode(zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))).decode("ascii")
+
+def _unpack(data):
+    return json.loads(zlib.decompress(base64.b64decode(data)).decode("utf-8"))
+
+def make_delta(old, new):
+    """Line-based delta turning old into new: ["=", i1, i2] copies old lines, ["+", lines] inserts."""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["=", i1, i2])
+        elif j2 > j1:
+            ops.append(["+", new_lines[j1:j2]])
+    return ops
+
+def apply_delta(old, ops):
+    old_lines = old.splitlines(keepends=True)
+    parts = []
+    for op in ops:
+        if op[0] == "=":
+            parts.extend(old_lines[op[1]:op[2]])
+        else:
+            parts.extend(op[1])
+    return "".join(parts)
+
+class NoteHistory:
+    """Append-only revision log of the notes of a folder, stored next to its notes file.
+
+    Each line holds one revision of one note, either a full snapshot or a line
+    delta from the previous revision, compressed with zlib. A snapshot is written
+    every HISTORY_SNAPSHOT_EVERY revisions so any revision is rebuilt from at most
+    that many deltas.
+
+    The byte offsets of each note's lines are indexed on first use and extended
+    with what was appended since, so a lookup only reads that note's lines. Past
+    HISTORY_COMPACT_SIZE the log is rewritten with the recent revisions only.
+    """
+    def __init__(self, folder):
+        self.path = os.path.join(folder, HISTORY_FILENAME)
+        self.latest = {}  # name -> (revision, text) of the last recorded revision
+        self.offsets = {}  # name -> [(offset, length)] of its lines in the log
+        self.indexed = 0  # Bytes of the log covered by offsets
+        self.inode = None
+
+    def _index(self):
+        """Extend the offset index with the lines appended to the log since the last call."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self.offsets, self.indexed, self.inode = {}, 0, None
+            return
+        if st.st_ino != self.inode or st.st_size < self.indexed:
+            # Compacted or replaced by another session
+            self.offsets, self.indexed, self.inode = {}, 0, st.st_ino
+        if st.st_size == self.indexed:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self.indexed)
+                offset = self.indexed
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Still being written
+                    try:
+                        name = json.loads(line).get("n")
+                    except ValueError:
+                        name = None
+                    if name is not None:
+                        self.offsets.setdefault(name, []).append((offset, len(line)))
+                    offset += len(line)
+                self.indexed = offset
+        except OSError as e:
+            print(f"History read error: {e}")
+
+    def _records(self, name):
+        self._index()
+        records = []
+        try:
+            with open(self.path, "rb") as f:
+                for offset, length in self.offsets.get(name, []):
+                    f.seek(offset)
+                    try:
+                        records.append(json.loads(f.read(length)))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return records
+
+    def revisions(self, name):
+        """Return [(revision, time, kind)] of a note, oldest first."""
+        return [(record["r"], record["t"], record["k"]) for record in self._records(name)]
+
+    def text_at(self, name, revision=None, records=None):
+        """Rebuild the text of a revision (the latest one by default)."""
+        records = records if records is not None else self._records(name)
+        if revision is not None:
+            records = [record for record in records if record["r"] <= revision]
+        if not records:
+            return None
+        start = max(i for i, record in enumerate(records) if record["k"] == "s")
+        text = _unpack(records[start]["z"])
+        for record in records[start + 1:]:
+            text = apply_delta(text, _unpack(record["z"]))
+        return text
+
+    def record(self, name, text, previous=None):
+        """Append text as a new revision of name unless it is unchanged.
+
+        previous is the text the note had before, recorded first if the note has
+        no history yet so the edit itself can be undone.
+        """
+        if name not in self.latest:
+            records = self._records(name)
+            if records:
+                self.latest[name] = (records[-1]["r"], self.text_at(name, records=records))
+            elif previous:
+                self._append(name, 0, "s", previous)
+                self.latest[name] = (0, previous)
+        last_revision, last_text = self.latest.get(name, (-1, None))
+        if last_text == text:
+            return last_revision
+        revision = last_revision + 1
+        if last_text is None or revision % HISTORY_SNAPSHOT_EVERY == 0:
+            self._append(name, revision, "s", text)
+        else:
+            self._append(name, revision, "d", make_delta(last_text, text))
+        self.latest[name] = (revision, text)
+        return revision
+
+    def _append(self, name, revision, kind, payload):
+        record = {"n": name, "r": revision, "t": datetime.now().isoformat(timespec="seconds"),
+                  "k": kind, "z": _pack(payload)}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            size = f.tell()
+        if os.name == 'nt':
+            set_hidden(self.path, True)
+        if size > HISTORY_COMPACT_SIZE:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the log keeping, for each note, the revisions from the last snapshot
+        that leaves at least HISTORY_KEEP_REVISIONS of them."""
+        self._index()
+        keep = []
+        for name, spans in self.offsets.items():
+            records = self._records(name)
+            if len(records) != len(spans):
+                keep.extend(spans)  # Unreadable lines: leave this note as it is
+                continue
+            last = records[-1]["r"]
+            starts = [i for i, record in enumerate(records)
+                      if record["k"] == "s" and record["r"] <= last - HISTORY_KEEP_REVISIONS + 1]
+            keep.extend(spans[starts[-1]:] if starts else spans)
+        keep.sort()
+        try:
+            with open(self.path, "rb") as src, tempfile.NamedTemporaryFile(
+                    "wb", dir=os.path.dirname(self.path), delete=False) as tmp:
+                for offset, length in keep:
+                    src.seek(offset)
+                    tmp.write(src.read(length))
+                temp_name = tmp.name
+            os.replace(temp_name, self.path)
+        except OSError as e:
+            print(f"History compaction error: {e}")
+            return
+        if os.name == 'nt':
+            set_hidden(self.path, True)
+        self.offsets, self.indexed, self.inode = {}, 0, None
+
+# --- Catalog ---
+CATALOG_FILENAME = ".metanotes.catalog.sqlite"
+
+def relative_folder(root, folder):
+    """Return folder relative to root with '/' separators ('' for root itself)."""
+    rel = os.path.relpath(folder, root)
+    return "" if rel == "." else rel.replace(os.sep, "/")
+
+CATALOG_SEARCH_PAGE = 500  # Rows read per query by NoteCatalog.search
+
+class NoteCatalog:
+    """SQLite mirror of every notes file under a root folder.
+
+    The per-folder notes files stay the source of truth: the catalog is only used
+    to answer tree-wide questions and can be deleted and rebuilt at any time.
+    Folders are stored relative to the root so the catalog moves with the tree.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS folders (
+            path TEXT PRIMARY KEY, notes_mtime REAL, notes_size INTEGER);
+        CREATE TABLE IF NOT EXISTS entries (
+            folder TEXT, name TEXT, is_dir INTEGER, size INTEGER, mtime REAL,
+            PRIMARY KEY (folder, name));
+        CREATE TABLE IF NOT EXISTS notes (
+            folder TEXT, name TEXT, body TEXT, words INTEGER,
+            PRIMARY KEY (folder, name));
+        CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.path = os.path.join(self.root, CATALOG_FILENAME)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def contains(self, folder):
+        folder = os.path.abspath(folder)
+        return folder == self.root or folder.startswith(self.root + os.sep)
+
+    def folder_path(self, rel):
+        return os.path.join(self.root, *rel.split("/")) if rel else self.root
+
+    def _known_folders(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT path, notes_mtime, notes_size FROM folders").fetchall()
+        return {path: (mtime, size) for path, mtime, size in rows}
+
+    def _write_folder(self, rel, notes_stat, entries, notes):
+        """Replace the rows of one folder. notes=None keeps the stored notes."""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO folders (path, notes_mtime, notes_size) VALUES (?, ?, ?)",
+            (rel, notes_stat[0], notes_stat[1]))
+        if entries is not None:
+            self.conn.execute("DELETE FROM entries WHERE folder = ?", (rel,))
+            self.conn.executemany(
+                "INSERT INTO entries (folder, name, is_dir, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                [(rel,) + entry for entry in entries])
+        if notes is not None:
+            self.conn.execute("DELETE FROM notes WHERE folder = ?", (rel,))
+            self.conn.executemany(
+                "INSERT INTO notes (folder, name, body, words) VALUES (?, ?, ?, ?)",
+                [(rel, name, body, len(body.split())) for name, body in notes])
+
+    def build(self, workers=None, cancel=None, progress=None):
+        """Crawl the tree and bring the catalog up to date.
+
+        Notes files whose size and mtime did not change since the last build are
+        not parsed again. Returns the number of folders visited.
+        """
+        known = self._known_folders()
+
+        def handler(folder, entries):
+            rel = relative_folder(self.root, folder)
+            rows = []
+            notes_stat = (None, None)
+            for entry in entries:
+                if entry.name == META_FILENAME:
+                    try:
+                        st = entry.stat()
+                        notes_stat = (st.st_mtime, st.st_size)
+                    except OSError:
+                        pass
+                    continue
+                if is_sidecar(entry.name):
+                    continue
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    st = entry.stat(follow_symlinks=False)
+                    rows.append((entry.name, int(is_dir), 0 if is_dir else st.st_size, st.st_mtime))
+                except OSError:
+                    rows.append((entry.name, 0, 0, 0))
+            notes = None
+            if notes_stat[0] is None:
+                notes = []
+            elif known.get(rel) != notes_stat:
+                try:
+                    decoded = read_notes_file(folder) or {}
+                except Exception:
+                    decoded = {}
+                notes = [(name, note_text(value)) for name, value in decoded.items() if name != "_meta"]
+            return rel, notes_stat, rows, notes
+
+        seen = set()
+        count = 0
+        for rel, notes_stat, rows, notes in walk_tree_parallel(self.root, handler, workers, cancel):
+            seen.add(rel)
+            with self.lock:
+                self._write_folder(rel, notes_stat, rows, notes)
+                count += 1
+                if count % 200 == 0:
+                    self.conn.commit()
+            if progress:
+                progress(count, rel)
+
+        with self.lock:
+            if not (cancel and cancel.is_set()):
+                # Forget folders that no longer exist
+                for rel in set(known) - seen:
+                    self.conn.execute("DELETE FROM folders WHERE path = ?", (rel,))
+                    self.conn.execute("DELETE FROM entries WHERE folder = ?", (rel,))
+                    self.conn.execute("DELETE FROM notes WHERE folder = ?", (rel,))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO info (key, value) VALUES ('built', ?)",
+                    (datetime.now().isoformat(timespec="seconds"),))
+            self.conn.commit()
+        return count
+
+    def update_folder(self, folder, notes):
+        """Mirror the notes of one folder after it has been saved."""
+        rel = relative_folder(self.root, folder)
+        meta_path = os.path.join(folder, META_FILENAME)
+        try:
+            st = os.stat(meta_path)
+            notes_stat = (st.st_mtime, st.st_size)
+        except OSError:
+            notes_stat = (None, None)
+        rows = [(name, note_text(value)) for name, value in notes.items() if name != "_meta"]
+        with self.lock:
+            self._write_folder(rel, notes_stat, None, rows)
+            self.conn.commit()
+
+    def search(self, query, match_case=False, whole_word=False, use_regex=False, limit=None):
+        """Yield (folder, name, match spans) of the notes of the tree matching the search options."""
+        pattern = compile_search(query, match_case, whole_word, use_regex)
+        where = ""
+        params = ()
+        if not use_regex and not match_case and query.isascii():
+            # LIKE is case-insensitive for ASCII only, so it cannot narrow "éclairage" to "Éclairage"
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where = " AND body LIKE ? ESCAPE '\\'"
+            params = (f"%{escaped}%",)
+        # Pages in primary key order, so the bodies of the tree are never all in memory
+        # and the lock is not held while the caller consumes the results
+        last = ("", "")
+        found = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT folder, name, body FROM notes WHERE (folder, name) > (?, ?)" + where
+                    + " ORDER BY folder, name LIMIT ?", last + params + (CATALOG_SEARCH_PAGE,)).fetchall()
+            for rel, name, body in rows:
+                spans = find_spans(pattern, body)
+                if spans:
+                    yield self.folder_path(rel), name, spans
+                    found += 1
+                    if limit and found >= limit:
+                        return
+            if len(rows) < CATALOG_SEARCH_PAGE:
+                return
+            last = rows[-1][:2]
+
+    def note_body(self, folder, name):
+        rel = relative_folder(self.root, folder)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body FROM notes WHERE folder = ? AND name = ?", (rel, name)).fetchone()
+        return row[0] if row else ""
+
+    def stats(self):
+        with self.lock:
+            folders = self.conn.execute("SELECT COUNT(*) FROM folders").fetchone()[0]
+            files = self.conn.execute("SELECT COUNT(*) FROM entries WHERE is_dir = 0").fetchone()[0]
+            notes, words = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(words), 0) FROM notes").fetchone()
+            annotated = self.conn.execute(
+                "SELECT COUNT(*) FROM entries e JOIN notes n "
+                "ON n.folder = e.folder AND n.name = e.name WHERE n.body != ''").fetchone()[0]
+            total_entries = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            row = self.conn.execute("SELECT value FROM info WHERE key = 'built'").fetchone()
+        return {
+            "folders": folders,
+            "files": files,
+            "entries": total_entries,
+            "notes": notes,
+            "words": words,
+            "annotated": annotated,
+            "built": row[0] if row else None,
+        }
+
+    def unannotated(self, limit=100):
+        """Return (folder, name) of files without a note, up to limit."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT e.folder, e.name FROM entries e LEFT JOIN notes n "
+                "ON n.folder = e.folder AND n.name = e.name "
+                "WHERE e.is_dir = 0 AND (n.name IS NULL OR n.body = '') "
+                "ORDER BY e.folder, e.name LIMIT ?", (limit,)).fetchall()
+        return [(self.folder_path(rel), name) for rel, name in rows]
+
+    def child_coverage(self, folder):
+        """Return {subfolder name: (annotated entries, entries)} for direct subfolders of folder."""
+        rel = relative_folder(self.root, folder)
+        prefix = rel + "/" if rel else ""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT e.folder, COUNT(*), "
+                "SUM(CASE WHEN n.body IS NOT NULL AND n.body != '' THEN 1 ELSE 0 END) "
+                "FROM entries e LEFT JOIN notes n ON n.folder = e.folder AND n.name = e.name "
+                "WHERE e.folder LIKE ? ESCAPE '\\' GROUP BY e.folder",
+                (prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",)).fetchall()
+        coverage = {}
+        for child, total, annotated in rows:
+            if child == rel:
+                continue
+            name = child[len(prefix):]
+            if "/" not in name:
+                coverage[name] = (annotated or 0, total)
+        return coverage
+
+# --- Tree sync ---
+SYNC_BASE_FILENAME = ".metanotes.sync.json"
+
+def note_value_hash(value):
+    """Content hash of a note, without reading the body of a blob."""
+    return value.digest if isinstance(value, BlobNote) else note_hash(value)
+
+def merge_notes(notes_a, notes_b, base, labels=("A", "B")):
+    """Three-way merge of two versions of a folder's notes against the base hashes.
+
+    Returns (changes_a, changes_b, conflicts, merged) where changes map names to
+    the new text (None removes the note), conflicts lists the names changed
+    differently on both sides, and merged maps names to the hashes now shared by
+    both sides. A conflicting note gets both texts, between conflict markers.
+    """
+    hashes_a = {name: note_value_hash(value) for name, value in notes_a.items() if name != "_meta"}
+    hashes_b = {name: note_value_hash(value) for name, value in notes_b.items() if name != "_meta"}
+    changes_a, changes_b, conflicts, merged = {}, {}, [], {}
+    for name in sorted(hashes_a.keys() | hashes_b.keys()):
+        ours, theirs, original = hashes_a.get(name), hashes_b.get(name), base.get(name)
+        if ours == theirs:
+            merged[name] = ours
+        elif ours == original:
+            changes_a[name] = note_text(notes_b[name]) if theirs else None
+            merged[name] = theirs
+        elif theirs == original:
+            changes_b[name] = note_text(notes_a[name]) if ours else None
+            merged[name] = ours
+        elif ours is None:
+            # Changed on one side, deleted on the other: the change wins
+            changes_a[name] = note_text(notes_b[name])
+            merged[name] = theirs
+        elif theirs is None:
+            changes_b[name] = note_text(notes_a[name])
+            merged[name] = ours
+        else:
+            text = (f"<<<<<<< {labels[0]}\n{note_text(notes_a[name])}\n=======\n"
+                    f"{note_text(notes_b[name])}\n>>>>>>> {labels[1]}")
+            changes_a[name] = changes_b[name] = text
+            merged[name] = note_hash(text)
+            conflicts.append(name)
+    return changes_a, changes_b, conflicts, {name: value for name, value in merged.items() if value}
+
+def same_value(x, y):
+    """Equality that tells True from 1, for field values."""
+    return json.dumps(x, sort_keys=True) == json.dumps(y, sort_keys=True)
+
+def merge_meta(notes_a, notes_b, base):
+    """Three-way merge of the fields and tags kept in _meta of both sides, in place.
+
+    base holds the fields and tags of the last sync. Fields are merged key by
+    key; a key changed differently on both sides keeps the value of A and is
+    reported as a conflict. Tags are merged as sets: additions and removals of
+    either side are kept. Returns (changed_a, changed_b, conflicts, merged).
+    """
+    base_fields, base_tags = base.get(FIELDS_KEY, {}), base.get(TAGS_KEY, {})
+    names = set(base_fields) | set(base_tags)
+    for notes in (notes_a, notes_b):
+        meta = notes.get("_meta", {})
+        names |= set(meta.get(FIELDS_KEY, {})) | set(meta.get(TAGS_KEY, {}))
+    changed_a = changed_b = False
+    conflicts, merged = [], {FIELDS_KEY: {}, TAGS_KEY: {}}
+    for name in sorted(names):
+        fields_a, fields_b = note_fields(notes_a, name), note_fields(notes_b, name)
+        original = base_fields.get(name, {})
+        fields = {}
+        for key in sorted(fields_a.keys() | fields_b.keys() | original.keys()):
+            ours, theirs, before = fields_a.get(key), fields_b.get(key), original.get(key)
+            value = theirs if same_value(ours, before) else ours
+            if not same_value(ours, theirs) and not same_value(ours, before) and not same_value(theirs, before):
+                conflicts.append(f"{name} [{key}]")
+            if value is not None:
+                fields[key] = value
+        tags_a, tags_b = note_tags(notes_a, name), note_tags(notes_b, name)
+        removed = set(base_tags.get(name, [])) - (set(tags_a) & set(tags_b))
+        tags = [tag for tag in dict.fromkeys(tags_a + tags_b) if tag not in removed]
+        if not (same_value(fields, fields_a) and tags == tags_a):
+            set_note_fields(notes_a, name, fields, tags)
+            changed_a = True
+        if not (same_value(fields, fields_b) and tags == tags_b):
+            set_note_fields(notes_b, name, fields, tags)
+            changed_b = True
+        if fields:
+            merged[FIELDS_KEY][name] = fields
+        if tags:
+            merged[TAGS_KEY][name] = tags
+    return changed_a, changed_b, conflicts, merged
+
+def apply_note_changes(notes, changes):
+    for name, text in changes.items():
+        if text is None:
+            notes.pop(name, None)
+        else:
+            notes[name] = text
+
+def notes_folders(root, cancel=None):
+    """Map the folders of root that have a notes file (relative paths) to its (mtime, size)."""
+    def handler(folder, entries):
+        for entry in entries:
+            if entry.name == META_FILENAME:
+                st = entry.stat(follow_symlinks=False)
+                return relative_folder(root, folder), [st.st_mtime_ns, st.st_size]
+        return None
+    return dict(walk_tree_parallel(root, handler, cancel=cancel))
+
+def sync_trees(root_a, root_b, fmt=FORMAT_PLAIN, blob_threshold=None, cancel=None, on_progress=None, write=None):
+    """Merge the notes of two copies of a tree, writing only the folders that changed.
+
+    The hashes of the notes, and their fields and tags, after each sync are kept in SYNC_BASE_FILENAME in
+    root_a, with the size and mtime of both notes files: a folder whose two files
+    are unchanged since then is skipped without being read. Each changed folder
+    gets one atomic write per side. write(folder, notes) may replace the default
+    write; it returns the new stat of the notes file and the names it left
+    unchanged (notes being edited), which keep their previous base.
+    """
+    root_a, root_b = os.path.abspath(root_a), os.path.abspath(root_b)
+    base_path = os.path.join(root_a, SYNC_BASE_FILENAME)
+    try:
+        with open(base_path, "r", encoding="utf-8") as f:
+            base_data = json.load(f)
+    except (OSError, ValueError):
+        base_data = {}
+    pairs = base_data.setdefault("pairs", {})
+    records = pairs.get(root_b, {}).get("folders", {})
+
+    def default_write(folder, notes):
+        write_notes_file(folder, notes, fmt, blob_threshold)
+        return notes_file_stat(folder), []
+    write = write or default_write
+
+    stats_a = notes_folders(root_a, cancel)
+    stats_b = notes_folders(root_b, cancel)
+    report = {"folders": 0, "skipped": 0, "missing": 0, "written_a": 0, "written_b": 0,
+              "notes": 0, "conflicts": [], "busy": []}
+    new_records = {}
+    for rel in sorted(stats_a.keys() | stats_b.keys()):
+        if cancel and cancel.is_set():
+            # Folders not reached keep their previous base
+            new_records.update({key: value for key, value in records.items() if key not in new_records})
+            break
+        report["folders"] += 1
+        folder_a, folder_b = (os.path.join(root, *rel.split("/")) if rel else root for root in (root_a, root_b))
+        record = records.get(rel)
+        stat_a, stat_b = stats_a.get(rel), stats_b.get(rel)
+        if record and record["a"] == stat_a and record["b"] == stat_b:
+            report["skipped"] += 1
+            new_records[rel] = record
+            continue
+        if not os.path.isdir(folder_a) or not os.path.isdir(folder_b):
+            report["missing"] += 1
+            continue
+        try:
+            notes_a = read_notes_file(folder_a) or {"_meta": {"created": datetime.now().isoformat()}}
+            notes_b = read_notes_file(folder_b) or {"_meta": {"created": datetime.now().isoformat()}}
+        except Exception as e:
+            print(f"Sync read error in {rel or '.'}: {e}")
+            continue
+        changes_a, changes_b, conflicts, merged = merge_notes(
+            notes_a, notes_b, record["notes"] if record else {}, (root_a, root_b))
+        meta_a, meta_b, meta_conflicts, merged_meta = merge_meta(
+            notes_a, notes_b, record.get("meta", {}) if record else {})
+        conflicts += meta_conflicts
+        busy = []
+        if changes_a or meta_a:
+            apply_note_changes(notes_a, changes_a)
+            stat_a, kept = write(folder_a, notes_a)
+            busy += kept
+            report["written_a"] += 1
+        if changes_b or meta_b:
+            apply_note_changes(notes_b, changes_b)
+            stat_b, kept = write(folder_b, notes_b)
+            busy += kept
+            report["written_b"] += 1
+        if busy:
+            # Not written everywhere: keep the old base so the next sync retries them,
+            # and the old stats so this folder is read again
+            for name in busy:
+                previous = record["notes"].get(name) if record else None
+                if previous:
+                    merged[name] = previous
+                else:
+                    merged.pop(name, None)
+            stat_a, stat_b = (record["a"], record["b"]) if record else (None, None)
+            report["busy"].extend(f"{rel}/{name}" if rel else name for name in dict.fromkeys(busy))
+        report["notes"] += len(changes_a) + len(changes_b)
+        report["conflicts"].extend(f"{rel}/{name}" if rel else name for name in conflicts)
+        new_records[rel] = {"a": stat_a, "b": stat_b, "notes": merged, "meta": merged_meta}
+        if on_progress:
+            on_progress(report)
+
+    pairs[root_b] = {"synced": datetime.now().isoformat(), "folders": new_records}
+    atomic_write_json(base_path, base_data)
+    set_hidden(base_path, True)
+    return report
+
+def format_sync_report(root_a, root_b, report):
+    lines = [
+        "🔁 TREE SYNC",
+        "==========================",
+        "",
+        f"{root_a}  ⇄  {root_b}",
+        f"Folders with notes: {report['folders']} ({report['skipped']} unchanged, skipped)",
+        f"Folders written: {report['written_a']} / {report['written_b']}",
+        f"Notes copied or merged: {report['notes']}",
+    ]
+    if report["missing"]:
+        lines.append(f"Folders missing on one side: {report['missing']}")
+    if report["busy"]:
+        lines.append(f"Notes with unsaved edits, left for the next sync ({len(report['busy'])}):")
+        lines.extend(f"  {path}" for path in report["busy"][:50])
+    if report["conflicts"]:
+        lines.append(f"Conflicts ({len(report['conflicts'])}), both versions kept between markers:")
+        lines.extend(f"  {path}" for path in report["conflicts"][:50])
+    return "\n".join(lines)
+
+# --- Export ---
+EXPORT_MANIFEST_FILENAME = ".metanotes.export.sqlite"
+EXPORT_LEGACY_MANIFEST = ".metanotes.export.json"  # Replaced by the SQLite manifest
+EXPORT_FORMATS = ("md", "html")
+EXPORT_PAGE_NAME = "notes"
+
+HTML_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>body{{font-family:sans-serif;max-width:60em;margin:2em auto}}pre{{white-space:pre-wrap;background:#f4f4f4;padding:.5em}}</style>
+</head><body>
+{body}
+</body></html>
+"""
+
+def export_page_path(out_dir, rel, fmt):
+    return os.path.join(out_dir, *(rel.split("/") if rel else []), f"{EXPORT_PAGE_NAME}.{fmt}")
+
+def render_export_page(title, notes, fmt):
+    names = sorted(name for name, value in notes.items() if name != "_meta" and has_note(value))
+    if fmt == "html":
+        sections = [f"<h1>{html.escape(title)}</h1>"]
+        for name in names:
+            sections.append(f"<h2>{html.escape(name)}</h2>\n<pre>{html.escape(note_text(notes[name]))}</pre>")
+        return HTML_PAGE.format(title=html.escape(title), body="\n".join(sections))
+    sections = [f"# {title}\n"]
+    for name in names:
+        sections.append(f"## {name}\n\n{note_text(notes[name])}\n")
+    return "\n".join(sections)
+
+class ExportManifest:
+    """Pages written by the exports into an output folder, one row per format and folder.
+
+    Kept in SQLite so a re-export of a large tree looks rows up, and walks them
+    in order, without holding them all in memory. Each export gets a new run
+    number; rows it did not touch belong to folders that lost their notes.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pages (
+            fmt TEXT, rel TEXT, mtime_ns INTEGER, size INTEGER, notes INTEGER, run INTEGER,
+            PRIMARY KEY (fmt, rel));
+    """
+
+    def __init__(self, out_dir, fmt):
+        self.fmt = fmt
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(out_dir, EXPORT_MANIFEST_FILENAME), check_same_thread=False)
+        self.conn.executescript(self.SCHEMA)
+        self.run = (self.conn.execute("SELECT MAX(run) FROM pages").fetchone()[0] or 0) + 1
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def get(self, rel):
+        """Return the (key, notes count) recorded for the page of rel, or None."""
+        with self.lock:
+            row = self.conn.execute("SELECT mtime_ns, size, notes FROM pages WHERE fmt = ? AND rel = ?",
+                                    (self.fmt, rel)).fetchone()
+        return ([row[0], row[1]], row[2]) if row else None
+
+    def put(self, rel, key, notes):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                              (self.fmt, rel, key[0], key[1], notes, self.run))
+
+    def pages(self):
+        """Yield (rel, notes count) of the pages of this run, sorted folder by folder."""
+        # char(1) sorts before any character of a name, like the separator of split("/")
+        yield from self.conn.execute(
+            "SELECT rel, notes FROM pages WHERE fmt = ? AND run = ? ORDER BY replace(rel, '/', char(1))",
+            (self.fmt, self.run))
+
+    def prune(self, remove):
+        """Call remove(rel) for each page this run did not touch, then forget them."""
+        for (rel,) in self.conn.execute("SELECT rel FROM pages WHERE fmt = ? AND run != ?", (self.fmt, self.run)):
+            remove(rel)
+        self.conn.execute("DELETE FROM pages WHERE fmt = ? AND run != ?", (self.fmt, self.run))
+
+def export_tree(root, out_dir, fmt="md", workers=None, cancel=None, on_progress=None, index_name=None):
+    """Export the notes of a tree as one page per folder plus an index.
+
+    Notes files are read and pages written by the walk workers, so only the
+    folders in flight are in memory; the pages are tracked on disk in an
+    ExportManifest. A page is only rewritten when the notes file it comes from
+    changed since the previous export in the same format; pages of folders that
+    lost their notes are removed. A notes file that cannot be read keeps its
+    previous page. The index is written after the walk, sorted by folder.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    root, out_dir = os.path.abspath(root), os.path.abspath(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        os.remove(os.path.join(out_dir, EXPORT_LEGACY_MANIFEST))
+    except OSError:
+        pass
+    manifest = ExportManifest(out_dir, fmt)
+
+    def export_folder(folder, entries):
+        if folder == out_dir or folder.startswith(out_dir + os.sep):
+            return None
+        meta = next((entry for entry in entries if entry.name == META_FILENAME), None)
+        if meta is None:
+            return None
+        rel = relative_folder(root, folder)
+        st = meta.stat(follow_symlinks=False)
+        key = [st.st_mtime_ns, st.st_size]
+        page = export_page_path(out_dir, rel, fmt)
+        previous = manifest.get(rel)
+        if previous and previous[0] == key and os.path.exists(page):
+            return rel, key, previous[1], False
+        try:
+            notes = read_notes_file(folder) or {}
+        except Exception as e:
+            print(f"Export read error in {rel or '.'}: {e}")
+            # Keep the page of the last good read; its old key makes the next export retry
+            if previous and os.path.exists(page):
+                return rel, previous[0], previous[1], False
+            return None
+        count = sum(1 for name, value in notes.items() if name != "_meta" and has_note(value))
+        os.makedirs(os.path.dirname(page), exist_ok=True)
+        atomic_write_text(page, render_export_page(rel or os.path.basename(root) or root, notes, fmt))
+        return rel, key, count, True
+
+    index_name = index_name or f"index.{fmt}"
+    index_path = os.path.join(out_dir, index_name)
+    report = {"folders": 0, "written": 0, "notes": 0, "removed": 0}
+    try:
+        for rel, key, count, written in walk_tree_parallel(root, export_folder, workers, cancel):
+            manifest.put(rel, key, count)
+            report["folders"] += 1
+            report["notes"] += count
+            report["written"] += written
+            if on_progress and report["folders"] % 100 == 0:
+                on_progress(report)
+        if cancel and cancel.is_set():
+            return report
+
+        # Workers finish in any order: the index is written from the manifest, sorted
+        def write_index(index):
+            title = os.path.basename(root) or root
+            if fmt == "html":
+                index.write(HTML_PAGE.split("{body}")[0].format(title=html.escape(title)))
+                index.write(f"<h1>{html.escape(title)}</h1>\n<ul>\n")
+            else:
+                index.write(f"# {title}\n\n")
+            for rel, count in manifest.pages():
+                link = os.path.relpath(export_page_path(out_dir, rel, fmt), out_dir).replace(os.sep, "/")
+                label = rel or "."
+                if fmt == "html":
+                    index.write(f'<li><a href="{html.escape(link)}">{html.escape(label)}</a> ({count})</li>\n')
+                else:
+                    index.write(f"* [{label}]({link.replace(' ', '%20')}) ({count})\n")
+            if fmt == "html":
+                index.write("</ul>\n" + HTML_PAGE.split("{body}")[1])
+        atomic_write(index_path, write_index)
+
+        def remove(rel):
+            try:
+                os.remove(export_page_path(out_dir, rel, fmt))
+                report["removed"] += 1
+            except OSError:
+                pass
+        manifest.prune(remove)
+    finally:
+        manifest.close()
+    return report
+
+# --- Sidecar ingest ---
+DEFAULT_INGEST_PATTERNS = ["*.txt", "*.url", "*.xmp"]
+INGEST_CHECKPOINT_FILENAME = ".metanotes.ingest.jsonl"
+INGEST_PREVIEW_LIMIT = 200
+
+# XMP properties copied into note fields
+XMP_FIELDS = {
+    "{http://purl.org/dc/elements/1.1/}title": "title",
+    "{http://purl.org/dc/elements/1.1/}creator": "author",
+    "{http://purl.org/dc/elements/1.1/}rights": "license",
+    "{http://purl.org/dc/elements/1.1/}description": "description",
+    "{http://purl.org/dc/elements/1.1/}source": "source",
+    "{http://ns.adobe.com/xap/1.0/rights/}WebStatement": "license_url",
+    "{http://ns.adobe.com/photoshop/1.0/}Credit": "credit",
+    "{http://ns.adobe.com/photoshop/1.0/}Source": "source",
+}
+
+def parse_sidecar(path):
+    """Return (text, fields) read from a sidecar file, according to its extension."""
+    with open(path, "rb") as f:
+        data = f.read()
+    ext = os.path.splitext(path)[1].lower()
+    content = data.decode("utf-8", errors="replace")
+    if ext == ".url":
+        # Windows internet shortcut
+        match = re.search(r"^URL=(.+)$", content, re.MULTILINE)
+        url = match.group(1).strip() if match else content.strip()
+        return f"Source: {url}", {"source": url}
+    if ext == ".xmp":
+        fields = {}
+        root = ElementTree.fromstring(data.strip())
+        for element in root.iter():
+            key = XMP_FIELDS.get(element.tag)
+            if key and key not in fields:
+                # Values are either direct text or rdf:Alt/Seq/Bag lists
+                values = [text.strip() for text in element.itertext() if text.strip()]
+                if values:
+                    fields[key] = "; ".join(values)
+        for element in root.iter():
+            for attribute, value in element.attrib.items():
+                key = XMP_FIELDS.get(attribute)
+                if key and key not in fields and value.strip():
+                    fields[key] = value.strip()
+        text = "\n".join(f"{key}: {value}" for key, value in fields.items())
+        return text, fields
+    return content.strip(), {}
+
+def sidecar_asset(name, names, sidecars=()):
+    """Name of the asset a sidecar belongs to, or None.
+
+    `crate.fbx.txt` belongs to `crate.fbx`; `crate.txt` belongs to the single
+    other entry named `crate.<ext>` that is not a sidecar itself.
+    """
+    stem = os.path.splitext(name)[0]
+    if stem in names:
+        return stem
+    candidates = [other for other in names
+                  if other not in sidecars and os.path.splitext(other)[0] == stem]
+    return candidates[0] if len(candidates) == 1 else None
+
+def merge_ingested(notes, asset, text, fields):
+    """Merge the content of a sidecar into the notes of a folder; return True if anything changed.
+
+    Text already present in the note and fields already set are left alone, so
+    ingesting the same sidecar twice is harmless.
+    """
+    changed = False
+    current = note_text(notes.get(asset, "")) if asset in notes else ""
+    if text and text not in current:
+        notes[asset] = f"{current}\n\n{text}" if current else text
+        changed = True
+    if fields:
+        existing = dict(note_fields(notes, asset))
+        added = {key: value for key, value in fields.items() if key not in existing}
+        if added:
+            existing.update(added)
+            set_note_fields(notes, asset, existing, note_tags(notes, asset))
+            changed = True
+    return changed
+
+def ingest_tree(root, patterns=None, dry_run=False, fmt=FORMAT_PLAIN, blob_threshold=None,
+                workers=None, cancel=None, on_progress=None, write=None):
+    """Merge the sidecar files found under root into the notes of their folders.
+
+    Sidecars are matched by the glob patterns, then read, parsed and merged by
+    the walk workers; each folder with changes gets one atomic write. Unless
+    dry_run is set, finished folders are appended to a checkpoint in root, so an
+    interrupted ingest resumes where it stopped; the checkpoint is removed once
+    the whole tree is done. Folders with unreadable sidecars are left out of it,
+    and it is kept, so the next run retries only them. write(folder, notes) may
+    replace the default write.
+    """
+    root = os.path.abspath(root)
+    patterns = [pattern.lower() for pattern in (patterns or DEFAULT_INGEST_PATTERNS)]
+    checkpoint_path = os.path.join(root, INGEST_CHECKPOINT_FILENAME)
+    done = set()
+    if not dry_run and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        if lines and lines[0].get("patterns") == patterns:
+            done = {line["folder"] for line in lines[1:] if "folder" in line}
+
+    def ingest_folder(folder, entries):
+        rel = relative_folder(root, folder)
+        if rel in done:
+            return None
+        names = {entry.name for entry in entries if not is_sidecar(entry.name)}
+        sidecars = {name for name in names if any(fnmatch.fnmatchcase(name.lower(), p) for p in patterns)}
+        found = []
+        for entry in entries:
+            if entry.name in sidecars and not entry.is_dir(follow_symlinks=False):
+                asset = sidecar_asset(entry.name, names, sidecars)
+                if asset is not None:
+                    found.append((entry.name, asset))
+        if not found:
+            return rel, 0, 0, [], 0
+        notes = read_notes_file(folder) or {"_meta": {"created": datetime.now().isoformat()}}
+        merged, preview, errors = 0, [], 0
+        for name, asset in found:
+            try:
+                text, fields = parse_sidecar(os.path.join(folder, name))
+            except Exception as e:
+                print(f"Ingest error in {os.path.join(folder, name)}: {e}")
+                errors += 1
+                continue
+            if merge_ingested(notes, asset, text, fields):
+                merged += 1
+                preview.append(f"{rel}/{asset} ← {name}" if rel else f"{asset} ← {name}")
+        if merged and not dry_run:
+            if write:
+                write(folder, notes)
+            else:
+                write_notes_file(folder, notes, fmt, blob_threshold)
+        return rel, len(found), merged, preview, errors
+
+    report = {"folders": 0, "sidecars": 0, "merged": 0, "errors": 0, "resumed": len(done), "preview": []}
+    checkpoint = None
+    if not dry_run:
+        checkpoint = open(checkpoint_path, "a", encoding="utf-8")
+        if not done:
+            checkpoint.truncate(0)
+            checkpoint.write(json.dumps({"patterns": patterns}) + "\n")
+    try:
+        for rel, sidecars, merged, preview, errors in walk_tree_parallel(root, ingest_folder, workers, cancel):
+            report["folders"] += 1
+            report["sidecars"] += sidecars
+            report["merged"] += merged
+            report["errors"] += errors
+            room = INGEST_PREVIEW_LIMIT - len(report["preview"])
+            report["preview"].extend(preview[:max(room, 0)])
+            if checkpoint and not errors:
+                checkpoint.write(json.dumps({"folder": rel}) + "\n")
+                checkpoint.flush()
+            if on_progress and report["folders"] % 100 == 0:
+                on_progress(report)
+    finally:
+        if checkpoint:
+            checkpoint.close()
+    if checkpoint and not (cancel and cancel.is_set()) and not report["errors"]:
+        os.remove(checkpoint_path)
+    return report
+
+def format_ingest_report(root, report, dry_run):
+    lines = [
+        "📥 SIDECAR INGEST" + (" (dry run)" if dry_run else ""),
+        "==========================",
+        "",
+        f"Tree: {root}",
+        f"Folders scanned: {report['folders']}" + (f" ({report['resumed']} done before, skipped)" if report["resumed"] else ""),
+        f"Sidecars found: {report['sidecars']}",
+        f"Sidecars {'to merge' if dry_run else 'merged'}: {report['merged']}",
+    ]
+    if report["errors"]:
+        lines.append(f"Unreadable sidecars: {report['errors']}" +
+                     ("" if dry_run else " (their folders are retried by the next ingest)"))
+    if report["preview"]:
+        lines.append("")
+        lines.extend(report["preview"])
+        if report["merged"] > len(report["preview"]):
+            lines.append(f"... and {report['merged'] - len(report['preview'])} more")
+    return "\n".join(lines)
+
+# --- Find and replace ---
+REPLACE_PREVIEW_PAGE = 50  # Notes per page of the preview
+REPLACE_CONTEXT = 30  # Characters shown around the first match
+
+ReplaceHit = namedtuple("ReplaceHit", "folder name count before after")
+
+def make_replacement(replacement, use_regex=False):
+    """Function giving the text that replaces a match; regex replacements may use \\1 or \\g<name>."""
+    if use_regex:
+        return lambda match: match.expand(replacement)
+    return lambda match: replacement
+
+def preview_replacement(text, match, new):
+    """One-line excerpts of text around match, before and after the replacement."""
+    start, end = match.span()
+    prefix = ("…" if start > REPLACE_CONTEXT else "") + text[max(0, start - REPLACE_CONTEXT):start]
+    suffix = text[end:end + REPLACE_CONTEXT] + ("…" if end + REPLACE_CONTEXT < len(text) else "")
+    return " ".join((prefix + match.group(0) + suffix).split()), " ".join((prefix + new + suffix).split())
+
+def plan_replace(root, pattern, replace, recursive=True, workers=None, cancel=None, on_progress=None):
+    """ReplaceHits of the notes of root (and its subfolders when recursive) that pattern matches.
+
+    The notes files are read and matched by the walk workers; nothing is written.
+    """
+    root = os.path.abspath(root)
+
+    def plan_folder(folder, entries):
+        if not any(entry.name == META_FILENAME for entry in entries):
+            return None
+        try:
+            notes = read_notes_file(folder) or {}
+        except Exception as e:
+            print(f"Replace read error in {folder}: {e}")
+            return None
+        hits = []
+        for name, value in notes.items():
+            if name == "_meta":
+                continue
+            text = note_text(value)
+            match = pattern.search(text)
+            if match is None:
+                continue
+            new_text, count = pattern.subn(replace, text)
+            if new_text != text:
+                hits.append(ReplaceHit(folder, name, count, *preview_replacement(text, match, replace(match))))
+        return hits
+
+    if recursive:
+        results = walk_tree_parallel(root, plan_folder, workers, cancel)
+    else:
+        with os.scandir(root) as it:
+            results = [plan_folder(root, list(it)) or []]
+    hits = []
+    for folder_hits in results:
+        hits.extend(folder_hits)
+        if on_progress:
+            on_progress(len(hits))
+    hits.sort(key=lambda hit: (hit.folder, hit.name.lower()))
+    return hits
+
+def replace_in_notes(notes, names, pattern, replace):
+    """Apply the replacement to the notes named; returns the number of replacements."""
+    total = 0
+    for name in names:
+        if name in notes and name != "_meta":
+            new_text, count = pattern.subn(replace, note_text(notes[name]))
+            if count:
+                notes[name] = new_text
+                total += count
+    return total
+
+def apply_replace(hits, pattern, replace, fmt=FORMAT_PLAIN, blob_threshold=None,
+                  workers=None, cancel=None, write=None):
+    """Apply a planned replacement with one atomic write per affected notes file.
+
+    Each folder is read again and the pattern applied to its current notes, so
+    edits made since the preview are kept. Folders are handled by a thread pool;
+    write(folder, names) may take over a folder, e.g. one loaded in the window.
+    """
+    by_folder = {}
+    for hit in hits:
+        by_folder.setdefault(hit.folder, []).append(hit.name)
+
+    def replace_folder(folder, names):
+        if cancel and cancel.is_set():
+            return 0
+        if write and write(folder, names):
+            return None
+        notes = read_notes_file(folder)
+        count = replace_in_notes(notes or {}, names, pattern, replace)
+        if count:
+            write_notes_file(folder, notes, fmt, blob_threshold)
+        return count
+
+    report = {"folders": 0, "replacements": 0, "errors": 0}
+    with concurrent.futures.ThreadPoolExecutor(workers or default_workers()) as pool:
+        futures = {pool.submit(replace_folder, folder, names): folder for folder, names in by_folder.items()}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                count = future.result()
+            except Exception as e:
+                print(f"Replace error in {futures[future]}: {e}")
+                report["errors"] += 1
+                continue
+            if count is None or count:
+                report["folders"] += 1
+                report["replacements"] += count or 0
+    return report
+
+# --- Local RPC server ---
+RPC_HOST = "127.0.0.1"
+RPC_DEFAULT_PORT = 47831
+RPC_FLUSH_DELAY = 1.0  # Seconds between the first unsaved write and the save
+RPC_POLL_MS = 20
+RPC_SEARCH_LIMIT = 1000
+RPC_TOKEN_DIRNAME = ".metanotes"  # In the user's home, readable by the user only
+HTTP_METHODS = (b"GET ", b"POST ", b"PUT ", b"HEAD ", b"OPTIONS ", b"DELETE ", b"PATCH ", b"CONNECT ", b"TRACE ")
+
+def rpc_token_path(port):
+    return os.path.join(os.path.expanduser("~"), RPC_TOKEN_DIRNAME, f"rpc-{port}.token")
+
+def write_rpc_token(port):
+    """Create the secret of a server session in a file only the user can read."""
+    token = secrets.token_hex(32)
+    path = rpc_token_path(port)
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)  # os.open keeps the mode of an existing file
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    return token
+
+def read_rpc_token(port):
+    with open(rpc_token_path(port), "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+class RpcError(Exception):
+    """Error reported to the RPC client as a JSON-RPC error object."""
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+
+def rpc_error(request_id, code, message):
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+def notes_file_stat(folder):
+    try:
+        st = os.stat(os.path.join(folder, META_FILENAME))
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+class NoteStore:
+    """Notes of the folders under the served roots, cached in memory for the RPC server.
+
+    A cached folder is reloaded when its notes file changes on disk. Writes only
+    mark the folder dirty; dirty folders are saved together RPC_FLUSH_DELAY
+    seconds after the first of them, so a burst of set calls costs one write per
+    folder. When the window is open, folders are read and written through
+    its note cache so open tabs stay consistent.
+    """
+    def __init__(self, roots, fmt=FORMAT_PLAIN, blob_threshold=None, execute=None, app=None):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.fmt = fmt
+        self.blob_threshold = blob_threshold
+        self.execute = execute or (lambda fn: fn())
+        self.app = app
+        self.cache = {}  # folder -> (notes, notes file stat)
+        self.dirty = {}  # folder -> its NoteCache entry when shared with the window
+        self.timer = None
+        self.lock = threading.RLock()
+        self.catalogs = {}
+        for root in self.roots:
+            if os.path.exists(os.path.join(root, CATALOG_FILENAME)):
+                try:
+                    self.catalogs[root] = NoteCatalog(root)
+                except sqlite3.Error as e:
+                    print(f"Catalog error: {e}")
+
+    def close(self):
+        self.flush()
+        for catalog in self.catalogs.values():
+            catalog.close()
+
+    def folder(self, path):
+        folder = os.path.abspath(path)
+        if not any(folder == root or folder.startswith(root + os.sep) for root in self.roots):
+            raise RpcError(-32602, f"Folder outside the served roots: {path}")
+        if not os.path.isdir(folder):
+            raise RpcError(-32602, f"Not a folder: {path}")
+        return folder
+
+    def catalog_for(self, folder):
+        if self.app is not None:
+            catalog = self.app.catalog
+            return catalog if catalog and catalog.contains(folder) else None
+        for catalog in self.catalogs.values():
+            if catalog.contains(folder):
+                return catalog
+        return None
+
+    def notes(self, folder):
+        with self.lock:
+            if self.app is not None:
+                # The window's note cache is shared
+                return self.app.load_folder_state(folder).notes
+            cached = self.cache.get(folder)
+            stat_key = notes_file_stat(folder)
+            if cached and (folder in self.dirty or cached[1] == stat_key):
+                return cached[0]
+            notes = read_notes_file(folder) if stat_key else None
+            if notes is None:
+                notes = {"_meta": {"created": datetime.now().isoformat()}}
+            self.cache[folder] = (notes, stat_key)
+            return notes
+
+    def schedule_flush(self):
+        if self.timer is None:
+            self.timer = threading.Timer(RPC_FLUSH_DELAY, self.execute, (self.flush,))
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """Write every dirty folder once."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            dirty, self.dirty = self.dirty, {}
+            for folder, state in dirty.items():
+                if state is not None:
+                    self.app.write_folder_notes(state)
+                    continue
+                notes = self.cache[folder][0]
+                fmt, threshold = self.app.notes_format() if self.app else (self.fmt, self.blob_threshold)
+                try:
+                    write_notes_file(folder, notes, fmt, threshold)
+                except Exception as e:
+                    print(f"RPC save error in {folder}: {e}")
+                    continue
+                self.cache[folder] = (notes, notes_file_stat(folder))
+                catalog = self.catalog_for(folder)
+                if catalog:
+                    try:
+                        catalog.update_folder(folder, notes)
+                    except sqlite3.Error as e:
+                        print(f"Catalog update error: {e}")
+
+    @staticmethod
+    def walks_tree(request):
+        """Whether a request is a recursive search, which must not hold the Tk thread."""
+        if not isinstance(request, dict) or request.get("method") != "search":
+            return False
+        params = request.get("params", {})
+        if isinstance(params, list):
+            return len(params) > 5 and bool(params[5])
+        return isinstance(params, dict) and bool(params.get("recursive"))
+
+    # Methods callable by clients, as "get", "set", ...
+    def rpc_get(self, folder, names=None):
+        """Notes of a folder by name, all of them when names is omitted."""
+        folder = self.folder(folder)
+        with self.lock:
+            notes = self.notes(folder)
+            if names is None:
+                names = [name for name in notes if name != "_meta"]
+            return {name: note_text(notes[name]) if name in notes and name != "_meta" else None
+                    for name in names}
+
+    def rpc_set(self, folder, notes):
+        """Set the notes of a folder from a name -> text mapping; null removes a note."""
+        folder = self.folder(folder)
+        if not isinstance(notes, dict) or "_meta" in notes:
+            raise RpcError(-32602, "notes must map file names to texts")
+        with self.lock:
+            state = None
+            if self.app is not None:
+                self.app.apply_external_notes(notes, folder=folder)
+                # Kept here so the write is not lost if the folder is evicted meanwhile
+                state = self.app.note_cache.get(folder)
+            else:
+                current = self.notes(folder)
+                for name, text in notes.items():
+                    if text is None:
+                        current.pop(name, None)
+                    else:
+                        current[name] = str(text)
+            self.dirty[folder] = state
+            self.schedule_flush()
+            return len(notes)
+
+    def rpc_search(self, folder, query, match_case=False, whole_word=False, use_regex=False,
+                   recursive=False, limit=RPC_SEARCH_LIMIT):
+        """Notes matching query in a folder, or in its whole tree when recursive."""
+        folder = self.folder(folder)
+        pattern = compile_search(query, match_case, whole_word, use_regex)
+        results = []
+
+        def add(note_folder, name, text):
+            spans = find_spans(pattern, text)
+            if spans:
+                results.append({"folder": note_folder, "name": name, "matches": len(spans),
+                                "snippet": make_snippet(text, spans)})
+
+        if not recursive:
+            with self.lock:
+                for name, value in self.notes(folder).items():
+                    if name != "_meta" and len(results) < limit:
+                        add(folder, name, note_text(value))
+            return results
+
+        self.execute(self.flush)  # Tree searches read the notes files; called outside execute
+        catalog = self.catalog_for(folder)
+        if catalog:
+            for note_folder, name, spans in catalog.search(query, match_case, whole_word, use_regex):
+                if note_folder == folder or note_folder.startswith(folder + os.sep):
+                    add(note_folder, name, catalog.note_body(note_folder, name))
+                    if len(results) >= limit:
+                        break
+            return results
+
+        def read_folder(note_folder, entries):
+            if not any(entry.name == META_FILENAME for entry in entries):
+                return None
+            try:
+                return note_folder, read_notes_file(note_folder)
+            except Exception as e:
+                print(f"RPC read error in {note_folder}: {e}")
+                return None
+
+        for note_folder, notes in walk_tree_parallel(folder, read_folder):
+            for name, value in (notes or {}).items():
+                if name != "_meta":
+                    add(note_folder, name, note_text(value))
+            if len(results) >= limit:
+                break
+        return results[:limit]
+
+    def rpc_stats(self, folder):
+        folder = self.folder(folder)
+        with self.lock:
+            notes = self.notes(folder)
+            words = sum(note_word_count(value) for name, value in notes.items() if name != "_meta")
+            return {
+                "folder": folder,
+                "files": len([name for name in os.listdir(folder) if not is_sidecar(name)]),
+                "notes": len([name for name, value in notes.items() if name != "_meta" and has_note(value)]),
+                "words": words,
+                "pending_writes": len(self.dirty),
+            }
+
+    def rpc_flush(self):
+        self.flush()
+        return True
+
+class RpcServer(socketserver.ThreadingTCPServer):
+    """JSON-RPC 2.0 server on a local socket: one request, or batch array, per line.
+
+    The first line of a connection must be {"token": ...} with the session
+    secret written by write_rpc_token; other connections, and anything looking
+    like HTTP (which a web page can send to localhost), are dropped. A batch is
+    run as a single call of the store's execute function, so in the window it
+    costs one trip to the Tk thread.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, store, port=RPC_DEFAULT_PORT, host=RPC_HOST):
+        self.store = store
+        socketserver.ThreadingTCPServer.__init__(self, (host, port), RpcHandler)
+        try:
+            self.token = write_rpc_token(self.port)
+        except OSError:
+            self.server_close()
+            raise
+
+    def authorized(self, line):
+        try:
+            hello = json.loads(line)
+        except ValueError:
+            return False
+        return (isinstance(hello, dict) and isinstance(hello.get("token"), str)
+                and hmac.compare_digest(hello["token"], self.token))
+
+    def remove_token(self):
+        try:
+            os.remove(rpc_token_path(self.port))
+        except OSError:
+            pass
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.remove_token()
+
+    def dispatch(self, payload):
+        """Answer a decoded request or batch; None when there is nothing to send back.
+
+        Tree-wide calls walk the disk, so they run on this connection's thread
+        rather than in execute; they reach the cache through execute themselves.
+        """
+        if isinstance(payload, list) and not payload:
+            return rpc_error(None, -32600, "Empty batch")
+        batch = payload if isinstance(payload, list) else [payload]
+        local = [request for request in batch if not self.store.walks_tree(request)]
+        answers = {}
+        if local:
+            answers = dict(zip(map(id, local), self.store.execute(lambda: [self.answer(r) for r in local])))
+        responses = [answers[id(request)] if id(request) in answers else self.answer(request)
+                     for request in batch]
+        if not isinstance(payload, list):
+            return responses[0]
+        return [response for response in responses if response is not None] or None
+
+    def answer(self, request):
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return rpc_error(None, -32600, "Invalid request")
+        request_id = request.get("id")
+        method = getattr(self.store, "rpc_" + request["method"], None)
+        params = request.get("params", {})
+        try:
+            if method is None:
+                raise RpcError(-32601, f"Unknown method: {request['method']}")
+            result = method(*params) if isinstance(params, list) else method(**params)
+        except RpcError as e:
+            return rpc_error(request_id, e.code, str(e))
+        except TypeError as e:
+            return rpc_error(request_id, -32602, str(e))
+        except Exception as e:
+            print(f"RPC error: {e}")
+            return rpc_error(request_id, -32000, str(e))
+        if "id" not in request:
+            return None  # Notification
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+class RpcHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        hello = self.rfile.readline()
+        if hello.lstrip().upper().startswith(HTTP_METHODS):
+            return  # Browser request: dropped without an answer
+        if not self.server.authorized(hello):
+            self.wfile.write(json.dumps(rpc_error(None, -32003, "Invalid or missing token")).encode("utf-8") + b"\n")
+            return
+        for line in self.rfile:
+            if line.upper().startswith(HTTP_METHODS):
+                return
+            if not line.strip():
+                continue
+            try:
+                payload = json.loads(line)
+            except ValueError:
+                response = rpc_error(None, -32700, "Parse error")
+            else:
+                response = self.server.dispatch(payload)
+            if response is not None:
+                self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+                self.wfile.flush()
+
+class RpcClient:
+    """Client for a MetaNotes --serve instance, for scripts and plugins.
+
+    The session token is read from the user's token file unless given.
+
+        client = RpcClient()
+        client.call("set", folder="/assets/props", notes={"crate.fbx": "Approved"})
+        texts, stats = client.batch([("get", {"folder": "/assets/props"}),
+                                     ("stats", {"folder": "/assets/props"})])
+    """
+    def __init__(self, port=RPC_DEFAULT_PORT, host=RPC_HOST, timeout=60, token=None):
+        token = token or read_rpc_token(port)
+        self.sock = socket.create_connection((host, port), timeout)
+        self.file = self.sock.makefile("rwb")
+        self.file.write(json.dumps({"token": token}).encode("utf-8") + b"\n")
+        self.file.flush()
+        self.ids = itertools.count(1)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def call(self, method, **params):
+        result = self.batch([(method, params)])[0]
+        if isinstance(result, RpcError):
+            raise result
+        return result
+
+    def batch(self, calls):
+        """Send (method, params) calls in one request; errors are returned as RpcError."""
+        requests = [{"jsonrpc": "2.0", "id": next(self.ids), "method": method, "params": params}
+                    for method, params in calls]
+        self.file.write(json.dumps(requests).encode("utf-8") + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("MetaNotes server closed the connection")
+        responses = json.loads(line)
+        if isinstance(responses, dict):
+            raise RpcError(responses["error"]["code"], responses["error"]["message"])
+        by_id = {response.get("id"): response for response in responses}
+        results = []
+        for request in requests:
+            response = by_id.get(request["id"], {"error": {"code": -32603, "message": "No response"}})
+            if "error" in response:
+                results.append(RpcError(response["error"]["code"], response["error"]["message"]))
+            else:
+                results.append(response["result"])
+        return results
+
+def serve(roots, port=RPC_DEFAULT_PORT):
+    """Run the RPC server without the window until interrupted."""
+    store = NoteStore(roots)
+    server = RpcServer(store, port)
+    print(f"MetaNotes serving {', '.join(store.roots)} on {RPC_HOST}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.remove_token()
+        store.close()
+
+# --- Workspace ---
+NOTE_CACHE_FOLDERS = 16  # Folders kept loaded besides the ones with open tabs
+
+class FolderNotes:
+    """Notes of one loaded folder with the indexes and history built on them."""
+    __slots__ = ("folder", "notes", "stat", "text_index", "facet_index", "history", "size", "blobs")
+
+    def __init__(self, folder, notes):
+        self.folder = folder
+        self.notes = notes
+        self.stat = notes_file_stat(folder)
+        self.measure()
+        self.text_index = None  # Built on the first structured text search
+        self.facet_index = FacetIndex.build(notes)
+        self.history = NoteHistory(folder)
+
+    def measure(self):
+        """Recount the estimated size of the string bodies; blobs are counted when asked, as they load lazily."""
+        self.blobs = [(name, value) for name, value in self.notes.items() if isinstance(value, BlobNote)]
+        self.size = sum(note_size(value) for name, value in self.notes.items()
+                        if name != "_meta" and not isinstance(value, BlobNote))
+
+    def memory(self):
+        return self.size + sum(note_size(blob) for _, blob in self.blobs)
+
+    def replace(self, notes):
+        """Take notes reread from disk in place, so whoever holds this state sees them; returns the old notes."""
+        previous = dict(self.notes)
+        self.notes.clear()
+        self.notes.update(notes)
+        self.stat = notes_file_stat(self.folder)
+        self.measure()
+        self.text_index = None
+        self.facet_index = FacetIndex.build(self.notes)
+        return previous
+
+class TabState:
+    """State of one editor tab; the placeholders of a restored session have no widget yet."""
+    __slots__ = ("folder", "name", "frame", "text_widget", "modified", "saved_hash", "saved_size",
+                 "loading", "preview", "preview_bar", "view", "highlight")
+
+    def __init__(self, folder, name, frame, text_widget=None, content="", loading=False, preview=False, view=None):
+        self.folder = sys.intern(folder)
+        self.name = sys.intern(name)
+        self.frame = frame
+        self.text_widget = text_widget
+        self.modified = False
+        self.mark_saved(content)
+        self.loading = loading
+        self.preview = preview
+        self.preview_bar = None
+        self.view = view
+        self.highlight = None
+
+    def mark_saved(self, text):
+        """Remember the saved text by digest and length instead of keeping a second copy."""
+        self.saved_hash = note_hash(text)
+        self.saved_size = len(text)
+
+    def differs(self, text):
+        return len(text) != self.saved_size or note_hash(text) != self.saved_hash
+
+class NoteCache:
+    """Loaded folders shared by the Explorer, the tabs and the RPC server.
+
+    Revisiting a folder reuses its notes and indexes unless its notes file was
+    changed by someone else; it is then reread into the same FolderNotes and
+    on_reload(state, previous notes) is called. The least recently used folders
+    are evicted, except the ones in use (current folder, open tabs).
+    """
+    def __init__(self, capacity=NOTE_CACHE_FOLDERS, on_reload=None):
+        self.capacity = capacity
+        self.folders = OrderedDict()
+        self.on_reload = on_reload
+
+    def get(self, folder):
+        return self.folders.get(os.path.abspath(folder))
+
+    def load(self, folder, in_use=()):
+        folder = os.path.abspath(folder)
+        state = self.folders.get(folder)
+        if state is not None and state.stat == notes_file_stat(folder):
+            self.folders.move_to_end(folder)
+            return state
+        notes = read_notes_file(folder)
+        if notes is None:
+            notes = {"_meta": {"created": datetime.now().isoformat()}}
+        if state is None:
+            state = self.folders[folder] = FolderNotes(folder, notes)
+        else:
+            previous = state.replace(notes)
+            if self.on_reload:
+                self.on_reload(state, previous)
+        self.folders.move_to_end(folder)
+        self.evict(set(in_use) | {folder})
+        return state
+
+    def evict(self, in_use=()):
+        for folder in list(self.folders):
+            if len(self.folders) <= self.capacity:
                 break
-            y = dline[1]
-            line_num = str(i).split(".")[0]
-            self.create_text(2, y, anchor="nw", text=line_num, fill="grey", font=self.font)
-            i = self.text_widget.index("%s+1line" % i)
+            if folder not in in_use:
+                del self.folders[folder]
 
-class CustomText(ttk.Frame):
-    def __init__(self, *args, **kwargs):
-        ttk.Frame.__init__(self, *args, **kwargs)
-        
-        # Text widget - wrap mode will be set by the application
-        self.text = tk.Text(
-            self, 
-            wrap='none',  # Default to no wrap, will be configured by app
-            undo=True, 
-            font=("Consolas", 11),
-            selectbackground="#3d7aab",
-            inactiveselectbackground="#3d7aab"
-        )
-        
-        # Line numbers
-        self.line_numbers = TextLineNumbers(self, width=40)
-        self.line_numbers.attach(self.text)
-        
-        # Scrollbar
-        self.v_scrollbar = AutoScrollbar(self, orient="vertical", command=self.text.yview)
-        self.text.configure(yscrollcommand=self.v_scrollbar.set)
-        
-        # Horizontal scrollbar for when wrap is disabled
-        self.h_scrollbar = AutoScrollbar(self, orient="horizontal", command=self.text.xview)
-        self.text.configure(xscrollcommand=self.h_scrollbar.set)
-        
-        # Layout
-        self.line_numbers.grid(row=0, column=0, sticky="ns")
-        self.text.grid(row=0, column=1, sticky="nsew")
-        self.v_scrollbar.grid(row=0, column=2, sticky="ns")
-        self.h_scrollbar.grid(row=1, column=1, sticky="ew")
-        
-        self.grid_rowconfigure(0, weight=1)
-        self.grid_columnconfigure(1, weight=1)
-        
-        # Bind events
-        self.text.bind("<KeyRelease>", self.on_key_release)
-        self.text.bind("<Button-1>", self.on_key_release)
-        self.text.bind("<MouseWheel>", self.on_key_release)
-        
-    def on_key_release(self, event=None):
-        self.line_numbers.redraw()
-        
-    def get(self, *args, **kwargs):
-        return self.text.get(*args, **kwargs)
-        
-    def insert(self, *args, **kwargs):
-        result = self.text.insert(*args, **kwargs)
-        self.on_key_release()
-        return result
-        
-    def delete(self, *args, **kwargs):
-        result = self.text.delete(*args, **kwargs)
-        self.on_key_release()
-        return result
-        
-    def index(self, *args, **kwargs):
-        return self.text.index(*args, **kwargs)
-        
-    def bind(self, *args, **kwargs):
-        return self.text.bind(*args, **kwargs)
-        
-    def edit_undo(self, *args, **kwargs):
-        result = self.text.edit_undo(*args, **kwargs)
-        self.on_key_release()
-        return result
-        
-    def edit_redo(self, *args, **kwargs):
-        result = self.text.edit_redo(*args, **kwargs)
-        self.on_key_release()
-        return result
-        
-    def edit_modified(self, *args, **kwargs):
-        return self.text.edit_modified(*args, **kwargs)
-        
-    def edit_reset(self, *args, **kwargs):
-        return self.text.edit_reset(*args, **kwargs)
-        
-    def config(self, *args, **kwargs):
-        return self.text.config(*args, **kwargs)
+# --- Memory budget ---
+DEFAULT_MEMORY_BUDGET_MB = 256
+MEMORY_CHECK_MS = 60000
+# Estimated bytes per item, measured with sys.getsizeof on 64-bit CPython
+NOTE_ENTRY_BYTES = 120  # Dict slot and name of a note, besides its body
+INDEX_ENTRY_BYTES = 250  # One (token, name) pair of a TextIndex or FacetIndex
+LISTING_ENTRY_BYTES = 360  # EntryInfo, listing dicts and fuzzy filter key of one file
+SEARCH_HIT_BYTES = 200
 
-# --- Utility functions ---
-def atomic_write_json(path, data):
-    dir_name = os.path.dirname(path)
-    with tempfile.NamedTemporaryFile("w", dir=dir_name, delete=False, encoding="utf-8") as tmp:
-        json.dump(data, tmp, ensure_ascii=False, indent=2)
-        tmp.flush()
-        os.fsync(tmp.fileno())
-        temp_name = tmp.name
-    os.replace(temp_name, path)
+def note_size(value):
+    """Estimated bytes of one note body; blob bodies count only while loaded."""
+    if isinstance(value, BlobNote):
+        return sys.getsizeof(value) + (sys.getsizeof(value.load()) if value.loaded else 0)
+    return NOTE_ENTRY_BYTES + sys.getsizeof(value)
 
-def set_hidden(filepath, hidden=True):
-    if os.name != 'nt':
-        base = os.path.basename(filepath)
-        dir_name = os.path.dirname(filepath)
-        if hidden and not base.startswith('.'):
-            os.rename(filepath, os.path.join(dir_name, '.' + base))
-        elif not hidden and base.startswith('.'):
-            os.rename(filepath, os.path.join(dir_name, base[1:]))
-    else:
-        FILE_ATTRIBUTE_HIDDEN = 0x02
-        attrs = ctypes.windll.kernel32.GetFileAttributesW(str(filepath))
-        if hidden:
-            ctypes.windll.kernel32.SetFileAttributesW(str(filepath), attrs | FILE_ATTRIBUTE_HIDDEN)
-        else:
-            ctypes.windll.kernel32.SetFileAttributesW(str(filepath), attrs & ~FILE_ATTRIBUTE_HIDDEN)
+def notes_size(notes):
+    return sum(note_size(value) for name, value in notes.items() if name != "_meta")
 
-def get_app_folder():
-    # If we're in a PyInstaller bundle
-    if getattr(sys, 'frozen', False):
-        return os.path.dirname(sys.executable)
-    else:
-        return os.path.dirname(os.path.abspath(__file__))
+def index_size(index):
+    return index.entries * INDEX_ENTRY_BYTES if index is not None else 0
 
 # --- Application ---
 class MetaNotesApp:
@@ -180,18 +3143,55 @@ class MetaNotesApp:
 
         # --- Variables ---
         self.current_folder = None
-        self.notes = {}
-        self.open_tabs = {}
-        self.display_to_real_name = {}
+        self.folder_state = None
+        self.note_cache = NoteCache(on_reload=self.on_notes_reloaded)
+        self.workspace_roots = []
+        self.open_tabs = {}  # Keyed by full path, so tabs of several folders can stay open
+        self.placeholder_tabs = {}  # Restored tabs not built yet, keyed like open_tabs
+        self.saved_session = None
+        self.sort_column = "name"
+        self.sort_reverse = False
+        self.visible_entries = []
+        self.visible_index = {}
         self.current_panel = "explorer"
         self.themes = ["superhero", "darkly", "solar", "cyborg", "vapor"]
         self.current_theme = "superhero"
         self.auto_save = True
+        self.auto_save_interval = DEFAULT_AUTO_SAVE_INTERVAL
         self.word_wrap = True
+        self.dedupe_notes = False
+        self.blob_threshold_kb = DEFAULT_BLOB_THRESHOLD_KB
+        self.preview_threshold_kb = DEFAULT_PREVIEW_THRESHOLD_KB
         self.font_size = 11
         self.font_family = "Consolas"
         self.search_history = []
         self.max_search_history = 10
+        self.catalog = None
+        self.catalog_task = None
+        self.word_count_job = None
+        self.coverage_task = None
+        self.checksum_task = None
+        self.sync_task = None
+        self.export_task = None
+        self.ingest_task = None
+        self.replace_task = None
+        self.memory_budget_mb = DEFAULT_MEMORY_BUDGET_MB
+        self.ingest_patterns = list(DEFAULT_INGEST_PATTERNS)
+        self.coverage_text = ""
+        self.search_hits = []
+        self.search_snippets = set()
+        self.search_pattern = None
+        self.search_stream = None
+        self.search_job = None
+        self.facet_choices = {}
+        self.entry_info = {}
+        self.entry_display_names = {}
+        self.file_filter_index = FuzzyFilter([])
+        self.filter_job = None  # after() id of the ranking in progress
+        self.filter_job_query = None
+        self.note_store = None
+        self.rpc_server = None
+        self.rpc_calls = queue.Queue()
 
         # --- Top frame (directory) ---
         self.top_frame = ttk.Frame(root, padding=10)
@@ -223,6 +3223,18 @@ class MetaNotesApp:
         )
         self.save_all_btn.pack(side=LEFT, padx=2)
 
+        self.history_btn = ttk.Button(
+            quick_actions_frame, text="🕘 History", bootstyle="info-outline",
+            command=self.show_history, width=12
+        )
+        self.history_btn.pack(side=LEFT, padx=2)
+
+        self.fields_btn = ttk.Button(
+            quick_actions_frame, text="🏷 Fields", bootstyle="info-outline",
+            command=self.edit_fields, width=12
+        )
+        self.fields_btn.pack(side=LEFT, padx=2)
+
         # --- Status Bar ---
         self.status_bar = ttk.Frame(root, height=22)
         self.status_bar.pack(side=BOTTOM, fill=X)
@@ -260,7 +3272,20 @@ class MetaNotesApp:
                 width=15
             )
             btn.pack(fill=X, pady=2, padx=5)
-        
+
+        # Pinned roots of the workspace
+        workspace_frame = ttk.LabelFrame(self.toolbar_frame, text="Workspace", padding=5)
+        workspace_frame.pack(fill=X, pady=(10, 0), padx=5)
+        self.workspace_list = tk.Listbox(workspace_frame, height=5, width=15, exportselection=False)
+        self.workspace_list.pack(fill=X)
+        self.workspace_list.bind("<<ListboxSelect>>", self.open_workspace_root)
+        workspace_buttons = ttk.Frame(workspace_frame)
+        workspace_buttons.pack(fill=X, pady=(5, 0))
+        ttk.Button(workspace_buttons, text="📌 Pin", bootstyle="secondary-outline",
+                   command=self.pin_current_folder).pack(side=LEFT, fill=X, expand=True)
+        ttk.Button(workspace_buttons, text="Unpin", bootstyle="secondary-outline",
+                   command=self.unpin_workspace_root).pack(side=LEFT, fill=X, expand=True, padx=(2, 0))
+
         # Theme selector
         theme_frame = ttk.LabelFrame(self.toolbar_frame, text="Theme", padding=5)
         theme_frame.pack(fill=X, pady=10, padx=5)
@@ -293,33 +3318,39 @@ class MetaNotesApp:
         self.file_filter.pack(side=LEFT, fill=X, expand=True)
         self.file_filter.bind("<KeyRelease>", self.filter_file_list)
         
-        # File list with scrollbars
-        list_container = ttk.Frame(self.list_frame)
-        list_container.pack(fill=BOTH, expand=True, padx=5, pady=(0,5))
-        
-        self.file_listbox = tk.Listbox(
-            list_container, 
-            width=35, 
-            exportselection=0,
-            font=("Segoe UI", 10),
-            selectbackground="#3d7aab"
+        ttk.Label(filter_frame, text="Group:").pack(side=LEFT, padx=(10,5))
+        self.group_var = tk.StringVar(value=EXPLORER_GROUPS[0])
+        group_combo = ttk.Combobox(
+            filter_frame, textvariable=self.group_var,
+            values=EXPLORER_GROUPS, state="readonly", width=17
         )
-        self.file_listbox.grid(row=0, column=0, sticky="nsew")
+        group_combo.pack(side=LEFT)
+        group_combo.bind("<<ComboboxSelected>>", lambda e: self.filter_file_list())
 
-        self.v_scrollbar = AutoScrollbar(list_container, orient="vertical", command=self.file_listbox.yview)
-        self.v_scrollbar.grid(row=0, column=1, sticky="ns")
-        self.file_listbox.config(yscrollcommand=self.v_scrollbar.set)
+        ttk.Label(filter_frame, text="Facet:").pack(side=LEFT, padx=(10,5))
+        self.facet_var = tk.StringVar(value="All")
+        self.facet_combo = ttk.Combobox(
+            filter_frame, textvariable=self.facet_var,
+            values=["All"], state="readonly", width=22
+        )
+        self.facet_combo.pack(side=LEFT)
+        self.facet_combo.bind("<<ComboboxSelected>>", lambda e: self.filter_file_list())
 
-        self.h_scrollbar = AutoScrollbar(list_container, orient="horizontal", command=self.file_listbox.xview)
-        self.h_scrollbar.grid(row=1, column=0, sticky="ew")
-        self.file_listbox.config(xscrollcommand=self.h_scrollbar.set)
+        # File list with note, size and modification columns
+        self.file_columns = ColumnListbox(
+            self.list_frame,
+            [("name", "Name", 30, True), ("note", "Note", 4, False),
+             ("size", "Size", 9, False), ("modified", "Modified", 16, False)],
+            on_heading=self.sort_file_list,
+            font=("Segoe UI", 10),
+            selectbackground="#3d7aab"
+        )
+        self.file_columns.pack(fill=BOTH, expand=True, padx=5, pady=(0,5))
 
-        list_container.rowconfigure(0, weight=1)
-        list_container.columnconfigure(0, weight=1)
-        self.file_listbox.bind("<Double-Button-1>", self.open_selected_file)
-        self.file_listbox.bind("<<ListboxSelect>>", self.on_file_select)
-        self.file_listbox.bind("<Double-Button-2>", self.open_selected_folder)
-        self.file_listbox.bind("<Control-Button-2>", self.open_previous_folder)
+        self.file_columns.bind("<Double-Button-1>", self.open_selected_file)
+        self.file_columns.bind("<<ListboxSelect>>", self.on_file_select)
+        self.file_columns.bind("<Double-Button-2>", self.open_selected_folder)
+        self.file_columns.bind("<Control-Button-2>", self.open_previous_folder)
 
         # --- Search panel ---
         self.search_frame = ttk.Frame(self.main_frame)
@@ -378,21 +3409,52 @@ class MetaNotesApp:
         )
         self.use_regex_cb.pack(side=LEFT, padx=5)
 
+        self.search_catalog_var = tk.BooleanVar(value=False)
+        self.search_catalog_cb = ttk.Checkbutton(
+            options_frame, text="Whole Catalog",
+            variable=self.search_catalog_var,
+            command=self.update_search_results
+        )
+        self.search_catalog_cb.pack(side=LEFT, padx=5)
+
         # Alt shortcuts to toggle checkboxes
         self.root.bind_all("<Alt-c>", lambda e: self.toggle_checkbox(self.match_case_var))
         self.root.bind_all("<Alt-w>", lambda e: self.toggle_checkbox(self.match_whole_var))
         self.root.bind_all("<Alt-r>", lambda e: self.toggle_checkbox(self.use_regex_var))
 
+        # Replace the matches of the search, with the same options
+        replace_frame = ttk.Frame(self.search_frame)
+        replace_frame.pack(fill=X, padx=5, pady=(0,5))
+        ttk.Label(replace_frame, text="Replace with:").pack(side=LEFT, padx=(0,5))
+        self.replace_entry = ttk.Entry(replace_frame)
+        self.replace_entry.pack(side=LEFT, fill=X, expand=True)
+        self.replace_tree_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            replace_frame, text="Whole Tree", variable=self.replace_tree_var
+        ).pack(side=LEFT, padx=5)
+        ttk.Button(
+            replace_frame, text="Replace...", bootstyle="warning-outline",
+            command=self.start_replace
+        ).pack(side=LEFT)
+
         # Results list with counter
         results_frame = ttk.Frame(self.search_frame)
         results_frame.pack(fill=BOTH, expand=True, padx=5, pady=5)
         
         self.results_count = ttk.Label(results_frame, text="0 results")
         self.results_count.pack(anchor="w", pady=(0,5))
-        
-        self.search_results = tk.Listbox(
-            results_frame, 
-            exportselection=0,
+
+        # Facet values of the folder with their counts; a click adds the term to the query
+        facets_frame = ttk.Labelframe(results_frame, text="Facets", padding=2)
+        facets_frame.pack(side=LEFT, fill=Y, padx=(0,5))
+        self.facet_list = tk.Listbox(facets_frame, width=24, exportselection=0, font=("Segoe UI", 9))
+        self.facet_list.pack(fill=BOTH, expand=True)
+        self.facet_list.bind("<<ListboxSelect>>", self.add_facet_to_query)
+
+        self.search_results = ColumnListbox(
+            results_frame,
+            [("name", "Note", 24, False), ("snippet", "Match", 40, True)],
+            on_scroll=self.render_visible_snippets,
             font=("Segoe UI", 10),
             selectbackground="#3d7aab"
         )
@@ -402,6 +3464,44 @@ class MetaNotesApp:
         # --- Stats panel ---
         self.stats_frame = ttk.Frame(self.main_frame)
         
+        stats_actions = ttk.Frame(self.stats_frame)
+        stats_actions.pack(fill=X, padx=20, pady=(10, 0))
+
+        ttk.Button(
+            stats_actions, text="🧾 Scan Coverage", bootstyle="info-outline",
+            command=self.start_coverage_scan
+        ).pack(side=LEFT, padx=(0, 5))
+        ttk.Button(
+            stats_actions, text="🔐 Checksums", bootstyle="info-outline",
+            command=self.start_checksum_scan
+        ).pack(side=LEFT, padx=(0, 5))
+        ttk.Button(
+            stats_actions, text="Verify", bootstyle="info-outline",
+            command=lambda: self.start_checksum_scan(verify=True)
+        ).pack(side=LEFT, padx=(0, 5))
+        ttk.Button(
+            stats_actions, text="🔁 Sync Tree...", bootstyle="info-outline",
+            command=self.start_tree_sync
+        ).pack(side=LEFT, padx=(0, 5))
+        ttk.Button(
+            stats_actions, text="📥 Ingest Sidecars", bootstyle="info-outline",
+            command=self.start_ingest
+        ).pack(side=LEFT, padx=(0, 5))
+        ttk.Button(
+            stats_actions, text="📤 Export...", bootstyle="info-outline",
+            command=self.start_export
+        ).pack(side=LEFT, padx=(0, 5))
+        ttk.Button(
+            stats_actions, text="Cancel", bootstyle="secondary-outline",
+            command=self.cancel_background_tasks
+        ).pack(side=LEFT)
+
+        self.checksum_tree_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            stats_actions, text="Include subfolders",
+            variable=self.checksum_tree_var
+        ).pack(side=LEFT, padx=10)
+
         stats_content = ttk.Frame(self.stats_frame)
         stats_content.pack(fill=BOTH, expand=True, padx=20, pady=20)
         
@@ -431,6 +3531,27 @@ class MetaNotesApp:
             command=self.toggle_auto_save
         )
         auto_save_cb.pack(anchor="w", pady=5)
+
+        interval_frame = ttk.Frame(prefs_content)
+        interval_frame.pack(fill=X, pady=5)
+
+        ttk.Label(interval_frame, text="Auto-save every (seconds):").pack(side=LEFT)
+        self.auto_save_interval_var = tk.IntVar(value=self.auto_save_interval)
+        interval_spin = ttk.Spinbox(
+            interval_frame,
+            from_=10,
+            to=3600,
+            increment=10,
+            width=6,
+            textvariable=self.auto_save_interval_var,
+            command=self.change_auto_save_interval
+        )
+        interval_spin.pack(side=LEFT, padx=5)
+        interval_spin.bind("<Return>", lambda e: self.change_auto_save_interval())
+        ttk.Label(
+            interval_frame, text="(unsaved edits are journaled for crash recovery)",
+            font=("Segoe UI", 8)
+        ).pack(side=LEFT)
         
         # Word wrap
         self.word_wrap_var = tk.BooleanVar(value=self.word_wrap)
@@ -441,6 +3562,70 @@ class MetaNotesApp:
             command=self.toggle_word_wrap
         )
         word_wrap_cb.pack(anchor="w", pady=5)
+
+        # Deduplicated storage
+        self.dedupe_notes_var = tk.BooleanVar(value=self.dedupe_notes)
+        dedupe_cb = ttk.Checkbutton(
+            prefs_content,
+            text="Store identical notes once (deduplicated format)",
+            variable=self.dedupe_notes_var,
+            command=self.toggle_dedupe_notes
+        )
+        dedupe_cb.pack(anchor="w", pady=5)
+
+        # Blob threshold
+        blob_frame = ttk.Frame(prefs_content)
+        blob_frame.pack(fill=X, pady=5)
+
+        ttk.Label(blob_frame, text="Store notes larger than (KB) in separate files (0 = off):").pack(side=LEFT)
+        self.blob_threshold_var = tk.IntVar(value=self.blob_threshold_kb)
+        blob_spin = ttk.Spinbox(
+            blob_frame,
+            from_=0,
+            to=100000,
+            increment=64,
+            width=7,
+            textvariable=self.blob_threshold_var,
+            command=self.change_blob_threshold
+        )
+        blob_spin.pack(side=LEFT, padx=5)
+        blob_spin.bind("<Return>", lambda e: self.change_blob_threshold())
+
+        # Read-only preview threshold
+        preview_frame = ttk.Frame(prefs_content)
+        preview_frame.pack(fill=X, pady=5)
+
+        ttk.Label(preview_frame, text="Open notes larger than (KB) as read-only preview:").pack(side=LEFT)
+        self.preview_threshold_var = tk.IntVar(value=self.preview_threshold_kb)
+        preview_spin = ttk.Spinbox(
+            preview_frame,
+            from_=0,
+            to=100000,
+            increment=256,
+            width=7,
+            textvariable=self.preview_threshold_var,
+            command=self.change_preview_threshold
+        )
+        preview_spin.pack(side=LEFT, padx=5)
+        preview_spin.bind("<Return>", lambda e: self.change_preview_threshold())
+
+        # Memory budget
+        memory_frame = ttk.Frame(prefs_content)
+        memory_frame.pack(fill=X, pady=5)
+
+        ttk.Label(memory_frame, text="Memory budget for notes, tabs and indexes (MB):").pack(side=LEFT)
+        self.memory_budget_var = tk.IntVar(value=self.memory_budget_mb)
+        memory_spin = ttk.Spinbox(
+            memory_frame,
+            from_=16,
+            to=65536,
+            increment=64,
+            width=7,
+            textvariable=self.memory_budget_var,
+            command=self.change_memory_budget
+        )
+        memory_spin.pack(side=LEFT, padx=5)
+        memory_spin.bind("<Return>", lambda e: self.change_memory_budget())
         
         # Font size
         font_frame = ttk.Frame(prefs_content)
@@ -459,6 +3644,39 @@ class MetaNotesApp:
         font_size_spin.pack(side=LEFT, padx=5)
         font_size_spin.bind("<Return>", lambda e: self.change_font_size())
 
+        # Sidecar files merged by Ingest Sidecars
+        ingest_frame = ttk.Frame(prefs_content)
+        ingest_frame.pack(fill=X, pady=10)
+
+        ttk.Label(ingest_frame, text="Sidecar patterns:").pack(side=LEFT)
+        self.ingest_patterns_var = tk.StringVar(value=", ".join(self.ingest_patterns))
+        ingest_entry = ttk.Entry(ingest_frame, textvariable=self.ingest_patterns_var, width=30)
+        ingest_entry.pack(side=LEFT, padx=5)
+        ingest_entry.bind("<Return>", self.change_ingest_patterns)
+        ingest_entry.bind("<FocusOut>", self.change_ingest_patterns)
+
+        # Tree catalog
+        catalog_frame = ttk.LabelFrame(prefs_content, text="Tree Catalog", padding=5)
+        catalog_frame.pack(fill=X, pady=10)
+
+        self.catalog_label = ttk.Label(catalog_frame, text="No catalog")
+        self.catalog_label.pack(anchor="w", pady=(0, 5))
+
+        catalog_buttons = ttk.Frame(catalog_frame)
+        catalog_buttons.pack(fill=X)
+        ttk.Button(
+            catalog_buttons, text="Build for Current Folder", bootstyle="info-outline",
+            command=self.build_catalog
+        ).pack(side=LEFT, padx=(0, 5))
+        ttk.Button(
+            catalog_buttons, text="Update", bootstyle="info-outline",
+            command=lambda: self.build_catalog(self.catalog.root if self.catalog else None)
+        ).pack(side=LEFT, padx=(0, 5))
+        ttk.Button(
+            catalog_buttons, text="Disable", bootstyle="secondary-outline",
+            command=self.disable_catalog
+        ).pack(side=LEFT)
+
         # --- Notebook (tabs) ---
         self.notebook_frame = ttk.Frame(self.paned)
         self.paned.add(self.notebook_frame, weight=4)
@@ -477,16 +3695,82 @@ class MetaNotesApp:
         self.root.bind_all("<Control-Shift-Z>", self.ctrl_y)
         self.root.bind_all("<Control-Shift-F>", lambda e: self.show_search())
         self.root.bind_all("<Control-w>", self.ctrl_w)
+        self.root.bind_all("<Control-h>", lambda e: self.show_history())
+        self.root.bind_all("<Control-t>", lambda e: self.edit_fields())
         self.root.bind_all("<F5>", lambda e: self.refresh_file_list())
 
         # --- Load config ---
         self.load_config()
         self.load_last_folder()
+        self.restore_session()
         self.apply_theme(self.current_theme)
+
+        # Crash recovery journal
+        self.journal = RecoveryJournal(os.path.join(get_app_folder(), JOURNAL_DIRNAME))
+        self.journal_dirty = set()
+        self.journal_job = None
+        self.root.after_idle(self.offer_recovery)
         
         # Auto-save timer
         if self.auto_save:
-            self.root.after(30000, self.auto_save_timer)  # Save every 30 seconds
+            self.root.after(self.auto_save_interval * 1000, self.auto_save_timer)
+        self.root.after(MEMORY_CHECK_MS, self.memory_check_timer)
+
+    # --- Current folder state ---
+    # The notes and indexes of the current folder live in its NoteCache entry
+    @property
+    def notes(self):
+        return self.folder_state.notes if self.folder_state else {}
+
+    @property
+    def text_index(self):
+        return self.folder_state.text_index if self.folder_state else None
+
+    @text_index.setter
+    def text_index(self, index):
+        self.folder_state.text_index = index
+
+    @property
+    def facet_index(self):
+        return self.folder_state.facet_index if self.folder_state else FacetIndex()
+
+    @facet_index.setter
+    def facet_index(self, index):
+        self.folder_state.facet_index = index
+
+    @property
+    def history(self):
+        return self.folder_state.history
+
+    def folders_in_use(self):
+        folders = {tab_data.folder for tab_data in self.open_tabs.values()}
+        if self.current_folder:
+            folders.add(os.path.abspath(self.current_folder))
+        return folders
+
+    def load_folder_state(self, folder):
+        return self.note_cache.load(folder, self.folders_in_use())
+
+    def on_notes_reloaded(self, state, previous):
+        """Bring the tabs of a folder whose notes file changed on disk up to date, and warn about unsaved ones."""
+        conflicts = []
+        for filename, tab_data in self.open_tabs.items():
+            if tab_data.folder != state.folder:
+                continue
+            text = note_text(state.notes.get(tab_data.name, ""))
+            if tab_data.modified:
+                if text != note_text(previous.get(tab_data.name, "")):
+                    conflicts.append(tab_data.name)
+            elif tab_data.differs(text):
+                self.replace_tab_text(filename, text)
+                tab_data.mark_saved(tab_data.text_widget.get("1.0", 'end').strip())
+                tab_data.modified = False
+                self.update_tab_title(filename)
+        if conflicts:
+            self.root.after_idle(lambda: messagebox.showwarning(
+                "Notes changed",
+                f"The notes file of '{state.folder}' was changed outside MetaNotes.\n"
+                f"These tabs have unsaved edits; saving them will replace the other version: {', '.join(conflicts)}"))
 
     # --- Window closing handler ---
     def on_closing(self):
@@ -495,10 +3779,13 @@ class MetaNotesApp:
         
         # Find all modified files
         for filename, tab_data in self.open_tabs.items():
-            if tab_data["modified"]:
+            if tab_data.modified:
                 modified_files.append(filename)
         
         if not modified_files:
+            self.save_config()  # Session snapshot
+            self.stop_server()
+            self.journal.clear()
             self.root.destroy()
             return
         
@@ -516,8 +3803,114 @@ class MetaNotesApp:
                 self.save_tab_content(filename)
             # No - don't save and continue to next file
         
+        self.save_config()
+        self.stop_server()
+        self.journal.clear()
         self.root.destroy()
 
+    # --- RPC server ---
+    def start_server(self, port=RPC_DEFAULT_PORT, roots=None):
+        """Serve the notes of roots (the current folder by default) alongside the window."""
+        roots = roots or [self.current_folder]
+        fmt, threshold = self.notes_format()
+        self.note_store = NoteStore(roots, fmt, threshold, execute=self.call_on_ui, app=self)
+        try:
+            self.rpc_server = RpcServer(self.note_store, port)
+        except OSError as e:
+            self.note_store = None
+            messagebox.showerror("Error", f"Unable to serve on port {port}: {e}")
+            return
+        self.rpc_server.start()
+        self.root.after(RPC_POLL_MS, self.poll_rpc_calls)
+        self.status_label.config(text=f"Serving notes on {RPC_HOST}:{self.rpc_server.port}")
+
+    def stop_server(self):
+        if self.rpc_server:
+            self.rpc_server.stop()
+            self.rpc_server = None
+            self.poll_rpc_calls()  # Answer the calls already queued
+            self.note_store.close()
+            self.note_store = None
+
+    def call_on_ui(self, fn):
+        """Run fn on the Tk thread and wait for its result; called from RPC threads."""
+        future = concurrent.futures.Future()
+        self.rpc_calls.put((fn, future))
+        return future.result()
+
+    def poll_rpc_calls(self):
+        while True:
+            try:
+                fn, future = self.rpc_calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                future.set_result(fn())
+            except Exception as e:
+                future.set_exception(e)
+        if self.rpc_server:
+            self.root.after(RPC_POLL_MS, self.poll_rpc_calls)
+
+    def apply_external_notes(self, notes, skip_busy=False, folder=None):
+        """Apply notes changed outside the editor to a loaded folder (the current one by default) and its open tabs.
+
+        Tabs with unsaved edits (or still loading) raise an RpcError, or keep
+        their text when skip_busy is set; the names skipped are returned.
+        """
+        state = self.load_folder_state(folder) if folder else self.folder_state
+        keys = {name: os.path.join(state.folder, name) for name in notes}
+        busy = [name for name, key in keys.items() if key in self.open_tabs
+                and (self.open_tabs[key].modified or self.open_tabs[key].loading)]
+        if busy and not skip_busy:
+            raise RpcError(-32001, f"Unsaved edits in MetaNotes for: {', '.join(busy)}")
+        for name, text in notes.items():
+            if name in busy:
+                continue
+            if text is None:
+                state.notes.pop(name, None)
+                if state.text_index is not None:
+                    state.text_index.remove(name)
+                text = ""
+            else:
+                self.set_note(name, str(text), state)
+            key = keys[name]
+            if key in self.open_tabs:
+                tab_data = self.open_tabs[key]
+                self.replace_tab_text(key, text)
+                tab_data.mark_saved(tab_data.text_widget.get("1.0", 'end').strip())
+                tab_data.modified = False
+                self.journal_saved(key)
+                self.update_tab_title(key)
+            if state is self.folder_state:
+                self.refresh_entry_row(name)
+        return busy
+
+    def apply_folder_notes(self, folder, notes):
+        """Save notes computed by a background task for folder, through the note cache and open tabs when loaded.
+
+        Returns the new stat of the notes file and the names left as they were
+        because their tab has unsaved edits.
+        """
+        state = self.note_cache.get(folder)
+        if state is None:
+            write_notes_file(folder, notes, *self.notes_format())
+            return notes_file_stat(folder), []
+        changed = {name: note_text(value) for name, value in notes.items()
+                   if name != "_meta" and note_text(state.notes.get(name, "")) != note_text(value)}
+        changed.update({name: None for name in state.notes if name != "_meta" and name not in notes})
+        busy = self.apply_external_notes(changed, skip_busy=True, folder=state.folder)
+        meta = state.notes.setdefault("_meta", {})
+        for key in (FIELDS_KEY, TAGS_KEY):
+            if key in notes.get("_meta", {}):
+                meta[key] = notes["_meta"][key]
+            else:
+                meta.pop(key, None)
+        state.facet_index = FacetIndex.build(state.notes)
+        if state is self.folder_state:
+            self.refresh_facets()
+        self.write_folder_notes(state)
+        return state.stat, busy
+
     # --- Placeholder Search ---
     def clear_search_placeholder(self):
         if self.search_entry.get() == "Search...":
@@ -538,20 +3931,97 @@ class MetaNotesApp:
     def auto_save_timer(self):
         if self.auto_save:
             self.save_all_tabs(silent=True)
-        self.root.after(30000, self.auto_save_timer)  # Repeat every 30 seconds
+            self.save_config()  # Keeps the session snapshot recent
+        self.root.after(self.auto_save_interval * 1000, self.auto_save_timer)
+
+    def change_auto_save_interval(self, event=None):
+        """Update the delay between full saves, used from the next timer tick."""
+        try:
+            self.auto_save_interval = max(10, int(self.auto_save_interval_var.get()))
+        except (tk.TclError, ValueError):
+            return
+        self.save_config()
+
+    # --- Recovery journal ---
+    def schedule_journal(self, filename):
+        """Journal the tab once the editor has been idle for JOURNAL_IDLE_MS."""
+        self.journal_dirty.add(filename)
+        if self.journal_job:
+            self.root.after_cancel(self.journal_job)
+        self.journal_job = self.root.after(JOURNAL_IDLE_MS, self.flush_journal)
+
+    def flush_journal(self):
+        self.journal_job = None
+        dirty, self.journal_dirty = self.journal_dirty, set()
+        try:
+            if self.journal.size > JOURNAL_COMPACT_SIZE:
+                # Keep only the latest content of the modified tabs
+                self.journal.rewrite(
+                    (tab_data.folder, tab_data.name, tab_data.text_widget.get("1.0", 'end').strip())
+                    for tab_data in self.open_tabs.values() if tab_data.modified)
+                return
+            for filename in dirty:
+                tab_data = self.open_tabs.get(filename)
+                if tab_data and tab_data.modified:
+                    self.journal.record(tab_data.folder, tab_data.name, tab_data.text_widget.get("1.0", 'end').strip())
+        except OSError as e:
+            print(f"Journal write error: {e}")
+
+    def journal_saved(self, filename):
+        """Forget a saved note, and the whole journal once nothing is left unsaved."""
+        self.journal_dirty.discard(filename)
+        try:
+            if any(tab_data.modified for tab_data in self.open_tabs.values()):
+                self.journal.discard(*os.path.split(filename))
+            else:
+                self.journal.clear()
+        except OSError as e:
+            print(f"Journal write error: {e}")
+
+    def offer_recovery(self):
+        """Offer to restore unsaved edits journaled by a session that crashed."""
+        paths = self.journal.orphans()
+        pending = {}
+        for path in sorted(paths):
+            pending.update(RecoveryJournal.read(path))
+        pending = {key: text for key, text in pending.items() if key[0] and key[1]}
+        if pending:
+            names = "\n".join(f"• {name}" for _, name in list(pending)[:10])
+            if messagebox.askyesno(
+                "Recover Unsaved Changes?",
+                f"MetaNotes was not closed properly. {len(pending)} unsaved note(s) can be recovered:\n{names}\n\nRestore them?"
+            ):
+                self.restore_journal(pending)
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def restore_journal(self, pending):
+        """Reopen recovered notes as modified tabs, whatever their folder."""
+        for (folder, name), text in pending.items():
+            if os.path.isdir(folder):
+                try:
+                    filename = self.open_note(folder, name)
+                    self.replace_tab_text(filename, text)
+                except Exception as e:
+                    print(f"Recovery error in {folder}: {e}")
+        self.status_label.config(text=f"Recovered {len(pending)} note(s)")
 
     def toggle_auto_save(self):
         """Enable or disable auto-save."""
         self.auto_save = self.auto_save_var.get()
         if self.auto_save:
             self.auto_save_timer()
+        self.save_config()
 
     # --- Word wrap ---
     def toggle_word_wrap(self):
         self.word_wrap = self.word_wrap_var.get()
         wrap_mode = 'word' if self.word_wrap else 'none'
         for tab_data in self.open_tabs.values():
-            text_widget = tab_data["text_widget"]
+            text_widget = tab_data.text_widget
             text_widget.text.config(wrap=wrap_mode)
             # Show/hide horizontal scrollbar based on wrap mode
             if wrap_mode == 'none':
@@ -559,13 +4029,115 @@ class MetaNotesApp:
             else:
                 text_widget.h_scrollbar.grid_remove()
 
+    # --- Deduplicated storage ---
+    def toggle_dedupe_notes(self):
+        """Switch the storage format used when the notes file is written."""
+        self.dedupe_notes = self.dedupe_notes_var.get()
+        self.save_config()
+        if self.current_folder:
+            self.save_notes_all()
+
+    def change_blob_threshold(self, event=None):
+        """Update the size above which notes are externalized (0 disables it)."""
+        try:
+            self.blob_threshold_kb = max(0, int(self.blob_threshold_var.get()))
+        except (tk.TclError, ValueError):
+            return
+        self.save_config()
+
+    def change_memory_budget(self, event=None):
+        try:
+            self.memory_budget_mb = max(16, int(self.memory_budget_var.get()))
+        except (tk.TclError, ValueError):
+            return
+        self.save_config()
+        self.enforce_memory_budget()
+
+    def change_preview_threshold(self, event=None):
+        """Update the size above which notes open read-only (0 disables it)."""
+        try:
+            self.preview_threshold_kb = max(0, int(self.preview_threshold_var.get()))
+        except (tk.TclError, ValueError):
+            return
+        self.save_config()
+
+    # --- Tree catalog ---
+    def open_catalog(self, root):
+        """Open the existing catalog of root, if any."""
+        if self.catalog:
+            self.catalog.close()
+            self.catalog = None
+        if root and os.path.exists(os.path.join(root, CATALOG_FILENAME)):
+            try:
+                self.catalog = NoteCatalog(root)
+            except sqlite3.Error as e:
+                print(f"Catalog open error: {e}")
+        self.update_catalog_label()
+
+    def update_catalog_label(self, text=None):
+        if not hasattr(self, 'catalog_label'):
+            return
+        if text is None:
+            text = f"Catalog: {self.catalog.root}" if self.catalog else "No catalog"
+        self.catalog_label.config(text=text)
+
+    def build_catalog(self, root=None):
+        """Crawl root (the current folder by default) in the background into its catalog."""
+        root = root or self.current_folder
+        if not root:
+            return
+        if self.catalog_task and self.catalog_task.running:
+            messagebox.showinfo("Catalog", "A catalog build is already running.")
+            return
+        try:
+            if not self.catalog or self.catalog.root != os.path.abspath(root):
+                if self.catalog:
+                    self.catalog.close()
+                self.catalog = NoteCatalog(root)
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"Unable to create the catalog: {e}")
+            return
+        catalog = self.catalog
+
+        def run(task):
+            return catalog.build(
+                cancel=task.cancel_event,
+                progress=lambda count, rel: count % 100 == 0 and task.post(count))
+
+        def on_message(count):
+            self.update_catalog_label(f"Building catalog: {count} folders...")
+
+        def on_done(count, error):
+            if catalog is not self.catalog:
+                return  # Disabled while building
+            if error:
+                messagebox.showerror("Error", f"Catalog build failed: {error}")
+                self.update_catalog_label()
+                return
+            self.update_catalog_label(f"Catalog: {catalog.root} ({count} folders)")
+            self.status_label.config(text=f"Catalog built: {count} folders")
+            self.save_config()
+            self.populate_file_list()
+
+        self.catalog_task = BackgroundTask(self.root, run, on_message, on_done).start()
+        self.status_label.config(text=f"Building catalog for {root}...")
+
+    def disable_catalog(self):
+        if self.catalog_task and self.catalog_task.running:
+            self.catalog_task.cancel()
+        if self.catalog:
+            self.catalog.close()
+            self.catalog = None
+        self.update_catalog_label()
+        self.save_config()
+
     # --- Font size ---
     def change_font_size(self, event=None):
         """Update font size for all open tabs and apply to new tabs."""
         self.font_size = self.font_size_var.get()
         font = (self.font_family, self.font_size)
         for tab_data in self.open_tabs.values():
-            text_widget = tab_data["text_widget"]
+            text_widget = tab_data.text_widget
             text_widget.text.config(font=font)
             # Update the line numbers canvas font too
             text_widget.line_numbers.font = font
@@ -586,10 +4158,19 @@ class MetaNotesApp:
                     # Charger les valeurs avec des valeurs par défaut
                     self.current_theme = config.get("theme", "superhero")
                     self.auto_save = config.get("auto_save", True)
+                    self.auto_save_interval = config.get("auto_save_interval", DEFAULT_AUTO_SAVE_INTERVAL)
                     self.word_wrap = config.get("word_wrap", True)
+                    self.dedupe_notes = config.get("dedupe_notes", False)
+                    self.blob_threshold_kb = config.get("blob_threshold_kb", DEFAULT_BLOB_THRESHOLD_KB)
+                    self.preview_threshold_kb = config.get("preview_threshold_kb", DEFAULT_PREVIEW_THRESHOLD_KB)
                     self.font_size = config.get("font_size", 11)
                     self.font_family = config.get("font_family", "Consolas")
                     self.search_history = config.get("search_history", [])
+                    self.ingest_patterns = config.get("ingest_patterns", list(DEFAULT_INGEST_PATTERNS))
+                    self.workspace_roots = [root for root in config.get("workspace_roots", []) if os.path.isdir(root)]
+                    self.saved_session = config.get("session")
+                    self.memory_budget_mb = config.get("memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB)
+                    self.open_catalog(config.get("catalog_root"))
                     
                     # Charger le dernier dossier si disponible
                     last_folder = config.get("last_folder")
@@ -601,20 +4182,38 @@ class MetaNotesApp:
                 # Utiliser les valeurs par défaut en cas d'erreur
                 self.current_theme = "superhero"
                 self.auto_save = True
+                self.auto_save_interval = DEFAULT_AUTO_SAVE_INTERVAL
                 self.word_wrap = True
+                self.dedupe_notes = False
+                self.blob_threshold_kb = DEFAULT_BLOB_THRESHOLD_KB
+                self.preview_threshold_kb = DEFAULT_PREVIEW_THRESHOLD_KB
+                self.memory_budget_mb = DEFAULT_MEMORY_BUDGET_MB
                 self.font_size = 11
                 self.font_family = "Consolas"
                 self.search_history = []
+                self.ingest_patterns = list(DEFAULT_INGEST_PATTERNS)
         
         # Mettre à jour les widgets Tkinter s'ils existent
         if hasattr(self, 'theme_var'):
             self.theme_var.set(self.current_theme)
         if hasattr(self, 'auto_save_var'):
             self.auto_save_var.set(self.auto_save)
+        if hasattr(self, 'auto_save_interval_var'):
+            self.auto_save_interval_var.set(self.auto_save_interval)
         if hasattr(self, 'word_wrap_var'):
             self.word_wrap_var.set(self.word_wrap)
+        if hasattr(self, 'dedupe_notes_var'):
+            self.dedupe_notes_var.set(self.dedupe_notes)
+        if hasattr(self, 'blob_threshold_var'):
+            self.blob_threshold_var.set(self.blob_threshold_kb)
+        if hasattr(self, 'preview_threshold_var'):
+            self.preview_threshold_var.set(self.preview_threshold_kb)
+        if hasattr(self, 'memory_budget_var'):
+            self.memory_budget_var.set(self.memory_budget_mb)
         if hasattr(self, 'font_size_var'):
             self.font_size_var.set(self.font_size)
+        if hasattr(self, 'ingest_patterns_var'):
+            self.ingest_patterns_var.set(", ".join(self.ingest_patterns))
         
         # Appliquer le thème chargé
         if hasattr(self, 'root'):
@@ -627,9 +4226,18 @@ class MetaNotesApp:
             "theme": self.current_theme, 
             "last_folder": self.current_folder,
             "auto_save": self.auto_save,
+            "auto_save_interval": self.auto_save_interval,
             "word_wrap": self.word_wrap,
+            "dedupe_notes": self.dedupe_notes,
+            "blob_threshold_kb": self.blob_threshold_kb,
+            "preview_threshold_kb": self.preview_threshold_kb,
             "font_size": self.font_size,
-            "search_history": self.search_history[-self.max_search_history:]
+            "search_history": self.search_history[-self.max_search_history:],
+            "ingest_patterns": self.ingest_patterns,
+            "workspace_roots": self.workspace_roots,
+            "session": self.session_snapshot(),
+            "memory_budget_mb": self.memory_budget_mb,
+            "catalog_root": self.catalog.root if self.catalog else None
         }
         atomic_write_json(config_path, config)
 
@@ -651,7 +4259,7 @@ class MetaNotesApp:
         
         # Update notebook tabs background (optional, for modern look)
         for tab_data in self.open_tabs.values():
-            tab_data["text_widget"].text.config(
+            tab_data.text_widget.text.config(
                 background=self.root.style.colors.bg,
                 foreground=self.root.style.colors.fg,
                 insertbackground=self.root.style.colors.fg
@@ -687,26 +4295,118 @@ class MetaNotesApp:
         self.current_panel = "preferences"
         self.status_label.config(text="Mode: Preferences")
 
-    def hide_all_panels(self):
-        for panel in [self.list_frame, self.search_frame, self.stats_frame, self.prefs_frame]:
-            panel.pack_forget()
+    def hide_all_panels(self):
+        for panel in [self.list_frame, self.search_frame, self.stats_frame, self.prefs_frame]:
+            panel.pack_forget()
+
+    # --- File list filter ---
+    def filter_file_list(self, event=None):
+        filter_text = self.file_filter.get().strip()
+        if event is not None and filter_text == self.file_filter_index.last_query and filter_text:
+            return  # Keys that did not change the query (arrows, modifiers...)
+
+        if event is not None and filter_text and filter_text == self.filter_job_query:
+            return  # Already being ranked
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+            self.filter_job = None
+            self.filter_job_query = None
+
+        facet = self.facet_choices.get(self.facet_var.get())
+        allowed = self.facet_index.names(*facet) if facet else None
+        if filter_text:
+            # Fuzzy ranking takes precedence over the column sort; large folders
+            # are ranked a chunk at a time so typing stays responsive
+            ranking = self.file_filter_index.ranked(filter_text)
+            self.filter_job_query = filter_text
+            self.rank_file_list(ranking, allowed)
+        else:
+            self.file_filter_index.filter("")
+            names = self.sorted_entries()
+            if allowed is not None:
+                names = [name for name in names if name in allowed]
+            self.render_file_list(names)
+
+    def rank_file_list(self, ranking, allowed):
+        """Advance the fuzzy ranking for one frame, then reschedule or show the result."""
+        self.filter_job = None
+        deadline = time.perf_counter() + FILTER_FRAME_SECONDS
+        for indices in ranking:
+            if indices is not None:
+                break
+            if time.perf_counter() > deadline:
+                self.filter_job = self.root.after(1, lambda: self.rank_file_list(ranking, allowed))
+                return
+        self.filter_job_query = None
+        names = self.file_filter_index.names
+        if allowed is not None:
+            indices = [i for i in indices if names[i] in allowed]
+        shown = indices[:FILTER_DISPLAY_LIMIT]
+        self.render_file_list([names[i] for i in shown])
+        suffix = f" (best {len(shown)} shown)" if len(shown) < len(indices) else ""
+        self.status_label.config(text=f"Filter: {len(indices)} matches{suffix}")
+
+    # --- File list columns ---
+    def sorted_entries(self):
+        """Entry names ordered by the sort column and grouping, from cached data only."""
+        info = self.entry_info
+        notes = self.notes
+        keys = {
+            "name": lambda n: n.lower(),
+            "note": lambda n: not has_note(notes.get(n)),
+            "size": lambda n: info[n].size,
+            "modified": lambda n: info[n].mtime,
+        }
+        names = sorted(info, key=keys[self.sort_column], reverse=self.sort_reverse)
+        group = self.group_var.get()
+        if group == "Folders first":
+            names.sort(key=lambda n: not info[n].is_dir)
+        elif group == "Unannotated first":
+            names.sort(key=lambda n: has_note(notes.get(n)))
+        elif group == "Annotated first":
+            names.sort(key=lambda n: not has_note(notes.get(n)))
+        return names
+
+    def sort_file_list(self, column):
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+        for key, title in self.file_columns.titles.items():
+            arrow = (" ▼" if self.sort_reverse else " ▲") if key == column else ""
+            self.file_columns.set_heading(key, title + arrow)
+        self.filter_file_list()
 
-    # --- File list filter ---
-    def filter_file_list(self, event=None):
-        filter_text = self.file_filter.get().lower()
-        self.file_listbox.delete(0, 'end')
-        
-        for entry in os.listdir(self.current_folder):
-            full_path = os.path.join(self.current_folder, entry)
-            if entry == META_FILENAME:
-                continue
-                
-            if filter_text and filter_text not in entry.lower():
-                continue
-                
-            display_name = f"📁 {entry}" if os.path.isdir(full_path) else entry
-            self.display_to_real_name[display_name] = entry
-            self.file_listbox.insert('end', display_name)
+    def entry_row(self, name):
+        info = self.entry_info.get(name)
+        display_name = self.entry_display_names.get(name, name)
+        note = "●" if has_note(self.notes.get(name)) else ""
+        record = self.checksum_info(name)
+        if record and record.get("status", "ok") != "ok":
+            note += "⚠"
+        if info is None:
+            return (display_name, note, "", "")
+        size = "" if info.is_dir else format_size(info.size)
+        modified = datetime.fromtimestamp(info.mtime).strftime('%Y-%m-%d %H:%M') if info.mtime else ""
+        return (display_name, note, size, modified)
+
+    def render_file_list(self, names):
+        self.visible_entries = names
+        self.visible_index = {name: i for i, name in enumerate(names)}
+        self.file_columns.set_rows([self.entry_row(name) for name in names])
+
+    def refresh_entry_row(self, name):
+        """Update the row of one entry, e.g. after its note was saved."""
+        index = self.visible_index.get(name)
+        if index is not None:
+            self.file_columns.set_row(index, self.entry_row(name))
+
+    def selected_entry(self):
+        selection = self.file_columns.curselection()
+        if not selection or selection[0] >= len(self.visible_entries):
+            return None
+        return self.visible_entries[selection[0]]
 
     # --- Search Results ---
     def update_search_results(self, event=None):
@@ -714,7 +4414,9 @@ class MetaNotesApp:
         
         # Gérer le placeholder et les recherches vides
         if not query or query.lower() == "search...":
-            self.search_results.delete(0, 'end')
+            self.cancel_search_stream()
+            self.search_hits = []
+            self.search_results.set_rows([])
             self.results_count.config(text="0 results")
             return
 
@@ -726,66 +4428,178 @@ class MetaNotesApp:
             self.search_entry.config(values=self.search_history)
 
         # Préparer les résultats
-        self.search_results.delete(0, 'end')
-        results_count = 0
+        self.cancel_search_stream()
+        self.search_results.set_rows([])
+        self.search_hits = []
+        self.search_snippets = set()
+        options = (self.match_case_var.get(), self.match_whole_var.get(), self.use_regex_var.get())
 
-        for name, content in self.notes.items():
-            if name == "_meta":
-                continue
+        try:
+            results = self.search_matches(query, options)
+        except ValueError as e:
+            self.results_count.config(text=f"Invalid query: {e}")
+            return
+        self.search_stream = {"query": query, "results": results, "count": 0}
+        self.stream_search_page()
 
-            haystack = content
-            needle = query
+    def search_matches(self, query, options):
+        """Return an iterator over the SearchHit results of query.
 
-            # Match Case
-            if not self.match_case_var.get():
-                haystack = haystack.lower()
-                needle = needle.lower()
+        Match offsets are computed in the same pass, so opening a result needs
+        no second search.
+        """
+        if is_structured_query(query):
+            terms = plan_query(parse_query(query))
+            text_terms = [term for term in terms if term.field == "text" and not term.negate]
+            if any(term.field == "text" for term in terms) and self.text_index is None:
+                self.text_index = TextIndex.build(self.notes)
+            if not self.entry_info and self.current_folder:
+                self.entry_info = scan_entries(self.current_folder)
+            self.search_pattern = compile_search(text_terms[0].value, *options) if text_terms else None
+            names = execute_query(terms, self.notes, self.entry_info, self.text_index, *options,
+                                  facet_index=self.facet_index)
+            return (SearchHit(name, None, name, self.note_spans(name)) for name in names)
 
-            # Regex
-            if self.use_regex_var.get():
-                try:
-                    if re.search(needle, haystack):
-                        self.search_results.insert('end', name)
-                        results_count += 1
-                    continue
-                except re.error as e:
-                    # En cas d'erreur regex, fallback sur la recherche simple
-                    if needle in haystack:
-                        self.search_results.insert('end', name)
-                        results_count += 1
-                    continue
+        self.search_pattern = compile_search(query, *options)
+        if self.search_catalog_var.get() and self.catalog:
+            # Search the whole tree through the catalog
+            return self.catalog_search_hits(query, options)
 
-            # Whole Word
-            if self.match_whole_var.get():
-                try:
-                    pattern = r'\b{}\b'.format(re.escape(needle))
-                    if re.search(pattern, haystack):
-                        self.search_results.insert('end', name)
-                        results_count += 1
-                except re.error:
-                    # Fallback sur la recherche simple en cas d'erreur
-                    if needle in haystack:
-                        self.search_results.insert('end', name)
-                        results_count += 1
+        return self.folder_search_hits()
+
+    def note_spans(self, name):
+        if self.search_pattern is None or name not in self.notes:
+            return []
+        return find_spans(self.search_pattern, note_text(self.notes[name]))
+
+    def folder_search_hits(self):
+        for name, content in self.notes.items():
+            if name != "_meta":
+                spans = find_spans(self.search_pattern, note_text(content))
+                if spans:
+                    yield SearchHit(name, None, name, spans)
+
+    def catalog_search_hits(self, query, options):
+        for folder, name, spans in self.catalog.search(query, *options):
+            label = os.path.join(relative_folder(self.catalog.root, folder), name).replace(os.sep, "/")
+            yield SearchHit(label, folder, name, spans)
+
+    def render_visible_snippets(self):
+        """Fill in the snippet column of the result rows currently on screen only."""
+        if not self.search_hits:
+            return
+        first, last = self.search_results.visible_range()
+        for index in range(first, min(last + 1, len(self.search_hits))):
+            if index in self.search_snippets:
+                continue
+            self.search_snippets.add(index)
+            hit = self.search_hits[index]
+            if hit.folder is None:
+                text = note_text(self.notes.get(hit.name, ""))
             else:
-                # Simple substring
-                if needle in haystack:
-                    self.search_results.insert('end', name)
-                    results_count += 1
+                text = self.catalog.note_body(hit.folder, hit.name) if self.catalog else ""
+            self.search_results.set_row(index, (hit.label, make_snippet(text, hit.spans)))
+
+    def stream_search_page(self):
+        """Insert the next page of results, then schedule the following one."""
+        stream = self.search_stream
+        if stream is None:
+            return
+        page = list(itertools.islice(stream["results"], SEARCH_PAGE_SIZE))
+        if page:
+            self.search_hits.extend(page)
+            self.search_results.append_rows([(hit.label, "") for hit in page])
+            stream["count"] += len(page)
+            self.render_visible_snippets()
+        finished = len(page) < SEARCH_PAGE_SIZE
+        results_count = stream["count"]
+        self.results_count.config(text=f"{results_count} result(s)" + ("" if finished else "..."))
 
-        self.results_count.config(text=f"{results_count} result(s)")
-        
         # Mettre à jour le statut
         if hasattr(self, 'status_label') and self.current_panel == "search":
-            self.status_label.config(text=f"Search: {results_count} results for '{query}'")
+            self.status_label.config(text=f"Search: {results_count} results for '{stream['query']}'")
+
+        if finished:
+            self.search_stream = None
+            self.search_job = None
+        else:
+            self.search_job = self.root.after(1, self.stream_search_page)
+
+    def cancel_search_stream(self):
+        if self.search_job:
+            self.root.after_cancel(self.search_job)
+        self.search_job = None
+        self.search_stream = None
 
     def open_selected_search_result(self, event=None):
         selection = self.search_results.curselection()
-        if not selection:
+        if not selection or selection[0] >= len(self.search_hits):
             return
-        index = selection[0]
-        filename = self.search_results.get(index)
-        self.select_and_open_file(filename)
+        hit = self.search_hits[selection[0]]
+        # Catalog results of other folders open next to the current tabs
+        folder = os.path.abspath(hit.folder if hit.folder is not None else self.current_folder)
+        filename = os.path.join(folder, hit.name)
+        was_modified = filename in self.open_tabs and self.open_tabs[filename].modified
+        self.open_note(folder, hit.name)
+        spans = hit.spans
+        if (was_modified or hit.folder is not None) and self.search_pattern is not None:
+            # The offsets were computed on another version of the text
+            if was_modified:
+                text = self.open_tabs[filename].text_widget.get("1.0", 'end')
+            else:
+                text = note_text(self.load_folder_state(folder).notes.get(hit.name, ""))
+            spans = find_spans(self.search_pattern, text)
+        self.highlight_matches(filename, spans)
+
+    # --- Match highlighting ---
+    def highlight_matches(self, filename, spans):
+        """Highlight search matches in a tab and jump to the first one.
+
+        Tag ranges are only added for the visible part of the document, and
+        extended as the user scrolls.
+        """
+        tab_data = self.open_tabs.get(filename)
+        if not tab_data:
+            return
+        text = tab_data.text_widget.text
+        text.tag_remove(MATCH_TAG, "1.0", 'end')
+        text.tag_configure(MATCH_TAG, background="#f0c674", foreground="black")
+        tab_data.highlight = {"spans": spans, "starts": [start for start, _ in spans], "tagged": set()}
+        if spans and not tab_data.loading:
+            self.jump_to_first_match(filename)
+
+    def jump_to_first_match(self, filename):
+        tab_data = self.open_tabs[filename]
+        start, end = tab_data.highlight["spans"][0]
+        text = tab_data.text_widget.text
+        text.mark_set("insert", f"1.0 + {start} chars")
+        text.see(f"1.0 + {start} chars")
+        text.focus_set()
+        # Visible region is known once the view has been updated
+        self.root.after_idle(self.highlight_visible, filename)
+
+    def highlight_visible(self, filename):
+        tab_data = self.open_tabs.get(filename)
+        if not tab_data or tab_data.loading or not tab_data.highlight:
+            return
+        highlight = tab_data.highlight
+        text = tab_data.text_widget.text
+        first = self.char_offset(text, "@0,0")
+        last = self.char_offset(text, f"@{text.winfo_width()},{text.winfo_height()}")
+        lo = bisect.bisect_left(highlight["starts"], first - HIGHLIGHT_MARGIN)
+        hi = bisect.bisect_right(highlight["starts"], last + HIGHLIGHT_MARGIN)
+        for i in range(lo, hi):
+            if i not in highlight["tagged"]:
+                start, end = highlight["spans"][i]
+                text.tag_add(MATCH_TAG, f"1.0 + {start} chars", f"1.0 + {end} chars")
+                highlight["tagged"].add(i)
+
+    @staticmethod
+    def char_offset(text, index):
+        count = text.count("1.0", index, "chars")
+        if isinstance(count, tuple):
+            count = count[0]
+        return count or 0
 
     # --- Directory ---
     def load_last_folder(self):
@@ -809,11 +4623,9 @@ class MetaNotesApp:
         self.set_folder(previous_folder)
 
     def open_selected_folder(self, event=None):
-        selection = self.file_listbox.curselection()
-        if not selection:
+        filename = self.selected_entry()
+        if filename is None:
             return
-        display_name = self.file_listbox.get(selection[0])
-        filename = self.display_to_real_name.get(display_name, display_name)
         path = os.path.join(self.current_folder, filename)
         if not os.path.isdir(path):
             return
@@ -839,11 +4651,11 @@ class MetaNotesApp:
             messagebox.showerror("Error", f"No write permission in '{folder}'.")
             return
 
-        # Close all opened tabs
-        for tab_id in reversed(range(len(self.notebook.tabs()))):
-            if not self.close_tab(tab_id):  # If Cancel
-                return  # Do not change the folder
-
+        # Tabs stay open: they are keyed by full path and keep their folder loaded
+        self.cancel_search_stream()
+        if self.note_store:
+            # Pending RPC writes land before the folder is (re)loaded
+            self.note_store.flush()
         self.current_folder = folder
         self.path_entry.delete(0, 'end')
         self.path_entry.insert(0, self.current_folder)
@@ -858,9 +4670,47 @@ class MetaNotesApp:
             self.load_notes()
 
         self.populate_file_list()
+        self.refresh_tab_titles()
+        self.refresh_workspace_list()
+        self.enforce_memory_budget()
         self.save_last_folder()
         self.status_label.config(text=f"Directory loaded: {folder}")
 
+    # --- Workspace ---
+    def refresh_workspace_list(self):
+        """List the pinned roots, selecting the one holding the current folder."""
+        if not hasattr(self, 'workspace_list'):
+            return
+        self.workspace_list.delete(0, 'end')
+        current = os.path.abspath(self.current_folder) if self.current_folder else None
+        for index, root in enumerate(self.workspace_roots):
+            self.workspace_list.insert('end', os.path.basename(root) or root)
+            if current and (current == root or current.startswith(root.rstrip(os.sep) + os.sep)):
+                self.workspace_list.selection_set(index)
+
+    def open_workspace_root(self, event=None):
+        selection = self.workspace_list.curselection()
+        if selection:
+            root = self.workspace_roots[selection[0]]
+            if os.path.isdir(root):
+                self.set_folder(root)
+            else:
+                messagebox.showerror("Error", f"The directory '{root}' no longer exists.")
+
+    def pin_current_folder(self):
+        folder = os.path.abspath(self.current_folder)
+        if folder not in self.workspace_roots:
+            self.workspace_roots.append(folder)
+            self.save_config()
+        self.refresh_workspace_list()
+
+    def unpin_workspace_root(self):
+        selection = self.workspace_list.curselection()
+        if selection:
+            del self.workspace_roots[selection[0]]
+            self.save_config()
+            self.refresh_workspace_list()
+
     def validate_path(self, event=None):
         new_path = self.path_entry.get()
         if os.path.isdir(new_path):
@@ -875,52 +4725,190 @@ class MetaNotesApp:
 
     # --- Files and Notes ---
     def populate_file_list(self):
-        self.file_listbox.delete(0, 'end')
-        self.display_to_real_name = {}
-        for entry in os.listdir(self.current_folder):
-            full_path = os.path.join(self.current_folder, entry)
-            if entry == META_FILENAME:
-                continue
-            display_name = f"📁 {entry}" if os.path.isdir(full_path) else entry
-            self.display_to_real_name[display_name] = entry
-            self.file_listbox.insert('end', display_name)
+        coverage = self.folder_coverage()
+        # One scandir pass caches the type, size and mtime of every entry
+        self.entry_info = scan_entries(self.current_folder)
+        self.entry_display_names = {}
+        for entry, info in self.entry_info.items():
+            if info.is_dir:
+                self.entry_display_names[entry] = self.display_name(entry, True, coverage)
+        # Normalized names are computed once per listing, not per keystroke
+        self.file_filter_index = FuzzyFilter(self.entry_info)
+        self.refresh_facets()
+        self.filter_file_list()
+
+    # --- Facets ---
+    def refresh_facets(self):
+        """Refill the Explorer facet choices and the Search facet list from the facet index."""
+        facets = self.facet_index.facets()
+        self.facet_choices = {f"{field} = {value} ({count})": (field, value) for field, value, count in facets}
+        labels = {(field, value): label for label, (field, value) in self.facet_choices.items()}
+        current = self.facet_choices.get(self.facet_var.get())
+        self.facet_combo.config(values=["All"] + list(self.facet_choices))
+        # Keep the selected facet across count changes
+        self.facet_var.set(labels.get(current, "All"))
+        self.facet_list.delete(0, 'end')
+        if facets:
+            self.facet_list.insert('end', *self.facet_choices)
+
+    def add_facet_to_query(self, event=None):
+        selection = self.facet_list.curselection()
+        if not selection:
+            return
+        field, value = self.facet_choices[self.facet_list.get(selection[0])]
+        term = f"tag:{value}" if field == TAG_FACET else f"field:{field}={value}"
+        if " " in term:
+            term = '{}:"{}"'.format(*term.split(":", 1))
+        query = self.search_entry.get().strip()
+        if query == "Search...":
+            query = ""
+        if term not in query.split():
+            self.clear_search_placeholder()
+            self.search_entry.set(f"{query} {term}".strip())
+        self.update_search_results()
+
+    def update_note_fields(self, filename, fields, tags, state=None):
+        state = state or self.folder_state
+        set_note_fields(state.notes, filename, fields, tags)
+        state.facet_index.update(filename, fields, tags)
+        self.write_folder_notes(state)
+        if state is self.folder_state:
+            self.refresh_facets()
+            self.filter_file_list()
+
+    def edit_fields(self):
+        """Edit the fields and tags of the current tab's file, or of the selected entry."""
+        state = self.folder_state
+        filename = self.current_tab_filename()
+        if filename is not None:
+            state = self.load_folder_state(self.open_tabs[filename].folder)
+            filename = self.open_tabs[filename].name
+        else:
+            filename = self.selected_entry()
+        if filename is None:
+            messagebox.showinfo("Fields", "Open or select a file to edit its fields.")
+            return
+
+        dialog = ttk.Toplevel(self.root)
+        dialog.title(f"Fields - {filename}")
+        dialog.geometry("420x360")
+        frame = ttk.Frame(dialog, padding=10)
+        frame.pack(fill=BOTH, expand=True)
+
+        ttk.Label(frame, text="Tags (separated by commas):").pack(anchor="w")
+        tags_entry = ttk.Entry(frame)
+        tags_entry.insert(0, ", ".join(note_tags(state.notes, filename)))
+        tags_entry.pack(fill=X, pady=(0, 10))
+
+        ttk.Label(frame, text="Fields, one 'key: value' per line (numbers and true/false are typed):").pack(anchor="w")
+        fields_text = tk.Text(frame, height=8, font=(self.font_family, self.font_size))
+        fields_text.insert("1.0", "\n".join(
+            f"{key}: {format_field_value(value)}" for key, value in note_fields(state.notes, filename).items()))
+        fields_text.pack(fill=BOTH, expand=True)
+
+        def apply():
+            try:
+                fields = parse_fields_text(fields_text.get("1.0", 'end'))
+            except ValueError as e:
+                messagebox.showerror("Fields", str(e), parent=dialog)
+                return
+            self.update_note_fields(filename, fields, parse_tags(tags_entry.get()), state)
+            self.status_label.config(text=f"Fields of {filename} saved")
+            dialog.destroy()
+
+        buttons = ttk.Frame(frame)
+        buttons.pack(fill=X, pady=(10, 0))
+        ttk.Button(buttons, text="Save", bootstyle="success", command=apply).pack(side=RIGHT)
+        ttk.Button(buttons, text="Cancel", bootstyle="secondary", command=dialog.destroy).pack(side=RIGHT, padx=5)
+
+    def folder_coverage(self):
+        """Annotation coverage of the subfolders of the current folder, from the catalog."""
+        if self.catalog and self.catalog.contains(self.current_folder):
+            try:
+                return self.catalog.child_coverage(self.current_folder)
+            except sqlite3.Error:
+                pass
+        return {}
+
+    def display_name(self, entry, is_dir, coverage):
+        if not is_dir:
+            return entry
+        if entry in coverage:
+            annotated, total = coverage[entry]
+            return f"📁 {entry}  ({annotated}/{total} noted)"
+        return f"📁 {entry}"
 
     def on_file_select(self, event=None):
-        selection = self.file_listbox.curselection()
-        if selection:
-            index = selection[0]
-            display_name = self.file_listbox.get(index)
-            filename = self.display_to_real_name.get(display_name, display_name)
-            full_path = os.path.join(self.current_folder, filename)
+        filename = self.selected_entry()
+        if filename is not None:
+            info = self.entry_info.get(filename)
             
-            if os.path.isfile(full_path):
-                # Show file info in status bar
-                file_size = os.path.getsize(full_path)
-                modified_time = datetime.fromtimestamp(os.path.getmtime(full_path))
-                self.status_label.config(text=f"{filename} - {file_size} bytes - Modified: {modified_time.strftime('%m/%d/%Y %H:%M')}")
+            if info is not None and not info.is_dir:
+                # Show file info in status bar, from the cached listing
+                file_size = info.size
+                modified_time = datetime.fromtimestamp(info.mtime)
+                text = f"{filename} - {file_size} bytes - Modified: {modified_time.strftime('%m/%d/%Y %H:%M')}"
+                record = self.checksum_info(filename)
+                if record:
+                    text += f" - SHA-256: {record['sha256']}"
+                    if record.get("status", "ok") != "ok":
+                        text += f" ⚠ {record['status'].upper()} (was {record.get('previous', '?')[:12]}...)"
+                self.status_label.config(text=text)
 
     def load_notes(self):
-        self.notes = {}
+        """Make the notes of the current folder current, from the cache when still valid."""
+        self.facet_var.set("All")
         meta_path = os.path.join(self.current_folder, META_FILENAME)
-        if os.path.exists(meta_path):
-            try:
-                with open(meta_path, "r", encoding="utf-8") as f:
-                    self.notes = json.load(f)
-            except:
-                messagebox.showerror("Error", "Unable to read the notes file.")
-        else:
-            self.notes = {"_meta": {"created": datetime.now().isoformat()}}
+        try:
+            # Entering a folder revalidates it; its open tabs only keep it from eviction
+            tab_folders = {tab_data.folder for tab_data in self.open_tabs.values()}
+            self.folder_state = self.note_cache.load(self.current_folder, tab_folders)
+        except:
+            messagebox.showerror("Error", "Unable to read the notes file.")
+            self.folder_state = FolderNotes(os.path.abspath(self.current_folder), {"_meta": {}})
+        if not os.path.exists(meta_path):
             self.save_notes_all()
 
+    def set_note(self, filename, content, state=None):
+        """Store content as the note of filename, keeping an identical blob untouched."""
+        state = state or self.folder_state
+        current = state.notes.get(filename)
+        if isinstance(current, BlobNote) and current.loaded and current.load() == content:
+            return
+        state.notes[filename] = content
+        # Running estimate; blobs are counted apart and resynced on the next write
+        if not isinstance(current, BlobNote):
+            state.size -= note_size(current) if current is not None else 0
+            state.size += note_size(content)
+        if state.text_index is not None:
+            state.text_index.update(filename, content)
+
     def save_notes_all(self):
-        meta_path = os.path.join(self.current_folder, META_FILENAME)
-        for filename, tab_data in self.open_tabs.items():
-            text_widget = tab_data["text_widget"]
-            self.notes[filename] = text_widget.get("1.0", 'end').strip()
-        atomic_write_json(meta_path, self.notes)
-        set_hidden(meta_path, True)
+        for tab_data in self.open_tabs.values():
+            if tab_data.loading or tab_data.folder != self.folder_state.folder:
+                continue
+            text_widget = tab_data.text_widget
+            self.set_note(tab_data.name, text_widget.get("1.0", 'end').strip())
+        self.write_current_notes()
+
+    def notes_format(self):
+        return FORMAT_DEDUP if self.dedupe_notes else FORMAT_PLAIN, self.blob_threshold_kb * 1024
+
+    def write_current_notes(self):
+        """Write the notes of the current folder as they are, without the text of the open tabs."""
+        self.write_folder_notes(self.folder_state)
         self.save_last_folder()
 
+    def write_folder_notes(self, state):
+        write_notes_file(state.folder, state.notes, *self.notes_format())
+        state.stat = notes_file_stat(state.folder)
+        state.measure()  # Bodies may have moved to blobs, or been changed in place
+        if self.catalog and self.catalog.contains(state.folder):
+            try:
+                self.catalog.update_folder(state.folder, state.notes)
+            except sqlite3.Error as e:
+                print(f"Catalog update error: {e}")
+
     # --- Save all ---
     def save_all_tabs(self, silent=False):
         for filename in list(self.open_tabs.keys()):
@@ -939,7 +4927,7 @@ class MetaNotesApp:
         self.stats_text.config(state='normal')
         self.stats_text.delete('1.0', 'end')
         
-        total_files = len([f for f in os.listdir(self.current_folder) if f != META_FILENAME])
+        total_files = len([f for f in os.listdir(self.current_folder) if not is_sidecar(f)])
         total_notes = len(self.notes) - 1  # Exclude _meta
         
         # Calculate word counts
@@ -949,7 +4937,7 @@ class MetaNotesApp:
         for name, content in self.notes.items():
             if name == "_meta":
                 continue
-            words = len(content.split())
+            words = note_word_count(content)
             note_words[name] = words
             total_words += words
             
@@ -973,26 +4961,586 @@ NOTES BY SIZE:
             
         if len(sorted_notes) > 10:
             stats_text += f"... and {len(sorted_notes) - 10} other notes\n"
+
+        stats_text += self.memory_stats_text()
+
+        if self.catalog:
+            stats_text += self.catalog_stats_text()
+
+        if self.coverage_text:
+            stats_text += self.coverage_text
             
         self.stats_text.insert('1.0', stats_text)
         self.stats_text.config(state='disabled')
 
+    # --- Coverage scan ---
+    def start_coverage_scan(self):
+        """Scan the annotation coverage of the current folder tree in the background."""
+        if self.coverage_task and self.coverage_task.running:
+            messagebox.showinfo("Coverage", "A coverage scan is already running.")
+            return
+        report = CoverageReport(self.current_folder)
+
+        def run(task):
+            return scan_coverage(
+                report.root, report, cancel=task.cancel_event,
+                on_progress=lambda r: task.post(r.render()))
+
+        def on_message(text):
+            self.coverage_text = text
+            if self.current_panel == "stats":
+                self.update_stats()
+
+        def on_done(result, error):
+            if error:
+                messagebox.showerror("Error", f"Coverage scan failed: {error}")
+                return
+            coverage = report.annotated / report.entries * 100 if report.entries else 0
+            self.status_label.config(text=f"Coverage: {coverage:.1f}% of {report.entries} entries in {report.folders} folders")
+
+        self.coverage_text = report.render()
+        self.coverage_task = BackgroundTask(self.root, run, on_message, on_done, poll_ms=250).start()
+        self.update_stats()
+        self.status_label.config(text=f"Scanning coverage of {report.root}...")
+
+    # --- Tree sync ---
+    def start_tree_sync(self):
+        """Merge the notes of the current folder tree with another copy of it."""
+        if self.sync_task and self.sync_task.running:
+            messagebox.showinfo("Sync", "A sync is already running.")
+            return
+        other = filedialog.askdirectory(title="Copy of this tree to sync with")
+        if not other:
+            return
+        root_a, root_b = os.path.abspath(self.current_folder), os.path.abspath(other)
+        if root_a == root_b:
+            return
+        if not messagebox.askyesno(
+                "Sync", f"Merge the notes of:\n{root_a}\nand\n{root_b}?\n\nBoth trees may be written."):
+            return
+        self.save_all_tabs(silent=True)
+        fmt, threshold = self.notes_format()
+
+        def write(folder, notes):
+            if self.note_cache.get(folder) is not None:
+                # Loaded folders are written by the Tk thread, with their open tabs; it checks
+                # the cache again, and a folder loaded just after this check is reread by stat
+                return task.call(lambda: self.apply_folder_notes(folder, notes))
+            write_notes_file(folder, notes, fmt, threshold)
+            return notes_file_stat(folder), []
+
+        def run(task):
+            return sync_trees(root_a, root_b, fmt, threshold, task.cancel_event, write=write)
+
+        def on_done(report, error):
+            if error:
+                messagebox.showerror("Error", f"Sync failed: {error}")
+                return
+            self.coverage_text = format_sync_report(root_a, root_b, report)
+            if self.current_panel == "stats":
+                self.update_stats()
+            self.status_label.config(
+                text=f"Sync: {report['written_a'] + report['written_b']} folders written, "
+                     f"{len(report['conflicts'])} conflicts")
+            if report["conflicts"]:
+                messagebox.showwarning("Sync", f"{len(report['conflicts'])} note(s) changed on both sides; "
+                                               "both versions were kept between conflict markers.")
+            if report["busy"]:
+                messagebox.showinfo("Sync", f"{len(report['busy'])} note(s) with unsaved edits were not updated; "
+                                            "they will be synced next time.")
+
+        task = BackgroundTask(self.root, run, on_done=on_done)
+        self.sync_task = task.start()
+        self.status_label.config(text=f"Syncing with {root_b}...")
+
+    # --- Sidecar ingest ---
+    def start_ingest(self, dry_run=True):
+        """Merge sidecar files of the current folder tree into notes, after a dry run."""
+        if self.ingest_task and self.ingest_task.running:
+            messagebox.showinfo("Ingest", "An ingest is already running.")
+            return
+        root_folder = os.path.abspath(self.current_folder)
+        patterns = self.ingest_patterns
+        if not dry_run:
+            self.save_all_tabs(silent=True)
+        fmt, threshold = self.notes_format()
+
+        def write(folder, notes):
+            # Looked up at write time: a folder opened during the ingest goes through the Tk
+            # thread, which checks again; one loaded right after this check sees the new
+            # notes file when the cache revalidates it
+            if self.note_cache.get(folder) is not None:
+                # Written by the Tk thread, with the open tabs, before the folder is checkpointed
+                task.call(lambda: self.apply_folder_notes(folder, notes))
+            else:
+                write_notes_file(folder, notes, fmt, threshold)
+
+        def run(task):
+            return ingest_tree(root_folder, patterns, dry_run, fmt, threshold, cancel=task.cancel_event,
+                               on_progress=lambda report: task.post(report["folders"]), write=write)
+
+        def on_message(message):
+            self.status_label.config(text=f"Ingest: {message} folders scanned...")
+
+        def on_done(report, error):
+            if error:
+                messagebox.showerror("Error", f"Ingest failed: {error}")
+                return
+            self.coverage_text = format_ingest_report(root_folder, report, dry_run)
+            if self.current_panel == "stats":
+                self.update_stats()
+            if not dry_run:
+                self.status_label.config(text=f"Ingest: {report['merged']} sidecars merged")
+                self.filter_file_list()
+            elif report["merged"] and messagebox.askyesno(
+                    "Ingest", f"Merge {report['merged']} sidecar(s) into the notes of {root_folder}?"):
+                self.start_ingest(dry_run=False)
+            elif not report["merged"]:
+                self.status_label.config(text="Ingest: no new sidecar content found")
+
+        task = BackgroundTask(self.root, run, on_message, on_done)
+        self.ingest_task = task.start()
+        self.status_label.config(text=f"{'Looking for' if dry_run else 'Ingesting'} sidecars in {root_folder}...")
+
+    def change_ingest_patterns(self, event=None):
+        patterns = [pattern.strip() for pattern in self.ingest_patterns_var.get().split(",") if pattern.strip()]
+        self.ingest_patterns = patterns or list(DEFAULT_INGEST_PATTERNS)
+        self.save_config()
+
+    # --- Find and replace ---
+    def start_replace(self):
+        """Find the notes the replacement would change, in the current folder or tree, and preview them."""
+        if self.replace_task and self.replace_task.running:
+            messagebox.showinfo("Replace", "A replacement is already running.")
+            return
+        query = self.search_entry.get().strip()
+        if not query or query == "Search...":
+            messagebox.showinfo("Replace", "Type the text to find in the search field.")
+            return
+        match_case, whole_word, use_regex = (
+            self.match_case_var.get(), self.match_whole_var.get(), self.use_regex_var.get())
+        replacement = self.replace_entry.get()
+        try:
+            if use_regex:
+                re.compile(query).sub(replacement, "")  # Checks the pattern and the group references
+        except re.error as e:
+            messagebox.showerror("Replace", f"Invalid regular expression: {e}")
+            return
+        pattern = compile_search(query, match_case, whole_word, use_regex)
+        if pattern.search("") is not None:
+            messagebox.showerror("Replace", "The search matches empty text.")
+            return
+        replace = make_replacement(replacement, use_regex)
+        root_folder = os.path.abspath(self.current_folder)
+        recursive = self.replace_tree_var.get()
+        self.save_all_tabs(silent=True)
+
+        def run(task):
+            return plan_replace(root_folder, pattern, replace, recursive, cancel=task.cancel_event,
+                                on_progress=task.post)
+
+        def on_message(count):
+            self.status_label.config(text=f"Replace: {count} notes found...")
+
+        def on_done(hits, error):
+            if error:
+                messagebox.showerror("Error", f"Replace failed: {error}")
+            elif not hits:
+                self.status_label.config(text="Replace: no note matches")
+            else:
+                self.show_replace_preview(root_folder, hits, pattern, replace, replacement)
+
+        self.replace_task = BackgroundTask(self.root, run, on_message, on_done).start()
+        self.status_label.config(text=f"Looking for '{query}' in {root_folder}...")
+
+    def show_replace_preview(self, root_folder, hits, pattern, replace, replacement):
+        """Page through the notes a replacement will change, and apply it on confirmation."""
+        dialog = ttk.Toplevel(self.root)
+        dialog.title("Replace - Preview")
+        dialog.geometry("900x500")
+        frame = ttk.Frame(dialog, padding=10)
+        frame.pack(fill=BOTH, expand=True)
+
+        total = sum(hit.count for hit in hits)
+        folders = len({hit.folder for hit in hits})
+        ttk.Label(
+            frame, text=f"{total} replacement(s) with '{replacement}' in {len(hits)} note(s) of {folders} folder(s)"
+        ).pack(anchor="w", pady=(0, 5))
+        rows = ColumnListbox(
+            frame,
+            [("name", "Note", 28, False), ("count", "#", 5, False),
+             ("before", "Before", 40, True), ("after", "After", 40, True)],
+            font=("Segoe UI", 10)
+        )
+        rows.pack(fill=BOTH, expand=True)
+
+        pages = (len(hits) + REPLACE_PREVIEW_PAGE - 1) // REPLACE_PREVIEW_PAGE
+        page = [0]
+        buttons = ttk.Frame(frame)
+        buttons.pack(fill=X, pady=(5, 0))
+        page_label = ttk.Label(buttons)
+
+        def show_page(delta=0):
+            page[0] = min(max(page[0] + delta, 0), pages - 1)
+            start = page[0] * REPLACE_PREVIEW_PAGE
+            rows.set_rows([
+                (os.path.join(relative_folder(root_folder, hit.folder), hit.name).replace(os.sep, "/"),
+                 hit.count, hit.before, hit.after)
+                for hit in hits[start:start + REPLACE_PREVIEW_PAGE]])
+            page_label.config(text=f"Page {page[0] + 1} / {pages}")
+
+        def apply():
+            dialog.destroy()
+            self.apply_replace_hits(hits, pattern, replace)
+
+        ttk.Button(buttons, text="◀", width=3, command=lambda: show_page(-1)).pack(side=LEFT)
+        page_label.pack(side=LEFT, padx=5)
+        ttk.Button(buttons, text="▶", width=3, command=lambda: show_page(1)).pack(side=LEFT)
+        ttk.Button(buttons, text="Cancel", bootstyle="secondary", command=dialog.destroy).pack(side=RIGHT)
+        ttk.Button(buttons, text="Replace All", bootstyle="warning", command=apply).pack(side=RIGHT, padx=5)
+        show_page()
+
+    def apply_replace_hits(self, hits, pattern, replace):
+        """Write the replacement once per folder; loaded folders are written here with their open tabs."""
+        fmt, threshold = self.notes_format()
+        replaced = [0]
+
+        def write(folder, names):
+            # Checked per folder, not once at the start: replace_in_folder looks again on the
+            # Tk thread, and a folder loaded right after this check is reread by stat
+            if self.note_cache.get(folder) is None:
+                return False
+            task.post((folder, names))
+            return True
+
+        def run(task):
+            return apply_replace(hits, pattern, replace, fmt, threshold, cancel=task.cancel_event, write=write)
+
+        def on_message(message):
+            replaced[0] += self.replace_in_folder(*message, pattern, replace)
+
+        def on_done(report, error):
+            if error:
+                messagebox.showerror("Error", f"Replace failed: {error}")
+                return
+            self.filter_file_list()
+            errors = f", {report['errors']} folder(s) failed" if report["errors"] else ""
+            self.status_label.config(
+                text=f"Replaced {report['replacements'] + replaced[0]} occurrence(s) in {report['folders']} folder(s){errors}")
+
+        task = BackgroundTask(self.root, run, on_message, on_done)
+        self.replace_task = task.start()
+        self.status_label.config(text="Replacing...")
+
+    def replace_in_folder(self, folder, names, pattern, replace):
+        """Apply a replacement to a loaded folder and its open tabs, then write it once."""
+        state = self.note_cache.get(folder)
+        if state is None:  # Evicted meanwhile
+            notes = read_notes_file(folder) or {}
+            count = replace_in_notes(notes, names, pattern, replace)
+            if count:
+                write_notes_file(folder, notes, *self.notes_format())
+            return count
+        count = replace_in_notes(state.notes, names, pattern, replace)
+        for name in names:
+            if state.text_index is not None and name in state.notes:
+                state.text_index.update(name, note_text(state.notes[name]))
+            filename = os.path.join(state.folder, name)
+            if filename in self.open_tabs:
+                tab_data = self.open_tabs[filename]
+                unsaved = tab_data.modified
+                self.replace_tab_matches(filename, pattern, replace)
+                if not unsaved:
+                    tab_data.mark_saved(tab_data.text_widget.get("1.0", 'end').strip())
+                    tab_data.modified = False
+                    self.journal_saved(filename)
+                    self.update_tab_title(filename)
+            if state is self.folder_state:
+                self.refresh_entry_row(name)
+        if count:
+            self.write_folder_notes(state)
+        return count
+
+    def replace_tab_matches(self, filename, pattern, replace):
+        """Replace the matches in an open tab one by one, as a single undoable edit.
+
+        Editing only the matches keeps the cursor, the scroll position and the
+        undo history of the tab.
+        """
+        tab_data = self.open_tabs[filename]
+        if tab_data.loading:
+            # Only the folder state holds the whole note, and it is already replaced
+            note = self.load_folder_state(tab_data.folder).notes.get(tab_data.name, "")
+            self.replace_tab_text(filename, note_text(note))
+            return
+        text_widget = tab_data.text_widget
+        matches = list(pattern.finditer(text_widget.get("1.0", 'end-1c')))
+        if not matches:
+            return
+        if tab_data.preview:
+            self.enable_editing(filename)
+        text = text_widget.text
+        text.config(autoseparators=False)
+        text.edit_separator()
+        for match in reversed(matches):
+            start = f"1.0 + {match.start()} chars"
+            text.delete(start, f"1.0 + {match.end()} chars")
+            text.insert(start, replace(match))
+        text.edit_separator()
+        text.config(autoseparators=True)
+        text_widget.line_numbers.redraw()
+        self.on_text_modified(filename)
+
+    # --- Export ---
+    def start_export(self):
+        """Export the notes of the current folder tree as a static Markdown or HTML site."""
+        if self.export_task and self.export_task.running:
+            messagebox.showinfo("Export", "An export is already running.")
+            return
+        index_path = filedialog.asksaveasfilename(
+            title="Export notes - index page", initialfile="index.html",
+            filetypes=[("HTML", "*.html"), ("Markdown", "*.md")])
+        if not index_path:
+            return
+        fmt = "md" if index_path.lower().endswith(".md") else "html"
+        if not index_path.lower().endswith("." + fmt):
+            index_path += "." + fmt
+        root_folder = self.current_folder
+        self.save_all_tabs(silent=True)
+
+        def run(task):
+            return export_tree(
+                root_folder, os.path.dirname(index_path), fmt, cancel=task.cancel_event,
+                on_progress=lambda report: task.post(report["folders"]),
+                index_name=os.path.basename(index_path))
+
+        def on_message(folders):
+            self.status_label.config(text=f"Exporting: {folders} folders...")
+
+        def on_done(report, error):
+            if error:
+                messagebox.showerror("Error", f"Export failed: {error}")
+                return
+            self.status_label.config(
+                text=f"Exported {report['notes']} notes from {report['folders']} folders "
+                     f"({report['written']} pages written)")
+
+        self.export_task = BackgroundTask(self.root, run, on_message, on_done).start()
+        self.status_label.config(text=f"Exporting {root_folder}...")
+
+    # --- Checksums ---
+    def start_checksum_scan(self, verify=False):
+        """Compute SHA-256 checksums of the current folder (or tree) in a process pool.
+
+        Files whose (inode, size, mtime) match the cached entry are skipped unless
+        verify is set. Results are stored in the _meta entry of each folder's notes.
+        """
+        if self.checksum_task and self.checksum_task.running:
+            messagebox.showinfo("Checksums", "A checksum scan is already running.")
+            return
+        root_folder = self.current_folder
+        include_tree = self.checksum_tree_var.get()
+        current_known = dict(self.notes.get("_meta", {}).get("checksums", {}))
+
+        def folders():
+            if include_tree:
+                yield from walk_tree_parallel(
+                    root_folder, lambda folder, entries: (folder, [e.name for e in entries if not is_sidecar(e.name)]),
+                    cancel=checksum_cancel)
+            else:
+                yield root_folder, [name for name in os.listdir(root_folder) if not is_sidecar(name)]
+
+        def run(task):
+            hashed = flagged = 0
+            with concurrent.futures.ProcessPoolExecutor() as pool:
+                for folder, names in folders():
+                    if task.cancelled:
+                        break
+                    if os.path.abspath(folder) == os.path.abspath(root_folder):
+                        known = current_known
+                    else:
+                        try:
+                            known = (read_notes_file(folder) or {}).get("_meta", {}).get("checksums", {})
+                        except Exception:
+                            known = {}
+                    updates, removed = folder_checksums(folder, names, known, pool, verify, task.cancel_event)
+                    hashed += len(updates)
+                    flagged += sum(1 for record in updates.values() if record["status"] != "ok")
+                    if updates or removed:
+                        task.post((folder, updates, removed, hashed))
+            return hashed, flagged
+
+        def on_message(message):
+            folder, updates, removed, hashed = message
+            self.store_checksums(folder, updates, removed)
+            self.status_label.config(text=f"Checksums: {hashed} files hashed...")
+
+        def on_done(result, error):
+            if error:
+                messagebox.showerror("Error", f"Checksum scan failed: {error}")
+                return
+            hashed, flagged = result
+            text = f"Checksums: {hashed} files hashed"
+            if flagged:
+                text += f", {flagged} changed or corrupted"
+                messagebox.showwarning("Checksums", f"{flagged} file(s) have a different checksum than recorded.")
+            self.status_label.config(text=text)
+            self.filter_file_list()
+
+        task = BackgroundTask(self.root, run, on_message, on_done)
+        checksum_cancel = task.cancel_event
+        self.checksum_task = task.start()
+        self.status_label.config(text="Computing checksums...")
+
+    def store_checksums(self, folder, updates, removed):
+        """Save checksum entries in the notes of folder, through the note cache when it is loaded."""
+        state = self.note_cache.get(folder)
+        if state is not None:
+            apply_checksums(state.notes, updates, removed)
+            self.write_folder_notes(state)
+            return
+        try:
+            notes = read_notes_file(folder) or {"_meta": {"created": datetime.now().isoformat()}}
+            apply_checksums(notes, updates, removed)
+            fmt = FORMAT_DEDUP if self.dedupe_notes else FORMAT_PLAIN
+            write_notes_file(folder, notes, fmt, self.blob_threshold_kb * 1024)
+        except Exception as e:
+            print(f"Checksum save error in {folder}: {e}")
+
+    def checksum_info(self, filename):
+        return self.notes.get("_meta", {}).get("checksums", {}).get(filename)
+
+    def cancel_background_tasks(self):
+        for task in (self.catalog_task, self.coverage_task, self.checksum_task, self.sync_task, self.export_task,
+                     self.ingest_task, self.replace_task):
+            if task and task.running:
+                task.cancel()
+
+    # --- Memory budget ---
+    def memory_usage(self):
+        """Estimated bytes held by each kind of in-memory data, as an ordered mapping.
+
+        Built from counters kept as notes are loaded, set and evicted, so it
+        costs a few additions per loaded folder and open tab.
+        """
+        states = list(self.note_cache.folders.values())
+        tabs = list(self.open_tabs.values()) + list(self.placeholder_tabs.values())
+        usage = OrderedDict()
+        usage["Note bodies"] = sum(state.memory() for state in states)
+        usage["Open tabs"] = sum(sys.getsizeof(tab) + tab.saved_size for tab in tabs)
+        usage["Directory listing"] = len(self.entry_info) * LISTING_ENTRY_BYTES
+        usage["Search indexes"] = sum(index_size(state.text_index) + index_size(state.facet_index) for state in states)
+        usage["Search indexes"] += len(self.search_hits) * SEARCH_HIT_BYTES
+        return usage
+
+    def enforce_memory_budget(self):
+        """Release what can be rebuilt or reread, least recently used folders first, until under budget.
+
+        Text indexes and loaded blob bodies go first, then whole folders of the
+        note cache; the current folder and the folders of open tabs are kept.
+        Returns the estimated number of bytes released.
+        """
+        excess = sum(self.memory_usage().values()) - self.memory_budget_mb * 1024 * 1024
+        freed = 0
+        if excess <= 0:
+            return freed
+        tab_notes = {(tab.folder, tab.name) for tab in self.open_tabs.values()}
+        for state in list(self.note_cache.folders.values()):
+            if freed >= excess:
+                return freed
+            if state.text_index is not None and state is not self.folder_state:
+                freed += index_size(state.text_index)
+                state.text_index = None  # Rebuilt by the next structured search
+            for name, blob in state.blobs:
+                if blob.loaded and (state.folder, name) not in tab_notes:
+                    freed += note_size(blob) - sys.getsizeof(blob)
+                    blob.unload()
+        in_use = self.folders_in_use()
+        for folder, state in list(self.note_cache.folders.items()):
+            if freed >= excess:
+                break
+            if folder not in in_use:
+                freed += state.memory() + index_size(state.text_index) + index_size(state.facet_index)
+                del self.note_cache.folders[folder]
+        return freed
+
+    def memory_check_timer(self):
+        self.enforce_memory_budget()
+        self.root.after(MEMORY_CHECK_MS, self.memory_check_timer)
+
+    def memory_stats_text(self):
+        usage = self.memory_usage()
+        total = sum(usage.values())
+        text = """
+🧠 MEMORY (estimated)
+==========================
+
+"""
+        for label, size in usage.items():
+            text += f"{label}: {format_size(size)}\n"
+        text += f"Total: {format_size(total)} of a {self.memory_budget_mb} MB budget\n"
+        text += f"Folders loaded: {len(self.note_cache.folders)}, tabs: {len(self.open_tabs)} open"
+        text += f", {len(self.placeholder_tabs)} not built yet\n" if self.placeholder_tabs else "\n"
+        return text
+
+    def catalog_stats_text(self):
+        try:
+            stats = self.catalog.stats()
+        except sqlite3.Error as e:
+            return f"\nCatalog unavailable: {e}\n"
+        coverage = stats["annotated"] / stats["entries"] * 100 if stats["entries"] else 0
+        text = f"""
+🗂 TREE CATALOG
+==========================
+
+Root: {self.catalog.root}
+Last build: {stats["built"] or "never"}
+Folders: {stats["folders"]}
+Files: {stats["files"]}
+Notes: {stats["notes"]}
+Total words: {stats["words"]}
+Annotated entries: {stats["annotated"]}/{stats["entries"]} ({coverage:.1f}%)
+
+FILES WITHOUT NOTES:
+-----------------
+"""
+        missing = self.catalog.unannotated(limit=11)
+        for folder, name in missing[:10]:
+            text += os.path.join(relative_folder(self.catalog.root, folder), name).replace(os.sep, "/") + "\n"
+        if len(missing) > 10:
+            text += "...\n"
+        return text
+
     # --- Tabs ---
     def open_selected_file(self, event=None):
-        selection = self.file_listbox.curselection()
-        if not selection: 
+        filename = self.selected_entry()
+        if filename is None: 
             return
-        index = selection[0]
-        display_name = self.file_listbox.get(index)
-        filename = self.display_to_real_name.get(display_name, display_name)
         self.select_and_open_file(filename)
 
     def select_and_open_file(self, filename):
+        """Open a note of the current folder; returns its tab key."""
+        return self.open_note(self.current_folder, filename)
+
+    def open_note(self, folder, name, view=None):
+        """Open (or select) the tab of a note of any folder; returns its key, the full path.
+
+        view is a saved (insert index, top index) pair to restore in a new tab.
+        """
+        folder = os.path.abspath(folder)
+        filename = sys.intern(os.path.join(folder, name))
         if filename in self.open_tabs:
-            tab_frame = self.open_tabs[filename]["frame"]
+            tab_frame = self.open_tabs[filename].frame
             self.notebook.select(self.notebook.index(tab_frame))
         else:
-            tab_frame = ttk.Frame(self.notebook)
+            state = self.load_folder_state(folder)
+            placeholder = self.placeholder_tabs.pop(filename, None)
+            if placeholder:
+                # Restored tab built on first use, in place
+                tab_frame = placeholder.frame
+                view = view or placeholder.view
+            else:
+                tab_frame = ttk.Frame(self.notebook)
             
             # Create custom text widget with line numbers
             text_widget = CustomText(tab_frame)
@@ -1013,58 +5561,265 @@ NOTES BY SIZE:
             else:
                 text_widget.h_scrollbar.grid_remove()
             
-            note_content = self.notes.get(filename, "")
-            text_widget.insert('end', note_content)
-            text_widget.edit_reset()
+            note_content = note_text(state.notes.get(name, ""))
+            progressive = len(note_content) > PROGRESSIVE_LOAD_SIZE
+            if not progressive:
+                text_widget.insert('end', note_content)
+                text_widget.edit_reset()
             
-            self.open_tabs[filename] = {
-                "frame": tab_frame,
-                "text_widget": text_widget,
-                "modified": False,
-                "original_content": note_content
-            }
+            self.open_tabs[filename] = TabState(
+                folder, name, tab_frame, text_widget, note_content, loading=progressive,
+                preview=self.preview_threshold_kb > 0 and utf8_size_at_least(note_content, self.preview_threshold_kb * 1024 + 1),
+                view=view
+            )
             
             text_widget.bind("<<Modified>>", lambda e, f=filename: self.on_text_modified(f))
+            text_widget.scroll_callbacks.append(lambda f=filename: self.highlight_visible(f))
             text_widget.text.bind("<Control-MouseWheel>", self.on_ctrl_mousewheel_font)
-            self.notebook.add(tab_frame, text=filename)
+            # Bound on the editor so "break" skips the Text class bindings (Ctrl+H deletes, Ctrl+T transposes)
+            text_widget.text.bind("<Control-h>", lambda e: self.show_history() or "break")
+            text_widget.text.bind("<Control-t>", lambda e: self.edit_fields() or "break")
+            if not placeholder:
+                self.notebook.add(tab_frame, text=name)
+            self.refresh_tab_titles()
             self.notebook.select(self.notebook.index(tab_frame))
-            
-            # Update word count
+
+            if self.open_tabs[filename].preview:
+                self.show_preview_bar(filename, len(note_content.encode("utf-8", "surrogatepass")))
+            if progressive:
+                self.load_tab_progressively(filename, note_content)
+            else:
+                if self.open_tabs[filename].preview:
+                    text_widget.text.config(state='disabled')
+                self.restore_tab_view(filename)
+                # Update word count
+                self.update_word_count(filename)
+        return filename
+
+    # --- Session ---
+    def session_snapshot(self):
+        """Open tabs in order with their cursor and first visible line, and the active tab."""
+        if self.saved_session is not None:
+            return self.saved_session  # Not restored yet
+        tabs = []
+        active = None
+        current_tab = self.notebook.select() if hasattr(self, 'notebook') else None
+        frames = {str(tab_data.frame): tab_data
+                  for tab_data in list(self.open_tabs.values()) + list(self.placeholder_tabs.values())}
+        for frame in (self.notebook.tabs() if hasattr(self, 'notebook') else ()):
+            tab_data = frames.get(str(frame))
+            if tab_data is None:
+                continue
+            view = tab_data.view
+            if tab_data.text_widget is not None and not tab_data.loading:
+                text = tab_data.text_widget.text
+                view = (text.index("insert"), text.index("@0,0"))
+            if str(frame) == current_tab:
+                active = len(tabs)
+            tabs.append([tab_data.folder, tab_data.name] + list(view or ("1.0", "1.0")))
+        return {"tabs": tabs, "active": active}
+
+    def restore_session(self):
+        """Reopen the tabs of the last session: the active one now, the others when selected."""
+        session, self.saved_session = self.saved_session, None
+        if not session or not session.get("tabs"):
+            return
+        tabs = [tab for tab in session["tabs"] if len(tab) == 4 and os.path.isdir(tab[0])]
+        active = session.get("active")
+        active_tab = session["tabs"][active] if isinstance(active, int) and active < len(session["tabs"]) else None
+        if active_tab not in tabs:
+            active_tab = tabs[0] if tabs else None
+        if active_tab is None:
+            return
+        try:
+            active_key = self.open_note(active_tab[0], active_tab[1], (active_tab[2], active_tab[3]))
+        except Exception as e:
+            print(f"Session restore error: {e}")
+            return
+        position = 0
+        for folder, name, insert, top in tabs:
+            key = os.path.join(os.path.abspath(folder), name)
+            if key in self.placeholder_tabs or (key in self.open_tabs and key != active_key):
+                continue
+            if key != active_key:
+                # The active tab was added first: the tabs before it are inserted in front
+                frame = ttk.Frame(self.notebook)
+                self.placeholder_tabs[key] = TabState(os.path.abspath(folder), name, frame, view=(insert, top))
+                if position < len(self.notebook.tabs()):
+                    self.notebook.insert(position, frame, text=name)
+                else:
+                    self.notebook.add(frame, text=name)
+            position += 1
+        self.refresh_tab_titles()
+
+    def restore_tab_view(self, filename):
+        """Put back the cursor and scroll position saved with the session, once the text is in."""
+        tab_data = self.open_tabs[filename]
+        view, tab_data.view = tab_data.view, None
+        if not view:
+            return
+        text = tab_data.text_widget.text
+        try:
+            text.mark_set("insert", view[0])
+            text.yview(view[1])
+        except tk.TclError:
+            pass
+
+    # --- Large notes ---
+    def load_tab_progressively(self, filename, content):
+        """Insert a large note in chunks across idle callbacks, the visible region first.
+
+        The tab stays read-only and is skipped by saves until the whole note is in.
+        """
+        tab_data = self.open_tabs[filename]
+        text_widget = tab_data.text_widget
+        first_end = 0
+        for _ in range(LOAD_FIRST_LINES):
+            next_line = content.find("\n", first_end)
+            if next_line < 0 or next_line >= LOAD_CHUNK_SIZE:
+                break
+            first_end = next_line + 1
+        first_end = first_end or min(len(content), LOAD_CHUNK_SIZE)
+
+        def insert_chunk(start, end):
+            if self.open_tabs.get(filename) is not tab_data or not tab_data.loading:
+                return  # Tab closed or content replaced while loading
+            text_widget.text.config(state='normal')
+            text_widget.text.insert('end', content[start:end])
+            if end < len(content):
+                text_widget.text.config(state='disabled')
+                self.root.after(1, insert_chunk, end, min(len(content), end + LOAD_CHUNK_SIZE))
+                self.word_count_label.config(text=f"Loading... {end * 100 // len(content)}%")
+                return
+            # Loading is not an undoable edit nor a modification
+            text_widget.edit_reset()
+            text_widget.edit_modified(False)
+            tab_data.loading = False
+            if tab_data.preview:
+                text_widget.text.config(state='disabled')
+            text_widget.line_numbers.redraw()
+            self.update_tab_title(filename)
             self.update_word_count(filename)
+            self.restore_tab_view(filename)
+            if tab_data.highlight and tab_data.highlight["spans"]:
+                self.jump_to_first_match(filename)
+
+        text_widget.text.config(state='disabled')
+        self.update_tab_title(filename)
+        insert_chunk(0, first_end)
+
+    def show_preview_bar(self, filename, size):
+        """Show the read-only banner of a large note of size bytes, with a button to start editing."""
+        tab_data = self.open_tabs[filename]
+        bar = ttk.Frame(tab_data.frame, padding=(5, 2))
+        size_kb = size // 1024
+        ttk.Label(bar, text=f"Read-only preview of a large note ({size_kb} KB)").pack(side=LEFT)
+        ttk.Button(
+            bar, text="Edit", bootstyle="warning-outline",
+            command=lambda: self.enable_editing(filename)
+        ).pack(side=RIGHT)
+        bar.pack(fill=X, before=tab_data.text_widget)
+        tab_data.preview_bar = bar
+
+    def enable_editing(self, filename):
+        tab_data = self.open_tabs.get(filename)
+        if not tab_data:
+            return
+        tab_data.preview = False
+        if not tab_data.loading:
+            tab_data.text_widget.text.config(state='normal')
+        tab_data.preview_bar.destroy()
+        tab_data.preview_bar = None
+        self.update_tab_title(filename)
+
+    def replace_tab_text(self, filename, text):
+        """Replace the whole text of an open tab as one undoable edit."""
+        tab_data = self.open_tabs[filename]
+        tab_data.loading = False  # Stops a progressive load in progress
+        if tab_data.preview:
+            self.enable_editing(filename)
+        text_widget = tab_data.text_widget
+        text_widget.text.config(state='normal', autoseparators=False)
+        text_widget.text.edit_separator()
+        text_widget.delete("1.0", 'end')
+        text_widget.insert("1.0", text)
+        text_widget.text.edit_separator()
+        text_widget.text.config(autoseparators=True)
+        self.on_text_modified(filename)
+
+    def schedule_word_count(self, filename):
+        """Recount words once typing pauses, instead of splitting the note on every key."""
+        if self.word_count_job:
+            self.root.after_cancel(self.word_count_job)
+        self.word_count_job = self.root.after(WORD_COUNT_DELAY_MS, self.update_word_count, filename)
 
     def on_text_modified(self, filename):
         tab_data = self.open_tabs.get(filename)
         if tab_data:
-            text_widget = tab_data["text_widget"]
-            current_content = text_widget.get("1.0", 'end').strip()
-            if current_content != tab_data["original_content"] and not tab_data["modified"]:
-                tab_data["modified"] = True
-                self.update_tab_title(filename)
+            text_widget = tab_data.text_widget
+            if tab_data.loading:
+                text_widget.edit_modified(False)
+                return
+            # Once modified, the whole note no longer needs to be compared on each key
+            if not tab_data.modified:
+                current_content = text_widget.get("1.0", 'end').strip()
+                if tab_data.differs(current_content):
+                    tab_data.modified = True
+                    self.update_tab_title(filename)
             text_widget.edit_modified(False)
+            if tab_data.modified:
+                self.schedule_journal(filename)
+                # Offsets of the matches not tagged yet are no longer valid
+                tab_data.highlight = None
             
             # Update word count
-            self.update_word_count(filename)
+            self.schedule_word_count(filename)
 
     def update_tab_title(self, filename):
         tab_data = self.open_tabs.get(filename)
         if tab_data:
-            tab_frame = tab_data["frame"]
+            tab_frame = tab_data.frame
             tab_id = self.notebook.index(tab_frame)
-            title = filename + (" *" if tab_data["modified"] else "")
+            title = self.tab_label(filename) + (" *" if tab_data.modified else "")
+            if tab_data.loading:
+                title += " (loading)"
+            elif tab_data.preview:
+                title += " (preview)"
             self.notebook.tab(tab_id, text=title)
 
+    def tab_label(self, filename):
+        """Note name, with its folder when it is not the current one or the name is open twice."""
+        tab_data = self.open_tabs.get(filename) or self.placeholder_tabs[filename]
+        name = tab_data.name
+        duplicate = any(other.name == name for key, other in
+                        list(self.open_tabs.items()) + list(self.placeholder_tabs.items()) if key != filename)
+        if duplicate or tab_data.folder != os.path.abspath(self.current_folder):
+            return f"{name} — {os.path.basename(tab_data.folder) or tab_data.folder}"
+        return name
+
+    def refresh_tab_titles(self):
+        for filename in self.open_tabs:
+            self.update_tab_title(filename)
+        for filename, tab_data in self.placeholder_tabs.items():
+            self.notebook.tab(self.notebook.index(tab_data.frame), text=self.tab_label(filename))
+
     def on_tab_changed(self, event):
-        # Update word count for current tab
         current_tab = self.notebook.select()
+        for tab_data in self.placeholder_tabs.values():
+            if str(tab_data.frame) == current_tab:
+                self.open_note(tab_data.folder, tab_data.name)
+                return
+        # Update word count for current tab
         for filename, tab_data in self.open_tabs.items():
-            if str(tab_data["frame"]) == current_tab:
+            if str(tab_data.frame) == current_tab:
                 self.update_word_count(filename)
                 break
 
     def update_word_count(self, filename):
+        self.word_count_job = None
         tab_data = self.open_tabs.get(filename)
-        if tab_data:
-            content = tab_data["text_widget"].get("1.0", 'end').strip()
+        if tab_data and not tab_data.loading:
+            content = tab_data.text_widget.get("1.0", 'end').strip()
             words = len(content.split()) if content else 0
             chars = len(content)
             self.word_count_label.config(text=f"Words: {words} | Characters: {chars}")
@@ -1080,11 +5835,18 @@ NOTES BY SIZE:
         tab_frame = self.notebook.nametowidget(self.notebook.tabs()[tab_id])
         filename = None
         for fname, tab_data in self.open_tabs.items():
-            if tab_data["frame"] == tab_frame:
+            if tab_data.frame == tab_frame:
                 filename = fname
                 break
+        for fname, tab_data in list(self.placeholder_tabs.items()):
+            if tab_data.frame == tab_frame:
+                del self.placeholder_tabs[fname]
+                self.notebook.forget(tab_id)
+                tab_frame.destroy()
+                self.refresh_tab_titles()
+                return True
         if filename:
-            if self.open_tabs[filename]["modified"]:
+            if self.open_tabs[filename].modified:
                 response = messagebox.askyesnocancel(
                     "Close Tab",
                     f"The file '{filename}' has unsaved changes. Save?"
@@ -1095,11 +5857,12 @@ NOTES BY SIZE:
                     self.save_tab_content(filename)
             self.notebook.forget(tab_id)
             del self.open_tabs[filename]
+            self.refresh_tab_titles()
             # Update word count for new current tab
             current_tab = self.notebook.select()
             if current_tab:
                 for fname, tab_data in self.open_tabs.items():
-                    if str(tab_data["frame"]) == current_tab:
+                    if str(tab_data.frame) == current_tab:
                         self.update_word_count(fname)
                         break
             else:
@@ -1109,30 +5872,105 @@ NOTES BY SIZE:
 
     def save_tab_content(self, filename):
         tab_data = self.open_tabs.get(filename)
-        if tab_data:
-            text_widget = tab_data["text_widget"]
-            self.notes[filename] = text_widget.get("1.0", 'end').strip()
-            tab_data["original_content"] = self.notes[filename]
-            tab_data["modified"] = False
+        if tab_data and not tab_data.loading:
+            text_widget = tab_data.text_widget
+            name = tab_data.name
+            state = self.load_folder_state(tab_data.folder)
+            previous = note_text(state.notes.get(name, ""))
+            self.set_note(name, text_widget.get("1.0", 'end').strip(), state)
+            saved = note_text(state.notes[name])
+            tab_data.mark_saved(saved)
+            if saved != previous:
+                try:
+                    state.history.record(name, saved, previous)
+                except OSError as e:
+                    print(f"History write error: {e}")
+            tab_data.modified = False
             self.update_tab_title(filename)
-            self.save_notes_all()
-            self.status_label.config(text=f"Note saved: {filename}")
+            self.write_folder_notes(state)
+            if state is self.folder_state:
+                self.refresh_entry_row(name)
+            self.journal_saved(filename)
+            self.status_label.config(text=f"Note saved: {name}")
+
+    # --- Version history ---
+    def current_tab_filename(self):
+        current_tab = self.notebook.select()
+        for filename, tab_data in self.open_tabs.items():
+            if str(tab_data.frame) == current_tab:
+                return filename
+        return None
+
+    def show_history(self):
+        """Browse the saved revisions of the current tab and restore one."""
+        filename = self.current_tab_filename()
+        if filename is None:
+            messagebox.showinfo("History", "Open a note to see its history.")
+            return
+        name = self.open_tabs[filename].name
+        history = self.load_folder_state(self.open_tabs[filename].folder).history
+        revisions = history.revisions(name)
+        if not revisions:
+            messagebox.showinfo("History", f"No saved revisions for '{name}' yet.")
+            return
+
+        dialog = ttk.Toplevel(self.root)
+        dialog.title(f"History - {name}")
+        dialog.geometry("800x500")
+
+        revision_list = tk.Listbox(dialog, width=28, exportselection=0, font=("Segoe UI", 10))
+        revision_list.pack(side=LEFT, fill=Y, padx=5, pady=5)
+        for revision, timestamp, _ in reversed(revisions):
+            revision_list.insert('end', f"#{revision}  {timestamp.replace('T', ' ')}")
+
+        right = ttk.Frame(dialog)
+        right.pack(side=LEFT, fill=BOTH, expand=True, padx=5, pady=5)
+        preview = tk.Text(right, wrap='word', font=(self.font_family, self.font_size), state='disabled')
+        preview.pack(fill=BOTH, expand=True)
+
+        def selected_revision():
+            selection = revision_list.curselection()
+            return revisions[len(revisions) - 1 - selection[0]][0] if selection else None
+
+        def on_select(event=None):
+            revision = selected_revision()
+            if revision is None:
+                return
+            preview.config(state='normal')
+            preview.delete("1.0", 'end')
+            preview.insert("1.0", history.text_at(name, revision) or "")
+            preview.config(state='disabled')
+
+        def restore():
+            revision = selected_revision()
+            tab_data = self.open_tabs.get(filename)
+            if revision is None or tab_data is None:
+                return
+            # A single undoable edit, so the restore itself can be undone
+            self.replace_tab_text(filename, history.text_at(name, revision) or "")
+            self.status_label.config(text=f"Restored revision #{revision} of {name} (not saved yet)")
+            dialog.destroy()
+
+        revision_list.bind("<<ListboxSelect>>", on_select)
+        ttk.Button(right, text="Restore this revision", bootstyle="primary", command=restore).pack(anchor="e", pady=(5, 0))
+        revision_list.selection_set(0)
+        on_select()
 
     # --- Shortcuts ---
     def ctrl_s(self, event=None):
         current_tab = self.notebook.select()
         for filename, tab_data in self.open_tabs.items():
-            if str(tab_data["frame"]) == current_tab:
+            if str(tab_data.frame) == current_tab:
                 self.save_tab_content(filename)
                 return "break"  # Prevent default behavior
 
     def ctrl_z(self, event=None):
         current_tab = self.notebook.select()
         for filename, tab_data in self.open_tabs.items():
-            if str(tab_data["frame"]) == current_tab:
+            if str(tab_data.frame) == current_tab:
                 try: 
-                    tab_data["text_widget"].edit_undo()
-                    tab_data["modified"] = tab_data["text_widget"].get("1.0", 'end').strip() != tab_data["original_content"]
+                    tab_data.text_widget.edit_undo()
+                    tab_data.modified = tab_data.differs(tab_data.text_widget.get("1.0", 'end').strip())
                     self.update_tab_title(filename)
                     self.update_word_count(filename)
                 except: pass
@@ -1141,10 +5979,10 @@ NOTES BY SIZE:
     def ctrl_y(self, event=None):
         current_tab = self.notebook.select()
         for filename, tab_data in self.open_tabs.items():
-            if str(tab_data["frame"]) == current_tab:
+            if str(tab_data.frame) == current_tab:
                 try: 
-                    tab_data["text_widget"].edit_redo()
-                    tab_data["modified"] = tab_data["text_widget"].get("1.0", 'end').strip() != tab_data["original_content"]
+                    tab_data.text_widget.edit_redo()
+                    tab_data.modified = tab_data.differs(tab_data.text_widget.get("1.0", 'end').strip())
                     self.update_tab_title(filename)
                     self.update_word_count(filename)
                 except: pass
@@ -1168,8 +6006,40 @@ NOTES BY SIZE:
         return "break"  # Prevent text scrolling
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Checksum process pool in frozen builds
+    parser = argparse.ArgumentParser(description="MetaNotes")
+    parser.add_argument("roots", nargs="*", help="folders served with --serve (default: the current folder)")
+    parser.add_argument("--serve", action="store_true", help="expose the notes on a local JSON-RPC socket")
+    parser.add_argument("--port", type=int, default=RPC_DEFAULT_PORT, help="port of the RPC server")
+    parser.add_argument("--headless", action="store_true", help="serve without opening the window")
+    parser.add_argument("--sync", nargs=2, metavar=("TREE", "COPY"), help="merge the notes of two copies of a tree")
+    parser.add_argument("--export", nargs=2, metavar=("TREE", "OUT"), help="export the notes of a tree as a static site")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="html", help="format of --export")
+    parser.add_argument("--ingest", metavar="TREE", help="merge sidecar files (.txt, .url, .xmp...) into notes")
+    parser.add_argument("--patterns", help="comma-separated sidecar patterns of --ingest")
+    parser.add_argument("--dry-run", action="store_true", help="report what --ingest would merge")
+    args = parser.parse_args()
+    if args.ingest:
+        patterns = [pattern.strip() for pattern in args.patterns.split(",")] if args.patterns else None
+        print(format_ingest_report(args.ingest, ingest_tree(args.ingest, patterns, args.dry_run), args.dry_run))
+        sys.exit()
+    if args.export:
+        report = export_tree(*args.export, fmt=args.format)
+        print(f"Exported {report['notes']} notes from {report['folders']} folders "
+              f"({report['written']} pages written, {report['removed']} removed)")
+        sys.exit()
+    if args.sync:
+        print(format_sync_report(*args.sync, sync_trees(*args.sync)))
+        sys.exit()
+    if args.headless:
+        if not args.roots:
+            parser.error("--headless needs at least one folder to serve")
+        serve(args.roots, args.port)
+        sys.exit()
     root = ttk.Window(title="MetaNotes", themename="superhero")
     app = MetaNotesApp(root)
+    if args.serve:
+        app.start_server(args.port, args.roots)
     root.geometry("1200x700")
     root.minsize(800, 500)
     root.mainloop()
\ No newline at end of file